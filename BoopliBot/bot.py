@@ -3,13 +3,22 @@ Module contains the main classes for BoopliBot
 """
 
 import sys
+import datetime
 import asyncio
 import logging
 import weakref
+import time
 import re
+import functools
+from collections.abc import (
+    Callable,
+    Coroutine
+)
 from typing import (
     Optional,
-    Set
+    Set,
+    Tuple,
+    Dict
 )
 
 
@@ -22,10 +31,17 @@ import BoopliBot
 from .converters import MemberOrUserConverter
 from .consts import FOLDER_MODULES, FOLDER_BOOPLIBOT
 from . import errors
-from .helpers import PartialAuditLogEntry, NestedDictWrapper
+from .helpers import (
+    NestedDictWrapper,
+    MessageStore,
+    AuthorMessageIndex
+)
 from .utils import (
     config_utils,
     sql_utils,
+    health_utils,
+    stats_utils,
+    metrics_utils,
     retrieve_modules,
     get_audit_log_for_action
 )
@@ -63,6 +79,34 @@ class Bot(commands.AutoShardedBot):
         replied_user=False
     )
 
+    # Config settings that are used by the bot itself and must not be passed to the client
+    BOT_ONLY_SETTINGS = (
+        "log_queue_size",
+        "log_queue_policy",
+        "message_store_budget",
+        "message_store_total_budget",
+        "health_sample_interval",
+        "health_sources",
+        "loop_lag_threshold",
+        "loop_debug",
+        "metrics_port",
+        "metrics_host",
+        "sql_profiling",
+        "event_summary_interval",
+        "log_format",
+        "log_buffer_size",
+        "log_flush_interval"
+    )
+    # Per guild, in bytes
+    DEF_MESSAGE_STORE_BUDGET = 256 * 1024
+    # For all guilds, in bytes
+    DEF_MESSAGE_STORE_TOTAL_BUDGET = 64 * 1024 * 1024
+    DEF_AUTHOR_INDEX_CAP = 1000
+    # For how long we ignore gateway events for members targeted by mass actions
+    MASS_ACTION_SUPPRESS_TIME = 60.0
+    # How often we log the event handlers summary, in seconds
+    DEF_EVENT_SUMMARY_INTERVAL = 600.0
+
     # We can use 64-113 and 0
     EXIT_CODE_QUIT = 0
     EXIT_CODE_CRASH = 1
@@ -96,6 +140,8 @@ class Bot(commands.AutoShardedBot):
             activity = discord.Game(name=activity_text)
         else:
             activity = Bot.DEF_ACTIVITY
+        for setting in Bot.BOT_ONLY_SETTINGS:
+            kwargs.pop(setting, None)
 
         super().__init__(
             command_prefix=Bot.__get_prefixes,
@@ -107,6 +153,48 @@ class Bot(commands.AutoShardedBot):
 
         self.guilds_configs = NestedDictWrapper(nesting_depth=1)
         self.custom_commands = NestedDictWrapper(nesting_depth=1)
+        # Filled by the Logger cog, only for guilds that log messages
+        self.message_store = MessageStore(
+            config.message_store_budget or Bot.DEF_MESSAGE_STORE_BUDGET,
+            config.message_store_total_budget or Bot.DEF_MESSAGE_STORE_TOTAL_BUDGET
+        )
+        # We see every message from now on
+        self.author_index = AuthorMessageIndex(
+            Bot.DEF_AUTHOR_INDEX_CAP,
+            discord.utils.time_snowflake(discord.utils.utcnow())
+        )
+
+        health_sources = config.health_sources
+        self.health_sampler = health_utils.HealthSampler(
+            config.health_sample_interval or health_utils.DEF_INTERVAL,
+            health_utils.SOURCES if health_sources is None else health_sources
+        )
+        self.loop_monitor = health_utils.LoopLagMonitor(
+            threshold=config.loop_lag_threshold or health_utils.DEF_LAG_THRESHOLD
+        )
+
+        self.event_stats = stats_utils.EventStats()
+        self.command_stats = stats_utils.CommandStats()
+        self.rate_limit_counter = stats_utils.RateLimitCounter()
+        logging.getLogger("discord.http").addFilter(self.rate_limit_counter)
+        self.http.request = stats_utils.wrap_http_request(self.http.request)
+        if sql_utils.async_engine is not None:
+            stats_utils.attach_sql_hooks(sql_utils.async_engine.sync_engine)
+        if config.sql_profiling:
+            sql_utils.enable_query_profiling()
+
+        if config.metrics_port:
+            self.metrics_server = metrics_utils.MetricsServer(
+                self,
+                config.metrics_port,
+                config.metrics_host or metrics_utils.DEF_HOST
+            )
+
+        else:
+            self.metrics_server = None
+
+        # Map (guild id, user id) -> monotonic time until which we ignore member events for this user
+        self._suppressed_members: Dict[Tuple[int, int], float] = dict()
 
         self.exit_code = Bot.EXIT_CODE_CRASH
         self.cache_ready_lock = asyncio.Event()
@@ -116,6 +204,17 @@ class Bot(commands.AutoShardedBot):
         self.load_modules()
 
         self.logger = logging.getLogger(f"{__name__}.{type(self).__name__}")
+
+        event_summary_interval = config.event_summary_interval
+        if event_summary_interval is None:
+            event_summary_interval = Bot.DEF_EVENT_SUMMARY_INTERVAL
+        # 0 disables the summary
+        self.event_summary_logger = (
+            stats_utils.EventSummaryLogger(self.event_stats, event_summary_interval, self.logger)
+            if event_summary_interval
+            else None
+        )
+
         self.logger.info("Inited BoopliBot.")
 
     def __repr__(self) -> str:
@@ -164,17 +263,73 @@ class Bot(commands.AutoShardedBot):
         """
         prefixes = {bot.user.mention, f"<@!{bot.user.id}>"}
 
-        guild = msg.guild
+        # NOTE: For DMs and guilds we've just joined this is the def prefix
+        prefixes.add(bot.__get_guild_prefix(msg.guild))
+
+        return prefixes
+
+    def __get_guild_prefix(self, guild: Optional[discord.Guild]) -> str:
+        """
+        Returns the prefix for the guild without creating config wrappers for unknown guilds
+
+        IN:
+            guild - the guild or None for DMs
+
+        OUT:
+            the prefix
+        """
         if guild is not None:
-            # NOTE: This may be None in the moment we join the guild
-            guild_prefix = bot.guilds_configs[guild.id].prefix or bot.def_prefix
-            prefixes.add(guild_prefix)
+            guild_config = self.guilds_configs.get(guild.id)
+            if guild_config is not None:
+                prefix = guild_config.prefix
+                if prefix:
+                    return prefix
 
-        else:
-            # For DMs add def prefix
-            prefixes.add(bot.def_prefix)
+        return self.def_prefix
 
-        return prefixes
+    def suppress_member_events(self, guild_id: int, user_id: int) -> None:
+        """
+        Makes the bot ignore ban/kick/leave events for a user for a while,
+        used by mass actions which do the db updates and logging in bulk themselves
+
+        IN:
+            guild_id - the guild id
+            user_id - the user id
+        """
+        now = time.monotonic()
+        suppressed = self._suppressed_members
+        # Clean up once in a while
+        if len(suppressed) > 1000:
+            for key, expires_at in tuple(suppressed.items()):
+                if expires_at <= now:
+                    del suppressed[key]
+
+        suppressed[(guild_id, user_id)] = now + Bot.MASS_ACTION_SUPPRESS_TIME
+
+    def unsuppress_member_events(self, guild_id: int, user_id: int) -> None:
+        """
+        Makes the bot handle ban/kick/leave events for a user again,
+        used when a mass action failed to act on the user
+
+        IN:
+            guild_id - the guild id
+            user_id - the user id
+        """
+        self._suppressed_members.pop((guild_id, user_id), None)
+
+    def is_member_event_suppressed(self, guild_id: int, user_id: int) -> bool:
+        """
+        Checks if we should ignore ban/kick/leave events for a user
+
+        IN:
+            guild_id - the guild id
+            user_id - the user id
+
+        OUT:
+            boolean
+        """
+        expires_at = self._suppressed_members.get((guild_id, user_id), None)
+        return expires_at is not None and expires_at > time.monotonic()
 
     async def validate_db(self) -> None:
         """
@@ -258,6 +413,7 @@ class Bot(commands.AutoShardedBot):
                     nesting_depth=0
                 )
             del stmt, results
+            self.dispatch("guild_config_update", None)
 
             # Now load custom commands
             # results = (
@@ -302,6 +458,31 @@ class Bot(commands.AutoShardedBot):
         # Now we're listening to commands
         self.cache_ready_lock.set()
 
+        self.health_sampler.start()
+        self.loop_monitor.start(debug=bool(self.config.loop_debug))
+        if self.event_summary_logger is not None:
+            self.event_summary_logger.start()
+
+        if self.metrics_server is not None and not self.metrics_server.is_running():
+            try:
+                await self.metrics_server.start()
+
+            except OSError as e:
+                self.logger.error(f"Failed to start the metrics server: {e}")
+
+    async def close(self) -> None:
+        """
+        Closes the connection to Discord and stops background jobs
+        """
+        self.health_sampler.stop()
+        self.loop_monitor.stop()
+        if self.event_summary_logger is not None:
+            self.event_summary_logger.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        logging.getLogger("discord.http").removeFilter(self.rate_limit_counter)
+        await super().close()
+
     async def process_commands(self, message: discord.Message):
         """
         Processes commands only after our cache is ready
@@ -312,6 +493,49 @@ class Bot(commands.AutoShardedBot):
         await self.cache_ready_lock.wait()
         await super().process_commands(message)
 
+    def dispatch(self, event_name: str, /, *args, **kwargs) -> None:
+        """
+        Dispatches an event and counts it
+
+        IN:
+            event_name - the event name without the 'on_' prefix
+            args - the event args
+            kwargs - the event kwargs
+        """
+        self.event_stats.add(event_name)
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def _run_event(self, coro: Callable[..., Coroutine], event_name: str, *args, **kwargs) -> None:
+        """
+        Runs an event handler measuring the time it takes
+
+        IN:
+            coro - the handler
+            event_name - the handler name (e.g. 'on_message')
+            args - the event args
+            kwargs - the event kwargs
+        """
+        await super()._run_event(
+            functools.partial(self.event_stats.run_handler, coro, event_name),
+            event_name,
+            *args,
+            **kwargs
+        )
+
+    async def invoke(self, ctx: commands.Context) -> None:
+        """
+        Invokes the command from the context and records its latency
+
+        IN:
+            ctx - the command context
+        """
+        if ctx.command is None:
+            await super().invoke(ctx)
+            return
+
+        with self.command_stats.measure(ctx.command.qualified_name):
+            await super().invoke(ctx)
+
     async def on_message(self, message: discord.Message) -> None:
         """
         New message callback
@@ -319,6 +543,10 @@ class Bot(commands.AutoShardedBot):
         IN:
             message - message object
         """
+        guild = message.guild
+        if guild is not None:
+            self.author_index.add(guild.id, message.author.id, message.channel.id, message.id)
+
         await super().on_message(message)
 
     async def on_message_edit(self, before: discord.Message, after: discord.Message) -> None:
@@ -329,9 +557,20 @@ class Bot(commands.AutoShardedBot):
             before - message object before edit
             after - message object after edit
         """
+        # Most edits are embeds unfurling or regular chat, those can't be commands
+        content = after.content
+        if content == before.content or after.author.bot:
+            return
+
+        if not content.startswith(self.__get_guild_prefix(after.guild)):
+            # The bot mention is a valid prefix too
+            if not content.startswith("<@"):
+                return
+            bot_id = self.user.id
+            if not content.startswith((f"<@{bot_id}>", f"<@!{bot_id}>")):
+                return
+
         # We ignore msgs pins and attachments changes
-        # I did it this way, so even if actual content wasn't changed,
-        # we still reinvoke the command
         if (
             before.pinned != after.pinned
             or before.attachments != after.attachments
@@ -343,6 +582,115 @@ class Bot(commands.AutoShardedBot):
 
         await self.process_commands(after)
 
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent) -> None:
+        """
+        Raw message edit callback, updates our message store
+        Dispatches the cached_message_edit event for the messages we know about
+
+        IN:
+            payload - the raw event payload
+        """
+        if payload.guild_id is None:
+            return
+
+        data = payload.data
+        attachments = data.get("attachments", None)
+        if attachments is not None:
+            attachments = tuple(a["proxy_url"] for a in attachments)
+        edited_at = data.get("edited_timestamp", None)
+        if edited_at:
+            edited_at = datetime.datetime.fromisoformat(edited_at).timestamp()
+
+        before = self.message_store.update(
+            payload.guild_id,
+            payload.message_id,
+            data.get("content", None),
+            attachments,
+            edited_at or None
+        )
+        if before is not None:
+            after = self.message_store.get(payload.guild_id, payload.message_id)
+            self.dispatch("cached_message_edit", payload, before, after)
+
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        """
+        Raw message delete callback, updates our message store
+        Dispatches the cached_message_delete event for the messages we know about
+
+        IN:
+            payload - the raw event payload
+        """
+        if payload.guild_id is None:
+            return
+
+        self.author_index.remove_message(payload.guild_id, payload.message_id)
+        message = self.message_store.pop(payload.guild_id, payload.message_id)
+        if message is not None:
+            self.dispatch("cached_message_delete", payload, message)
+
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        """
+        Raw bulk message delete callback, updates our message store
+        Dispatches the cached_bulk_message_delete event with the messages we know about
+        NOTE: always dispatched, the list may be empty
+
+        IN:
+            payload - the raw event payload
+        """
+        if payload.guild_id is None:
+            return
+
+        guild_id = payload.guild_id
+        message_store = self.message_store
+        author_index = self.author_index
+        messages = list()
+        for message_id in payload.message_ids:
+            author_index.remove_message(guild_id, message_id)
+            message = message_store.pop(guild_id, message_id)
+            if message is not None:
+                messages.append(message)
+
+        self.dispatch("cached_bulk_message_delete", payload, messages)
+
+    async def on_shard_connect(self, shard_id: int) -> None:
+        """
+        Callback when a shard connects (IDENTIFY), including reconnects with a new session
+
+        IN:
+            shard_id - the shard id
+        """
+        # We could miss messages while we were disconnected
+        self.author_index.reset_coverage(discord.utils.time_snowflake(discord.utils.utcnow()))
+
+    async def on_shard_resumed(self, shard_id: int) -> None:
+        """
+        Callback when a shard resumes its session
+
+        IN:
+            shard_id - the shard id
+        """
+        # Discord replays the missed events, but we can't rely on getting all of them
+        self.author_index.reset_coverage(discord.utils.time_snowflake(discord.utils.utcnow()))
+
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        Callback on channel deletion
+
+        IN:
+            channel - the deleted channel
+        """
+        self.message_store.remove_channel(channel.guild.id, channel.id)
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """
+        Callback when the bot leaves/gets kicked from a guild
+
+        IN:
+            guild - the guild
+        """
+        self.message_store.remove_guild(guild.id)
+        self.author_index.remove_guild(guild.id)
+
     async def on_guild_join(self, guild: discord.Guild) -> None:
         """
         Callback when the bot joins/creates a guild
@@ -352,6 +700,8 @@ class Bot(commands.AutoShardedBot):
         """
         guild_id = guild.id
         prefix = self.def_prefix
+        # We haven't seen messages sent before we joined
+        self.author_index.track_guild(guild_id, discord.utils.time_snowflake(discord.utils.utcnow()))
 
         async with sql_utils.NewAsyncSession() as sesh:
             sesh: sql_utils.AsyncSession
@@ -369,6 +719,7 @@ class Bot(commands.AutoShardedBot):
                 sql_utils.to_dict(guild_config),
                 nesting_depth=0
             )
+        self.dispatch("guild_config_update", guild_id)
 
     async def on_member_remove(self, member: discord.Member) -> None:
         """
@@ -381,6 +732,9 @@ class Bot(commands.AutoShardedBot):
             member - the member who left the guild
         """
         guild: discord.Guild = member.guild
+        # This was a mass action
+        if self.is_member_event_suppressed(guild.id, member.id):
+            return
 
         # Check for custom kick event
         entry = await get_audit_log_for_action(guild, discord.AuditLogAction.kick, member)
@@ -398,53 +752,6 @@ class Bot(commands.AutoShardedBot):
 
     ### HANDLERS FOR DB UPDATES
 
-    async def on_member_warn(self, guild: discord.Guild, member: MemberOrUserConverter, log_entry: PartialAuditLogEntry) -> None:
-        """
-        Callback on user warn
-        NOTE: custom event
-
-        IN:
-            guild - Guild object
-            member - either User or Member object
-        """
-        # Update db
-        guild_id = guild.id
-        user_id = member.id
-        async with sql_utils.NewAsyncSession() as sesh:
-            sesh: sql_utils.AsyncSession
-
-            user_data: Optional[sql_utils.User] = await sesh.get(sql_utils.User, (guild_id, user_id))
-
-            if user_data is not None:
-                user_data.current_warns += 1
-                user_data.total_warns += 1
-
-            else:
-                user_data = sql_utils.User(guild_id=guild_id, user_id=user_id, current_warns=1, total_warns=1)
-                sesh.add(user_data)
-
-            await sesh.commit()
-
-    async def on_member_unwarn(self, guild: discord.Guild, member: MemberOrUserConverter, log_entry: PartialAuditLogEntry) -> None:
-        """
-        Callback on user unwarn
-        NOTE: custom event
-
-        IN:
-            guild - Guild object
-            member - either User or Member object
-        """
-        guild_id = guild.id
-        user_id = member.id
-        async with sql_utils.NewAsyncSession() as sesh:
-            sesh: sql_utils.AsyncSession
-
-            user_data: Optional[sql_utils.User] = await sesh.get(sql_utils.User, (guild_id, user_id))
-
-            if user_data is not None and user_data.current_warns > 0:
-                user_data.current_warns -= 1
-                await sesh.commit()
-
     async def on_member_kick(self, guild: discord.Guild, member: MemberOrUserConverter, log_entry: Optional[discord.AuditLogEntry] = None) -> None:
         """
         Callback on user kick
@@ -479,6 +786,10 @@ class Bot(commands.AutoShardedBot):
             guild - Guild object
             member - either User or Member object
         """
+        # Mass bans update the db and log in bulk
+        if self.is_member_event_suppressed(guild.id, member.id):
+            return
+
         log_entry = await get_audit_log_for_action(guild, discord.AuditLogAction.ban, member)
 
         # Update db
@@ -538,6 +849,9 @@ class Bot(commands.AutoShardedBot):
             context - the command context object
             exc - the exception
         """
+        if context.command is not None:
+            self.command_stats.add_error(context.command.qualified_name, exc)
+
         if self.extra_events.get("on_command_error", None):
             return
 
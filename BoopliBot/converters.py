@@ -4,6 +4,7 @@ Module contains argument converters.
 
 import re
 from typing import (
+    Optional,
     Union,
     Any
 )
@@ -82,3 +83,35 @@ class LocalEmojiConverter(commands.EmojiConverter):
             raise commands.EmojiNotFound(argument)
 
         return result
+
+class MemberOrObjectConverter(commands.IDConverter):
+    """
+    Cheap converter for mass actions: accepts only mentions and ids,
+    returns the cached member or a bare discord.Object, never makes requests
+    """
+    async def convert(self, ctx: commands.Context, argument: Any) -> Union[discord.Member, discord.Object]:
+        """
+        Tries to conver the given argument into a Member or Object
+
+        IN:
+            ctx - command context object
+            argument - the arg to convert
+
+        OUT:
+            discord.Member OR discord.Object (in this order)
+        """
+        match = self._get_id_match(argument) or re.match(r'<@!?([0-9]{15,20})>$', argument)
+        if match is None:
+            raise errors.MemberOrUserNotFound(argument)
+
+        user_id = int(match.group(1))
+        member = ctx.guild.get_member(user_id) if ctx.guild is not None else None
+        return member if member is not None else discord.Object(id=user_id)
+
+class MassActionFlags(commands.FlagConverter, prefix="--", delimiter=" "):
+    """
+    Flags for mass moderation commands
+    """
+    reason: Optional[str] = None
+    # Mass actions don't DM by default, this is slow and we likely target bots anyway
+    dm: bool = False
@@ -2,9 +2,17 @@
 This modules contains constants extra classes.
 """
 
+import sys
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
 # from collections import namedtuple
+from collections import deque, OrderedDict
 from collections.abc import (
+    Awaitable,
+    Callable,
     Hashable,
+    Iterable,
     Iterator,
     KeysView,
     ValuesView,
@@ -14,7 +22,12 @@ from typing import (
     Any,
     Optional,
     Union,
-    NamedTuple
+    NamedTuple,
+    Tuple,
+    List,
+    Dict,
+    Set,
+    Deque
 )
 
 
@@ -240,3 +253,1196 @@ class NestedDictWrapper():
         Implementation of the dict clear method
         """
         return self.__data.clear()
+
+
+class LogEventQueue():
+    """
+    A bounded queue of pending log events with priorities.
+    Priority 0 is the highest, items with higher priorities are always retrieved first.
+    When the queue is full, a new item evicts the oldest item of the lowest priority
+    that is lower than its own, otherwise the new item itself is discarded.
+    NOTE:
+        Not thread-safe, meant to be used from the event loop only
+        Discarded items are counted as dropped or summarized depending on the policy
+    """
+    POLICY_DROP = "drop"
+    POLICY_SUMMARIZE = "summarize"
+    POLICIES = (POLICY_DROP, POLICY_SUMMARIZE)
+
+    __slots__ = ("maxsize", "policy", "dropped", "summarized", "__queues", "__size", "__pending_summary")
+
+    def __init__(self, maxsize: int, *, priorities: int = 3, policy: str = POLICY_SUMMARIZE) -> None:
+        """
+        Constructor
+
+        IN:
+            maxsize - maximum number of items in the queue
+            priorities - number of priority levels
+                (Default: 3)
+            policy - what to do with discarded items, one of LogEventQueue.POLICIES
+                (Default: LogEventQueue.POLICY_SUMMARIZE)
+        """
+        if maxsize < 1:
+            raise ValueError(f"Queue size must be a positive integer, got {maxsize}.")
+
+        if policy not in LogEventQueue.POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}'.")
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.summarized = 0
+        self.__queues: Tuple[Deque[Any], ...] = tuple(deque() for i in range(priorities))
+        self.__size = 0
+        self.__pending_summary = [0] * priorities
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return (
+            f"{type(self).__name__}("
+            f"size={self.__size}, "
+            f"maxsize={self.maxsize}, "
+            f"policy={self.policy}, "
+            f"dropped={self.dropped}, "
+            f"summarized={self.summarized}"
+            ")"
+        )
+
+    def __len__(self) -> int:
+        """
+        Override for the len magic method
+
+        OUT:
+            int
+        """
+        return self.__size
+
+    def __bool__(self) -> bool:
+        """
+        Override for the bool magic method
+
+        OUT:
+            boolean
+        """
+        return self.__size > 0
+
+    def __discard(self, priority: int) -> None:
+        """
+        Accounts for a discarded item of the given priority
+        """
+        if self.policy == LogEventQueue.POLICY_SUMMARIZE:
+            self.summarized += 1
+            self.__pending_summary[priority] += 1
+
+        else:
+            self.dropped += 1
+
+    def put_nowait(self, item: Any, priority: int) -> bool:
+        """
+        Adds an item to the queue
+
+        IN:
+            item - the item
+            priority - the item priority
+
+        OUT:
+            True if the item was added, False if it was discarded
+        """
+        queues = self.__queues
+        if self.__size >= self.maxsize:
+            # Find the lowest priority we can evict an item from
+            for victim_priority in range(len(queues) - 1, priority, -1):
+                if queues[victim_priority]:
+                    queues[victim_priority].popleft()
+                    self.__size -= 1
+                    self.__discard(victim_priority)
+                    break
+
+            else:
+                self.__discard(priority)
+                return False
+
+        queues[priority].append(item)
+        self.__size += 1
+        return True
+
+    def get_nowait(self) -> Any:
+        """
+        Removes and returns the oldest item with the highest priority
+        NOTE: raises IndexError if the queue is empty
+
+        OUT:
+            the item
+        """
+        for queue in self.__queues:
+            if queue:
+                self.__size -= 1
+                return queue.popleft()
+
+        raise IndexError("get from an empty queue")
+
+    def pop_summary(self) -> List[int]:
+        """
+        Returns the number of summarized items per priority since the last call and resets it
+
+        OUT:
+            list of ints, indexed by priority
+        """
+        rv = self.__pending_summary
+        self.__pending_summary = [0] * len(rv)
+        return rv
+
+    def clear(self) -> None:
+        """
+        Removes all items from the queue, they are not counted as discarded
+        """
+        for queue in self.__queues:
+            queue.clear()
+        self.__size = 0
+
+class JoinRateTracker():
+    """
+    Tracks member joins per guild in a sliding time window to detect join spikes (raids).
+    A guild enters raid mode when the number of joins within the window reaches the threshold,
+    and leaves it once the number drops below half of the threshold.
+    NOTE: the time source is up to the caller, but it must be monotonic
+    """
+    __slots__ = ("window", "threshold", "__joins", "__raids")
+
+    def __init__(self, window: float, threshold: int) -> None:
+        """
+        Constructor
+
+        IN:
+            window - the length of the sliding window in seconds
+            threshold - the number of joins within the window to consider it a raid
+        """
+        if window <= 0:
+            raise ValueError(f"Window must be positive, got {window}.")
+
+        if threshold < 2:
+            raise ValueError(f"Threshold must be at least 2, got {threshold}.")
+
+        self.window = window
+        self.threshold = threshold
+        self.__joins: Dict[int, Deque[float]] = dict()
+        self.__raids: Set[int] = set()
+
+    def __update(self, guild_id: int, now: float) -> bool:
+        """
+        Removes expired joins and updates raid mode for the guild
+
+        IN:
+            guild_id - the guild id
+            now - current time
+
+        OUT:
+            boolean whether or not the guild is in raid mode
+        """
+        joins = self.__joins.get(guild_id, None)
+        if joins is not None:
+            cutoff = now - self.window
+            while joins and joins[0] <= cutoff:
+                joins.popleft()
+
+            if not joins:
+                del self.__joins[guild_id]
+
+        amount = len(joins) if joins else 0
+        if guild_id in self.__raids:
+            if amount < self.threshold // 2:
+                self.__raids.discard(guild_id)
+                return False
+
+            return True
+
+        if amount >= self.threshold:
+            self.__raids.add(guild_id)
+            return True
+
+        return False
+
+    def hit(self, guild_id: int, now: float) -> bool:
+        """
+        Records a join
+
+        IN:
+            guild_id - the guild id
+            now - current time
+
+        OUT:
+            boolean whether or not the guild is in raid mode after this join
+        """
+        joins = self.__joins.get(guild_id, None)
+        if joins is None:
+            joins = self.__joins[guild_id] = deque()
+        joins.append(now)
+
+        return self.__update(guild_id, now)
+
+    def is_raid(self, guild_id: int, now: float) -> bool:
+        """
+        Checks if the guild is in raid mode
+
+        IN:
+            guild_id - the guild id
+            now - current time
+
+        OUT:
+            boolean
+        """
+        return self.__update(guild_id, now)
+
+    def clear(self) -> None:
+        """
+        Resets the tracker
+        """
+        self.__joins.clear()
+        self.__raids.clear()
+
+
+class CompactMessage():
+    """
+    A compact representation of a discord message.
+    Unlike discord.Message, keeps no references to members, channels or embeds,
+    only ids as ints, the content as utf-8 bytes and attachment urls.
+    """
+    __slots__ = ("id", "channel_id", "author_id", "_content", "attachments", "edited_at", "nbytes")
+
+    def __init__(
+        self,
+        id: int,
+        channel_id: int,
+        author_id: int,
+        content: str,
+        attachments: Tuple[str, ...] = (),
+        edited_at: Optional[float] = None
+    ) -> None:
+        """
+        Constructor
+
+        IN:
+            id - the message id (also gives us the creation time)
+            channel_id - the channel id
+            author_id - the author id
+            content - the message content
+            attachments - urls of the attachments
+                (Default: empty tuple)
+            edited_at - timestamp of the last edit
+                (Default: None)
+        """
+        self.id = id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self._content = content.encode("utf-8")
+        self.attachments = attachments
+        self.edited_at = edited_at
+        self.nbytes = self.__get_nbytes()
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return (
+            f"{type(self).__name__}("
+            f"id={self.id}, "
+            f"channel_id={self.channel_id}, "
+            f"author_id={self.author_id}, "
+            f"content={self.content!r}, "
+            f"attachments={self.attachments}, "
+            f"edited_at={self.edited_at}"
+            ")"
+        )
+
+    def __get_nbytes(self) -> int:
+        """
+        Returns the approximate memory footprint of this message
+
+        OUT:
+            int
+        """
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self._content)
+            + sys.getsizeof(self.attachments)
+            + sum(map(sys.getsizeof, self.attachments))
+        )
+
+    @property
+    def content(self) -> str:
+        """
+        Returns the message content
+        """
+        return self._content.decode("utf-8")
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "CompactMessage":
+        """
+        Creates a compact message from a discord message
+
+        IN:
+            message - the message
+
+        OUT:
+            CompactMessage
+        """
+        edited_at = message.edited_at
+        return cls(
+            message.id,
+            message.channel.id,
+            message.author.id,
+            message.content,
+            tuple(a.proxy_url for a in message.attachments),
+            edited_at.timestamp() if edited_at is not None else None
+        )
+
+    def copy(self) -> "CompactMessage":
+        """
+        Returns a shallow copy of this message
+
+        OUT:
+            CompactMessage
+        """
+        rv = object.__new__(type(self))
+        for attr in CompactMessage.__slots__:
+            setattr(rv, attr, getattr(self, attr))
+
+        return rv
+
+    def update(self, content: Optional[str] = None, attachments: Optional[Tuple[str, ...]] = None, edited_at: Optional[float] = None) -> None:
+        """
+        Updates the message after an edit, None values are left untouched
+
+        IN:
+            content - the new content
+                (Default: None)
+            attachments - the new attachments
+                (Default: None)
+            edited_at - timestamp of the edit
+                (Default: None)
+        """
+        if content is not None:
+            self._content = content.encode("utf-8")
+
+        if attachments is not None:
+            self.attachments = attachments
+
+        if edited_at is not None:
+            self.edited_at = edited_at
+
+        self.nbytes = self.__get_nbytes()
+
+class MessageStore():
+    """
+    A store of recent messages, one ring buffer per guild.
+    Each buffer is limited by the total size of its messages rather than their number,
+    when a buffer goes over its budget, the oldest messages are evicted.
+    The whole store has a budget too, over it we evict the oldest messages of any guild.
+    """
+    __slots__ = ("budget", "total_budget", "__guilds", "__guilds_nbytes", "__order", "__nbytes")
+
+    def __init__(self, budget: int, total_budget: Optional[int] = None) -> None:
+        """
+        Constructor
+
+        IN:
+            budget - maximum size of the messages per guild in bytes
+            total_budget - maximum size of all the messages in bytes,
+                if None, only the per guild budget applies
+                (Default: None)
+        """
+        if budget < 1:
+            raise ValueError(f"Budget must be a positive integer, got {budget}.")
+
+        if total_budget is not None and total_budget < 1:
+            raise ValueError(f"Total budget must be a positive integer, got {total_budget}.")
+
+        self.budget = budget
+        self.total_budget = total_budget
+        self.__guilds: Dict[int, "OrderedDict[int, CompactMessage]"] = dict()
+        self.__guilds_nbytes: Dict[int, int] = dict()
+        # Map message id -> guild id, from the oldest to the newest message
+        self.__order: "OrderedDict[int, int]" = OrderedDict()
+        self.__nbytes = 0
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return (
+            f"{type(self).__name__}("
+            f"budget={self.budget}, "
+            f"total_budget={self.total_budget}, "
+            f"messages={len(self)}, "
+            f"nbytes={self.nbytes}"
+            ")"
+        )
+
+    def __len__(self) -> int:
+        """
+        Override for the len magic method
+
+        OUT:
+            total number of messages in the store
+        """
+        return len(self.__order)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Returns the approximate size of all the messages in the store
+        """
+        return self.__nbytes
+
+    def __evict(self, guild_id: int) -> None:
+        """
+        Evicts the oldest messages of the guild until it fits its budget,
+        then the oldest messages of the store until it fits the total budget
+
+        IN:
+            guild_id - the guild id
+        """
+        messages = self.__guilds[guild_id]
+        order = self.__order
+        nbytes = self.__guilds_nbytes[guild_id]
+        total_nbytes = self.__nbytes
+        while nbytes > self.budget and messages:
+            message_id, message = messages.popitem(last=False)
+            del order[message_id]
+            nbytes -= message.nbytes
+            total_nbytes -= message.nbytes
+
+        self.__guilds_nbytes[guild_id] = nbytes
+
+        total_budget = self.total_budget
+        if total_budget is not None:
+            while total_nbytes > total_budget and order:
+                message_id, guild_id = order.popitem(last=False)
+                message = self.__guilds[guild_id].pop(message_id)
+                self.__guilds_nbytes[guild_id] -= message.nbytes
+                total_nbytes -= message.nbytes
+
+        self.__nbytes = total_nbytes
+
+    def add(self, guild_id: int, message: CompactMessage) -> None:
+        """
+        Adds a message to the store
+
+        IN:
+            guild_id - the guild id
+            message - the message
+        """
+        messages = self.__guilds.get(guild_id, None)
+        if messages is None:
+            messages = self.__guilds[guild_id] = OrderedDict()
+            self.__guilds_nbytes[guild_id] = 0
+
+        old_message = messages.pop(message.id, None)
+        if old_message is not None:
+            self.__guilds_nbytes[guild_id] -= old_message.nbytes
+            self.__nbytes -= old_message.nbytes
+            del self.__order[message.id]
+
+        messages[message.id] = message
+        self.__order[message.id] = guild_id
+        self.__guilds_nbytes[guild_id] += message.nbytes
+        self.__nbytes += message.nbytes
+        self.__evict(guild_id)
+
+    def get(self, guild_id: int, message_id: int) -> Optional[CompactMessage]:
+        """
+        Returns a message from the store
+
+        IN:
+            guild_id - the guild id
+            message_id - the message id
+
+        OUT:
+            the message or None
+        """
+        messages = self.__guilds.get(guild_id, None)
+        if messages is None:
+            return None
+
+        return messages.get(message_id, None)
+
+    def update(
+        self,
+        guild_id: int,
+        message_id: int,
+        content: Optional[str] = None,
+        attachments: Optional[Tuple[str, ...]] = None,
+        edited_at: Optional[float] = None
+    ) -> Optional[CompactMessage]:
+        """
+        Updates a message in the store after an edit
+
+        IN:
+            guild_id - the guild id
+            message_id - the message id
+            content - the new content, None to leave as is
+                (Default: None)
+            attachments - the new attachments, None to leave as is
+                (Default: None)
+            edited_at - timestamp of the edit
+                (Default: None)
+
+        OUT:
+            copy of the message before the update or None if the message isn't in the store
+        """
+        message = self.get(guild_id, message_id)
+        if message is None:
+            return None
+
+        old_message = message.copy()
+        message.update(content, attachments, edited_at)
+        delta = message.nbytes - old_message.nbytes
+        self.__guilds_nbytes[guild_id] += delta
+        self.__nbytes += delta
+        self.__evict(guild_id)
+
+        return old_message
+
+    def pop(self, guild_id: int, message_id: int) -> Optional[CompactMessage]:
+        """
+        Removes a message from the store and returns it
+
+        IN:
+            guild_id - the guild id
+            message_id - the message id
+
+        OUT:
+            the message or None
+        """
+        messages = self.__guilds.get(guild_id, None)
+        if messages is None:
+            return None
+
+        message = messages.pop(message_id, None)
+        if message is not None:
+            self.__guilds_nbytes[guild_id] -= message.nbytes
+            self.__nbytes -= message.nbytes
+            del self.__order[message_id]
+
+        return message
+
+    def find(self, guild_id: int, *, author_id: Optional[int] = None, channel_id: Optional[int] = None) -> Iterator[CompactMessage]:
+        """
+        Iterates over the guild messages from the oldest to the newest
+
+        IN:
+            guild_id - the guild id
+            author_id - if not None, only yields messages of this author
+                (Default: None)
+            channel_id - if not None, only yields messages in this channel
+                (Default: None)
+
+        OUT:
+            iterator over messages
+        """
+        messages = self.__guilds.get(guild_id, None)
+        if messages is None:
+            return
+
+        for message in tuple(messages.values()):
+            if (
+                (author_id is None or message.author_id == author_id)
+                and (channel_id is None or message.channel_id == channel_id)
+            ):
+                yield message
+
+    def remove_channel(self, guild_id: int, channel_id: int) -> None:
+        """
+        Removes all messages of a channel from the store
+
+        IN:
+            guild_id - the guild id
+            channel_id - the channel id
+        """
+        for message in self.find(guild_id, channel_id=channel_id):
+            self.pop(guild_id, message.id)
+
+    def remove_guild(self, guild_id: int) -> None:
+        """
+        Removes all messages of a guild from the store
+
+        IN:
+            guild_id - the guild id
+        """
+        messages = self.__guilds.pop(guild_id, None)
+        if messages is None:
+            return
+
+        order = self.__order
+        for message_id in messages:
+            del order[message_id]
+        self.__nbytes -= self.__guilds_nbytes.pop(guild_id)
+
+    def clear(self) -> None:
+        """
+        Clears the store
+        """
+        self.__guilds.clear()
+        self.__guilds_nbytes.clear()
+        self.__order.clear()
+        self.__nbytes = 0
+
+class BoundedTaskRunner():
+    """
+    Runs jobs concurrently with a limit on the number of running jobs,
+    jobs that share a key (e.g. a rate limit bucket) never run at the same time.
+    Can be cancelled from another task, in which case the jobs that haven't finished are dropped.
+    """
+    __slots__ = ("concurrency", "done", "cancelled", "__workers")
+
+    def __init__(self, concurrency: int) -> None:
+        """
+        Constructor
+
+        IN:
+            concurrency - the max number of jobs running at the same time
+        """
+        if concurrency < 1:
+            raise ValueError(f"Concurrency must be at least 1, got {concurrency}.")
+
+        self.concurrency = concurrency
+        self.done = 0
+        self.cancelled = False
+        self.__workers: List[asyncio.Task] = list()
+
+    async def run(
+        self,
+        jobs: List[Tuple[Hashable, Callable[[], Awaitable[Any]]]],
+        on_done: Optional[Callable[[int, Any], Any]] = None
+    ) -> List[Any]:
+        """
+        Runs the jobs and waits for them to finish
+
+        IN:
+            jobs - list of (key, job), where job is a coroutine function without arguments
+            on_done - callback called with the job index and its result (or exception) after each job
+                (Default: None)
+
+        OUT:
+            list with the results of the jobs in the same order,
+            exceptions raised by jobs are returned as results, jobs that didn't run have None
+        """
+        results: List[Any] = [None] * len(jobs)
+        key_locks: Dict[Hashable, asyncio.Lock] = dict()
+        pending = iter(enumerate(jobs))
+
+        async def worker() -> None:
+            for idx, (key, job) in pending:
+                lock = key_locks.get(key, None)
+                if lock is None:
+                    lock = key_locks[key] = asyncio.Lock()
+
+                async with lock:
+                    try:
+                        result = await job()
+
+                    except Exception as e:
+                        result = e
+
+                results[idx] = result
+                self.done += 1
+                if on_done is not None:
+                    on_done(idx, result)
+
+        self.__workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(jobs)))]
+        try:
+            await asyncio.gather(*self.__workers, return_exceptions=True)
+
+        finally:
+            for task in self.__workers:
+                task.cancel()
+            self.__workers = list()
+
+        return results
+
+    def cancel(self) -> None:
+        """
+        Stops running jobs and drops the rest
+        """
+        self.cancelled = True
+        for task in self.__workers:
+            task.cancel()
+
+class DMNotifier():
+    """
+    Sends direct messages in the background with a limit on the number of concurrent sends,
+    so opening a DM channel doesn't delay the caller.
+    NOTE:
+        Not thread-safe, meant to be used from the event loop only
+    """
+    __slots__ = ("concurrency", "__semaphore", "__tasks")
+
+    def __init__(self, concurrency: int) -> None:
+        """
+        Constructor
+
+        IN:
+            concurrency - the max number of DMs being sent at the same time
+        """
+        if concurrency < 1:
+            raise ValueError(f"Concurrency must be at least 1, got {concurrency}.")
+
+        self.concurrency = concurrency
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        """
+        Returns the number of pending tasks
+        """
+        return len(self.__tasks)
+
+    async def __send(self, user: Union[discord.User, discord.Member], content: str) -> bool:
+        """
+        Sends a DM once there's a free slot
+
+        IN:
+            user - the user to DM
+            content - the message
+
+        OUT:
+            True if the message was delivered, False otherwise
+        """
+        # Created lazily so it's bound to the running loop
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.concurrency)
+
+        async with self.__semaphore:
+            try:
+                await user.send(content)
+
+            # The user may not accept DMs, in this case we get 403
+            except discord.HTTPException:
+                return False
+
+        return True
+
+    def schedule(self, coro: Awaitable[Any]) -> asyncio.Task:
+        """
+        Runs a coroutine in the background, keeping a reference to it until it's done
+
+        IN:
+            coro - the coroutine
+
+        OUT:
+            the task
+        """
+        task = asyncio.ensure_future(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+        return task
+
+    def send(self, user: Union[discord.User, discord.Member], content: str) -> asyncio.Task:
+        """
+        Queues a DM
+
+        IN:
+            user - the user to DM
+            content - the message
+
+        OUT:
+            task with the result, True if the message was delivered, False otherwise
+        """
+        return self.schedule(self.__send(user, content))
+
+    def cancel(self) -> None:
+        """
+        Cancels all pending tasks
+        """
+        for task in self.__tasks:
+            task.cancel()
+        self.__tasks.clear()
+
+class Histogram():
+    """
+    Counts values in fixed buckets, cheap to update and small regardless of the number of values.
+    Quantiles are estimated by interpolating inside the bucket
+    """
+    # In ms, from 0.1 ms to ~52 s, each bucket is 2 times wider than the previous one
+    DEF_BOUNDS = tuple(0.1 * 2**i for i in range(20))
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEF_BOUNDS) -> None:
+        """
+        Constructor
+
+        IN:
+            bounds - sorted upper bounds of the buckets, values above the last one go into an extra bucket
+                (Default: Histogram.DEF_BOUNDS)
+        """
+        if not bounds or any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise ValueError("Histogram bounds must be a non-empty increasing sequence.")
+
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return f"<{type(self).__name__}(count={self.count}, sum={self.sum:0.2f}, max={self.max:0.2f})>"
+
+    def add(self, value: float) -> None:
+        """
+        Adds a value
+
+        IN:
+            value - the value
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        """
+        Adds values from another histogram with the same bounds
+
+        IN:
+            other - the histogram
+        """
+        if other.bounds != self.bounds:
+            raise ValueError("Can't merge histograms with different bounds.")
+
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile
+
+        IN:
+            q - the quantile in range [0, 1]
+
+        OUT:
+            the estimation, 0.0 if the histogram is empty
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                value = lower + (upper - lower) * (rank - seen) / count
+                return min(value, self.max)
+            seen += count
+
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        """
+        Returns the mean value, 0.0 if the histogram is empty
+        """
+        return self.sum / self.count if self.count else 0.0
+
+    def clear(self) -> None:
+        """
+        Resets the histogram
+        """
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+class _AuthorIndexEntry():
+    """
+    Recent messages of one author in one guild, ordered by id
+    """
+    __slots__ = ("message_ids", "channel_ids", "since")
+
+    def __init__(self, since: int) -> None:
+        """
+        Constructor
+
+        IN:
+            since - the snowflake from which this entry has all the author's messages
+        """
+        self.message_ids = array("Q")
+        self.channel_ids = array("Q")
+        self.since = since
+
+    def drop_before(self, cutoff: int) -> array:
+        """
+        Drops the messages older than the cutoff
+
+        IN:
+            cutoff - the snowflake to drop messages before
+
+        OUT:
+            the ids of the dropped messages
+        """
+        idx = bisect_left(self.message_ids, cutoff)
+        dropped = self.message_ids[:idx]
+        if idx:
+            del self.message_ids[:idx]
+            del self.channel_ids[:idx]
+
+        return dropped
+
+class AuthorMessageIndex():
+    """
+    A rolling index of recent message ids by guild and author.
+    Messages older than the window are dropped, the time is taken from the message ids,
+    so it works without a clock. Each author keeps at most max_per_author messages,
+    the entry remembers from which point in time it's complete.
+    """
+    # Discord can bulk delete messages that are up to 14 days old
+    WINDOW = 14 * 24 * 60 * 60 * 1000 << 22
+    PRUNE_EVERY = 10000
+
+    __slots__ = ("max_per_author", "tracking_since", "__guilds", "__guilds_since", "__authors", "__adds")
+
+    def __init__(self, max_per_author: int, tracking_since: int) -> None:
+        """
+        Constructor
+
+        IN:
+            max_per_author - the max number of messages to keep per author per guild
+            tracking_since - the snowflake from which we see all messages
+        """
+        if max_per_author < 1:
+            raise ValueError(f"Max messages per author must be a positive integer, got {max_per_author}.")
+
+        self.max_per_author = max_per_author
+        self.tracking_since = tracking_since
+        self.__guilds: Dict[int, Dict[int, _AuthorIndexEntry]] = dict()
+        # Guilds we've joined after we started tracking
+        self.__guilds_since: Dict[int, int] = dict()
+        # Map guild id -> map message id -> author id, so we can apply deletes
+        self.__authors: Dict[int, Dict[int, int]] = dict()
+        self.__adds = 0
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return f"{type(self).__name__}(max_per_author={self.max_per_author}, messages={len(self)})"
+
+    def __len__(self) -> int:
+        """
+        Override for the len magic method
+
+        OUT:
+            total number of messages in the index
+        """
+        return sum(len(entry.message_ids) for authors in self.__guilds.values() for entry in authors.values())
+
+    def track_guild(self, guild_id: int, since: int) -> None:
+        """
+        Marks a guild as seen only from the given point in time (e.g. after we joined it)
+
+        IN:
+            guild_id - the guild id
+            since - the snowflake from which we see all messages in the guild
+        """
+        self.__guilds_since[guild_id] = since
+
+    def reset_coverage(self, since: int) -> None:
+        """
+        Marks all guilds as seen only from the given point in time (e.g. after a reconnect,
+        we could miss messages while we were disconnected)
+
+        IN:
+            since - the snowflake from which we see all messages again
+        """
+        self.tracking_since = max(self.tracking_since, since)
+        for authors in self.__guilds.values():
+            for entry in authors.values():
+                entry.since = max(entry.since, since)
+
+    def add(self, guild_id: int, author_id: int, channel_id: int, message_id: int) -> None:
+        """
+        Adds a message to the index
+
+        IN:
+            guild_id - the guild id
+            author_id - the author id
+            channel_id - the channel id
+            message_id - the message id
+        """
+        authors = self.__guilds.get(guild_id, None)
+        if authors is None:
+            authors = self.__guilds[guild_id] = dict()
+            self.__authors[guild_id] = dict()
+        message_authors = self.__authors[guild_id]
+
+        entry = authors.get(author_id, None)
+        if entry is None:
+            since = max(self.tracking_since, self.__guilds_since.get(guild_id, 0))
+            entry = authors[author_id] = _AuthorIndexEntry(since)
+
+        message_ids = entry.message_ids
+        # Messages may come out of order
+        if message_ids and message_id <= message_ids[-1]:
+            idx = bisect_left(message_ids, message_id)
+            if idx < len(message_ids) and message_ids[idx] == message_id:
+                return
+            message_ids.insert(idx, message_id)
+            entry.channel_ids.insert(idx, channel_id)
+
+        else:
+            message_ids.append(message_id)
+            entry.channel_ids.append(channel_id)
+        message_authors[message_id] = author_id
+
+        for dropped_id in entry.drop_before(message_id - self.WINDOW):
+            message_authors.pop(dropped_id, None)
+        if len(message_ids) > self.max_per_author:
+            # We lose the oldest message, so now the entry is complete only after it
+            entry.since = max(entry.since, message_ids[0] + 1)
+            message_authors.pop(message_ids[0], None)
+            del message_ids[0]
+            del entry.channel_ids[0]
+
+        self.__adds += 1
+        if self.__adds >= self.PRUNE_EVERY:
+            self.prune(message_id - self.WINDOW)
+
+    def get(self, guild_id: int, author_id: int, after: int) -> Tuple[Dict[int, List[int]], int]:
+        """
+        Returns the author's messages after the given snowflake
+
+        IN:
+            guild_id - the guild id
+            author_id - the author id
+            after - the snowflake to return messages after
+
+        OUT:
+            tuple of:
+                map channel id -> list of message ids
+                the snowflake from which the result has all the author's messages
+        """
+        entry = self.__guilds.get(guild_id, dict()).get(author_id, None)
+        if entry is None:
+            return dict(), max(self.tracking_since, self.__guilds_since.get(guild_id, 0))
+
+        rv = dict()
+        message_ids = entry.message_ids
+        channel_ids = entry.channel_ids
+        for idx in range(bisect_right(message_ids, after), len(message_ids)):
+            channel_id = channel_ids[idx]
+            channel_messages = rv.get(channel_id, None)
+            if channel_messages is None:
+                channel_messages = rv[channel_id] = list()
+            channel_messages.append(message_ids[idx])
+
+        return rv, entry.since
+
+    def remove_message(self, guild_id: int, message_id: int) -> None:
+        """
+        Removes a message (e.g. after it was deleted)
+
+        IN:
+            guild_id - the guild id
+            message_id - the message id
+        """
+        author_id = self.__authors.get(guild_id, dict()).pop(message_id, None)
+        if author_id is None:
+            return
+
+        entry = self.__guilds[guild_id].get(author_id, None)
+        if entry is None:
+            return
+
+        message_ids = entry.message_ids
+        idx = bisect_left(message_ids, message_id)
+        if idx < len(message_ids) and message_ids[idx] == message_id:
+            del message_ids[idx]
+            del entry.channel_ids[idx]
+
+    def remove_author(self, guild_id: int, author_id: int, channel_ids: Optional[Iterable[int]] = None) -> None:
+        """
+        Removes the messages of an author in a guild
+
+        IN:
+            guild_id - the guild id
+            author_id - the author id
+            channel_ids - the channels to remove the messages from, None for all channels
+                (Default: None)
+        """
+        authors = self.__guilds.get(guild_id, None)
+        if authors is None:
+            return
+
+        entry = authors.get(author_id, None)
+        if entry is None:
+            return
+
+        message_authors = self.__authors[guild_id]
+        if channel_ids is None:
+            del authors[author_id]
+            for message_id in entry.message_ids:
+                message_authors.pop(message_id, None)
+            return
+
+        channel_ids = set(channel_ids)
+        kept_message_ids = array("Q")
+        kept_channel_ids = array("Q")
+        for message_id, channel_id in zip(entry.message_ids, entry.channel_ids):
+            if channel_id in channel_ids:
+                message_authors.pop(message_id, None)
+            else:
+                kept_message_ids.append(message_id)
+                kept_channel_ids.append(channel_id)
+        entry.message_ids = kept_message_ids
+        entry.channel_ids = kept_channel_ids
+
+    def remove_guild(self, guild_id: int) -> None:
+        """
+        Removes all messages of a guild
+
+        IN:
+            guild_id - the guild id
+        """
+        self.__guilds.pop(guild_id, None)
+        self.__guilds_since.pop(guild_id, None)
+        self.__authors.pop(guild_id, None)
+
+    def prune(self, cutoff: int) -> None:
+        """
+        Drops messages older than the cutoff in all guilds, and authors without messages
+
+        IN:
+            cutoff - the snowflake to drop messages before
+        """
+        self.__adds = 0
+        for guild_id, authors in tuple(self.__guilds.items()):
+            message_authors = self.__authors[guild_id]
+            for author_id, entry in tuple(authors.items()):
+                for message_id in entry.drop_before(cutoff):
+                    message_authors.pop(message_id, None)
+                if not entry.message_ids:
+                    del authors[author_id]
+
+            if not authors:
+                del self.__guilds[guild_id]
+                del self.__authors[guild_id]
+
+    def clear(self) -> None:
+        """
+        Removes all messages from the index
+        """
+        self.__guilds.clear()
+        self.__guilds_since.clear()
+        self.__authors.clear()
+        self.__adds = 0
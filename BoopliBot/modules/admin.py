@@ -4,8 +4,17 @@ Module provides set of commands to work with guild members.
 
 import asyncio
 import datetime
+import logging
+import time
+from functools import partial
+from collections.abc import (
+    AsyncIterator,
+    Callable
+)
 from typing import (
-    Optional
+    Optional,
+    Union,
+    List
 )
 
 
@@ -24,12 +33,22 @@ from ..errors import (
     BotTooLowInHierarchy,
     MissingRequiredSubCommand
 )
-from ..converters import MemberOrUserConverter
-from ..helpers import PartialAuditLogEntry
+from ..converters import (
+    MemberOrUserConverter,
+    MemberOrObjectConverter,
+    MassActionFlags
+)
+from ..helpers import (
+    PartialAuditLogEntry,
+    BoundedTaskRunner,
+    DMNotifier
+)
 
 
 _cogs = set()
 
+logger = logging.getLogger(__name__)
+
 MSG_WARNED = "You were warned in **{guild}**. You have **{warnings}** warning(s) now."
 MSG_WARNED_WITH_REASON = "You were warned in **{guild}** with the reason: **{reason}**. You have **{warnings}** warning(s) now."
 RESPONSE_WARNED = "Warned {member}. They have **{warnings}** warning(s) now."
@@ -59,6 +78,38 @@ RESPONSE_NOBAN = "{member} has not been banned."
 
 ATTENTION_NO_DM = " \n**Attention**: I could not message them."
 
+RESPONSE_MASS_ACTION_PROGRESS = "Going to {action} {amount} member(s)..."
+RESPONSE_MASS_ACTION_DONE = "{action} {amount} member(s)."
+RESPONSE_MASS_ACTION_SKIPPED = " Skipped {amount} member(s) you or I can't act on."
+RESPONSE_MASS_ACTION_FAILED = " Failed to act on {amount} member(s)."
+RESPONSE_MASS_ACTION_NO_TARGETS = "There's no one I can act on."
+RESPONSE_MASS_ACTION_TOO_MANY = "That's too many members, the limit is {limit}."
+
+RESPONSE_PURGE_PROGRESS = "Purging... deleted {deleted} message(s) so far."
+RESPONSE_MASSPURGE_PROGRESS = "Scanned {done}/{total} channels, deleted {deleted} message(s) so far. React with {emoji} to cancel."
+
+# Channels scanned at the same time, each channel has its own rate limit buckets,
+# this keeps us well under the global limit
+MASSPURGE_CONCURRENCY = 8
+MASSPURGE_PROGRESS_INTERVAL = 2.0
+PURGE_WINDOW_MARGIN = datetime.timedelta(minutes=5)
+# Bans/kicks in flight at the same time
+MASS_ACTION_CONCURRENCY = 5
+MASS_ACTION_MAX_TARGETS = 1000
+# Max join window for mass actions in minutes
+MASS_ACTION_MAX_WINDOW = 24 * 60
+MASS_ACTION_BAN = "ban"
+MASS_ACTION_KICK = "kick"
+
+# Moderation DMs in flight at the same time
+DM_CONCURRENCY = 4
+# For how long kick/ban wait for the DM to go through, after that we can't DM the member
+DM_GRACE_TIME = 1.0
+
+PURGE_MAX_LIMIT = 10000
+PURGE_PROGRESS_INTERVAL = 2.0
+EMOJI_CANCEL = "\N{CROSS MARK}"
+
 
 @register_cog(_cogs)
 class MemberCommands(commands.Cog, name="Administration"):
@@ -73,6 +124,89 @@ class MemberCommands(commands.Cog, name="Administration"):
             bot - the bot object
         """
         self.bot = bot
+        self.dm_notifier = DMNotifier(DM_CONCURRENCY)
+
+    def cog_unload(self) -> None:
+        """
+        Callback on cog unloading, drops pending DMs
+        """
+        self.dm_notifier.cancel()
+
+    def _queue_dm(self, member: Union[discord.Member, discord.User], content: str) -> Optional[asyncio.Task]:
+        """
+        Queues a DM to the member
+
+        IN:
+            member - the member to DM
+            content - the message
+
+        OUT:
+            task with the delivery result, None if we can't DM this member
+        """
+        # Sadly bots can't DM each other
+        if member.bot:
+            return None
+
+        return self.dm_notifier.send(member, content)
+
+    @staticmethod
+    def _is_dm_delivered(dm_task: asyncio.Task) -> bool:
+        """
+        Checks the result of a finished DM task, any failure means the DM wasn't delivered
+        NOTE: unlike Task.result() this never raises, by now the command has done its job
+
+        IN:
+            dm_task - the task returned by _queue_dm
+
+        OUT:
+            boolean
+        """
+        if dm_task.cancelled():
+            return False
+
+        if dm_task.exception() is not None:
+            logger.warning(f"Unexpected error while sending a DM: {repr(dm_task.exception())}")
+            return False
+
+        return dm_task.result()
+
+    async def _send_response(self, ctx: commands.Context, response: str, dm_task: Optional[asyncio.Task]) -> None:
+        """
+        Replies to a moderation command without waiting for the DM,
+        if the DM fails later, the reply is edited with a note about that
+
+        IN:
+            ctx - the command context
+            response - the reply
+            dm_task - the task returned by _queue_dm
+        """
+        if dm_task is not None and dm_task.done():
+            if not self._is_dm_delivered(dm_task):
+                response += ATTENTION_NO_DM
+            dm_task = None
+
+        reply = await ctx.send(response, reference=ctx.message)
+
+        if dm_task is not None:
+            self.dm_notifier.schedule(self._add_no_dm_note(reply, response, dm_task))
+
+    @classmethod
+    async def _add_no_dm_note(cls, reply: discord.Message, response: str, dm_task: asyncio.Task) -> None:
+        """
+        Edits the reply if the DM wasn't delivered
+
+        IN:
+            reply - the reply message
+            response - the reply content
+            dm_task - the task returned by _queue_dm
+        """
+        await asyncio.wait((dm_task,))
+        if not cls._is_dm_delivered(dm_task):
+            try:
+                await reply.edit(content=response + ATTENTION_NO_DM)
+
+            except discord.HTTPException:
+                pass
 
     @commands.command(name="warn")
     @commands.has_guild_permissions(kick_members=True)
@@ -85,16 +219,7 @@ class MemberCommands(commands.Cog, name="Administration"):
             member - the member to give the warning to
             reason - the reason
         """
-        guild_id = ctx.guild.id
-        user_id = member.id
-        warnings = 1
-        async with sql_utils.NewAsyncSession() as sesh:
-            sesh: sql_utils.AsyncSession
-
-            user_data = await sesh.get(sql_utils.User, (guild_id, user_id))
-
-            if user_data is not None:
-                warnings = user_data.current_warns + 1
+        warnings = await sql_utils.warn_user(ctx.guild.id, member.id)
 
         if reason:
             msg_warned = MSG_WARNED_WITH_REASON.format(guild=ctx.guild.name, reason=reason, warnings=warnings)
@@ -104,24 +229,16 @@ class MemberCommands(commands.Cog, name="Administration"):
             msg_warned = MSG_WARNED.format(guild=ctx.guild.name, warnings=warnings)
             response_warned = RESPONSE_WARNED.format(member=member.mention, warnings=warnings)
 
-        # After we got the current warnings, we can dispatch
         self.bot.dispatch(
             "member_warn",
             ctx.guild,
             member,
-            PartialAuditLogEntry("warn", ctx.author, member, reason)
+            PartialAuditLogEntry("warn", ctx.author, member, reason),
+            warnings
         )
 
-        # Sadly bots can't DM each other
-        if not member.bot:
-            # The user may not accept DMs, in this case we get 403
-            try:
-                await member.send(msg_warned)
-
-            except discord.Forbidden:
-                response_warned += ATTENTION_NO_DM
-
-        await ctx.send(response_warned, reference=ctx.message)
+        dm_task = self._queue_dm(member, msg_warned)
+        await self._send_response(ctx, response_warned, dm_task)
 
     @commands.command(name="unwarn")
     @commands.has_guild_permissions(kick_members=True)
@@ -134,16 +251,8 @@ class MemberCommands(commands.Cog, name="Administration"):
             member - the member to remove the warning from
             reason - the reason
         """
-        guild_id = ctx.guild.id
-        user_id = member.id
-        warnings = None
-        async with sql_utils.NewAsyncSession() as sesh:
-            sesh: sql_utils.AsyncSession
-
-            user_data = await sesh.get(sql_utils.User, (guild_id, user_id))
-
-            if user_data is not None and user_data.current_warns > 0:
-                warnings = user_data.current_warns - 1
+        dm_task = None
+        warnings = await sql_utils.unwarn_user(ctx.guild.id, member.id)
 
         # Non-None means we remove a warning
         if warnings is not None:
@@ -155,25 +264,21 @@ class MemberCommands(commands.Cog, name="Administration"):
                 msg_unwarned = MSG_UNWARNED.format(guild=ctx.guild.name, warnings=warnings)
                 response_unwarned = RESPONSE_UNWARNED.format(member=member.mention, warnings=warnings)
 
-            if not member.bot:
-                try:
-                    await member.send(msg_unwarned)
-
-                except discord.Forbidden:
-                    response_unwarned += ATTENTION_NO_DM
+            dm_task = self._queue_dm(member, msg_unwarned)
 
             # Only dispatch if everything is correct
             self.bot.dispatch(
                 "member_unwarn",
                 ctx.guild,
                 member,
-                PartialAuditLogEntry("unwarn", ctx.author, member, reason)
+                PartialAuditLogEntry("unwarn", ctx.author, member, reason),
+                warnings
             )
 
         else:
             response_unwarned = RESPONSE_NOWARNS.format(member=member.mention)
 
-        await ctx.send(response_unwarned, reference=ctx.message)
+        await self._send_response(ctx, response_unwarned, dm_task)
 
     @commands.command(name="kick")
     @commands.has_guild_permissions(kick_members=True)
@@ -203,15 +308,13 @@ class MemberCommands(commands.Cog, name="Administration"):
             msg_kicked = MSG_KICKED.format(guild=ctx.guild.name)
             response_kicked = RESPONSE_KICKED.format(member=member.mention)
 
-        if not member.bot:
-            try:
-                await member.send(msg_kicked)
-
-            except discord.Forbidden:
-                response_kicked += ATTENTION_NO_DM
+        dm_task = self._queue_dm(member, msg_kicked)
+        if dm_task is not None:
+            # Once they're kicked we likely can't DM them, give the DM a moment to go through
+            await asyncio.wait((dm_task,), timeout=DM_GRACE_TIME)
 
         await member.kick(reason=reason)
-        await ctx.send(response_kicked, reference=ctx.message)
+        await self._send_response(ctx, response_kicked, dm_task)
 
     @commands.command(name="ban")
     @commands.has_guild_permissions(ban_members=True)
@@ -241,16 +344,224 @@ class MemberCommands(commands.Cog, name="Administration"):
             msg_banned = MSG_BANNED.format(guild=ctx.guild.name)
             response_banned = RESPONSE_BANNED.format(member=member.mention)
 
-        if not member.bot:
-            try:
-                await member.send(msg_banned)
-
-            except discord.Forbidden:
-                response_banned += ATTENTION_NO_DM
+        dm_task = self._queue_dm(member, msg_banned)
+        if dm_task is not None:
+            # Once they're banned we likely can't DM them, give the DM a moment to go through
+            await asyncio.wait((dm_task,), timeout=DM_GRACE_TIME)
 
         # NOTE: we're banning through the guild because member may be either discord.Member OR discord.User
         await ctx.guild.ban(member, reason=reason, delete_message_days=0)
-        await ctx.send(response_banned, reference=ctx.message)
+        await self._send_response(ctx, response_banned, dm_task)
+
+    async def _run_mass_action(
+        self,
+        ctx: commands.Context,
+        action: str,
+        targets: List[Union[discord.Member, discord.Object]],
+        flags: MassActionFlags
+    ) -> None:
+        """
+        Bans or kicks many members at once
+
+        IN:
+            ctx - the command context
+            action - MASS_ACTION_BAN or MASS_ACTION_KICK
+            targets - the members to ban/kick
+            flags - the command flags
+        """
+        guild: discord.Guild = ctx.guild
+        author: discord.Member = ctx.author
+        me: discord.Member = guild.me
+        is_ban = action == MASS_ACTION_BAN
+        reason = flags.reason
+
+        # Keep only the members we're allowed to act on
+        allowed_targets = list()
+        total_skipped = 0
+        for target in {target.id: target for target in targets}.values():
+            if target.id in (author.id, me.id, guild.owner_id):
+                total_skipped += 1
+
+            elif isinstance(target, discord.Member):
+                if (
+                    (author.id != guild.owner_id and author.top_role <= target.top_role)
+                    or me.top_role <= target.top_role
+                ):
+                    total_skipped += 1
+                else:
+                    allowed_targets.append(target)
+
+            # We can only kick members
+            elif not is_ban:
+                total_skipped += 1
+
+            else:
+                allowed_targets.append(target)
+
+        if not allowed_targets:
+            await ctx.send(RESPONSE_MASS_ACTION_NO_TARGETS, reference=ctx.message)
+            return
+
+        if len(allowed_targets) > MASS_ACTION_MAX_TARGETS:
+            await ctx.send(RESPONSE_MASS_ACTION_TOO_MANY.format(limit=MASS_ACTION_MAX_TARGETS), reference=ctx.message)
+            return
+
+        if is_ban:
+            msg = MSG_BANNED_WITH_REASON if reason else MSG_BANNED
+        else:
+            msg = MSG_KICKED_WITH_REASON if reason else MSG_KICKED
+        msg = msg.format(guild=guild.name, reason=reason)
+
+        async def act(target: Union[discord.Member, discord.Object]) -> Union[discord.Member, discord.Object]:
+            # We'll do the db update and logging for everyone at once
+            self.bot.suppress_member_events(guild.id, target.id)
+            if flags.dm and isinstance(target, discord.Member) and not target.bot:
+                try:
+                    await target.send(msg)
+
+                except discord.HTTPException:
+                    pass
+
+            try:
+                if is_ban:
+                    await guild.ban(target, reason=reason, delete_message_days=0)
+                else:
+                    await guild.kick(target, reason=reason)
+
+            except Exception:
+                # We didn't act on them, so their events must be handled as usual
+                self.bot.unsuppress_member_events(guild.id, target.id)
+                raise
+
+            return target
+
+        progress_msg: discord.Message = await ctx.send(
+            RESPONSE_MASS_ACTION_PROGRESS.format(action=action, amount=len(allowed_targets)),
+            reference=ctx.message
+        )
+        # discord.py paces the requests using the rate limit headers, we only limit how many are in flight
+        runner = BoundedTaskRunner(MASS_ACTION_CONCURRENCY)
+        results = await runner.run([(target.id, partial(act, target)) for target in allowed_targets])
+        done_targets = [target for target in results if target is not None and not isinstance(target, Exception)]
+        total_failed = len(allowed_targets) - len(done_targets)
+
+        if done_targets:
+            await sql_utils.increment_user_counter(
+                guild.id,
+                (target.id for target in done_targets),
+                "total_bans" if is_ban else "total_kicks"
+            )
+            self.bot.dispatch(
+                "member_mass_action",
+                guild,
+                action,
+                done_targets,
+                PartialAuditLogEntry(action, author, None, reason)
+            )
+
+        response = RESPONSE_MASS_ACTION_DONE.format(action="Banned" if is_ban else "Kicked", amount=len(done_targets))
+        if total_skipped:
+            response += RESPONSE_MASS_ACTION_SKIPPED.format(amount=total_skipped)
+        if total_failed:
+            response += RESPONSE_MASS_ACTION_FAILED.format(amount=total_failed)
+
+        try:
+            await progress_msg.edit(content=response)
+
+        except discord.HTTPException:
+            await ctx.send(response, reference=ctx.message)
+
+    @staticmethod
+    def _get_recent_members(guild: discord.Guild, minutes: int) -> List[discord.Member]:
+        """
+        Returns the members who joined within the given number of minutes
+
+        IN:
+            guild - the guild
+            minutes - the window
+
+        OUT:
+            list of members
+        """
+        minutes = max(min(minutes, MASS_ACTION_MAX_WINDOW), 0)
+        cutoff = discord.utils.utcnow() - datetime.timedelta(minutes=minutes)
+        return [
+            member
+            for member in guild.members
+            if member.joined_at is not None and member.joined_at >= cutoff
+        ]
+
+    @commands.group(name="massban", invoke_without_command=True)
+    @commands.has_guild_permissions(ban_members=True)
+    @commands.bot_has_guild_permissions(ban_members=True)
+    @commands.guild_only()
+    @commands.max_concurrency(1, per=commands.BucketType.guild)
+    async def cmd_massban(
+        self,
+        ctx: commands.Context,
+        members: commands.Greedy[MemberOrObjectConverter],
+        *,
+        flags: MassActionFlags
+    ) -> None:
+        """
+        Bans many members/discord users at once, doesn't DM them unless asked
+
+        IN:
+            members - mentions or ids of the members to ban
+            flags - --reason <text> for the ban reason, --dm yes to DM the members
+        """
+        await self._run_mass_action(ctx, MASS_ACTION_BAN, members, flags)
+
+    @cmd_massban.command(name="joined")
+    @commands.has_guild_permissions(ban_members=True)
+    @commands.bot_has_guild_permissions(ban_members=True)
+    @commands.guild_only()
+    @commands.max_concurrency(1, per=commands.BucketType.guild)
+    async def cmd_massban_joined(self, ctx: commands.Context, minutes: int, *, flags: MassActionFlags) -> None:
+        """
+        Bans the members who joined within the last minutes
+
+        IN:
+            minutes - the window, maximum MASS_ACTION_MAX_WINDOW
+            flags - --reason <text> for the ban reason, --dm yes to DM the members
+        """
+        await self._run_mass_action(ctx, MASS_ACTION_BAN, self._get_recent_members(ctx.guild, minutes), flags)
+
+    @commands.group(name="masskick", invoke_without_command=True)
+    @commands.has_guild_permissions(kick_members=True)
+    @commands.bot_has_guild_permissions(kick_members=True)
+    @commands.guild_only()
+    @commands.max_concurrency(1, per=commands.BucketType.guild)
+    async def cmd_masskick(
+        self,
+        ctx: commands.Context,
+        members: commands.Greedy[MemberOrObjectConverter],
+        *,
+        flags: MassActionFlags
+    ) -> None:
+        """
+        Kicks many server members at once, doesn't DM them unless asked
+
+        IN:
+            members - mentions or ids of the members to kick
+            flags - --reason <text> for the kick reason, --dm yes to DM the members
+        """
+        await self._run_mass_action(ctx, MASS_ACTION_KICK, members, flags)
+
+    @cmd_masskick.command(name="joined")
+    @commands.has_guild_permissions(kick_members=True)
+    @commands.bot_has_guild_permissions(kick_members=True)
+    @commands.guild_only()
+    @commands.max_concurrency(1, per=commands.BucketType.guild)
+    async def cmd_masskick_joined(self, ctx: commands.Context, minutes: int, *, flags: MassActionFlags) -> None:
+        """
+        Kicks the members who joined within the last minutes
+
+        IN:
+            minutes - the window, maximum MASS_ACTION_MAX_WINDOW
+            flags - --reason <text> for the kick reason, --dm yes to DM the members
+        """
+        await self._run_mass_action(ctx, MASS_ACTION_KICK, self._get_recent_members(ctx.guild, minutes), flags)
 
     @commands.command(name="unban")
     @commands.has_guild_permissions(ban_members=True)
@@ -264,6 +575,7 @@ class MemberCommands(commands.Cog, name="Administration"):
             member - the member to unban
             reason - the ban reason
         """
+        dm_task = None
         try:
             ban_entry = await ctx.guild.fetch_ban(member)
 
@@ -280,38 +592,99 @@ class MemberCommands(commands.Cog, name="Administration"):
                 response_unbanned = RESPONSE_UNBANNED.format(member=member.mention)
 
             await ctx.guild.unban(member, reason=reason)
+            dm_task = self._queue_dm(member, msg_unbanned)
 
-            if not member.bot:
-                try:
-                    await member.send(msg_unbanned)
+        finally:
+            await self._send_response(ctx, response_unbanned, dm_task)
+
+    @staticmethod
+    async def _iter_purge_batches(
+        channel: discord.TextChannel,
+        limit: int,
+        check: Callable[[discord.Message], bool],
+        after: datetime.datetime
+    ) -> AsyncIterator[List[discord.Message]]:
+        """
+        Pages through the channel history from the newest message and yields batches of messages to delete
 
-                except discord.Forbidden:
-                    response_unbanned += ATTENTION_NO_DM
+        IN:
+            channel - the channel
+            limit - the number of messages to go through
+            check - the predicate for messages to delete
+            after - the datetime to stop at, older messages are never fetched
 
-        finally:
-            await ctx.send(response_unbanned, reference=ctx.message)
+        OUT:
+            async generator of lists with up to 100 messages
+        """
+        batch = list()
+        async for message in channel.history(limit=limit, after=after, oldest_first=False):
+            if check(message):
+                batch.append(message)
+                if len(batch) == 100:
+                    yield batch
+                    batch = list()
+
+        if batch:
+            yield batch
 
     @commands.command(name="purge")
     @commands.has_guild_permissions(ban_members=True, read_message_history=True)
     @commands.bot_has_guild_permissions(manage_messages=True, read_message_history=True)
     @commands.guild_only()
     @commands.cooldown(rate=1, per=5, type=commands.cooldowns.BucketType.guild)
+    @commands.max_concurrency(1, per=commands.BucketType.channel)
     async def cmd_purge(self, ctx: commands.Context, limit: int, *, target: Optional[MemberOrUserConverter] = None) -> None:
         """
         Goes through the last messages in the channel and deletes them.
         Only delete messages created within last 2 weeks.
+        Long purges report their progress.
 
         IN:
-            limit - the number of messages to go through, mximum 100
+            limit - the number of messages to go through, maximum PURGE_MAX_LIMIT
             target - the messages' author, if specified, deletes messages only from that person
         """
-        limit = max(min(limit, 100), 0)
+        limit = max(min(limit, PURGE_MAX_LIMIT), 0)
         check = lambda message: target is None or message.author == target
-        after = ctx.message.created_at - datetime.timedelta(weeks=2)
+        # Long purges take a while, leave a margin so messages don't get too old to bulk delete
+        after = ctx.message.created_at - datetime.timedelta(weeks=2) + PURGE_WINDOW_MARGIN
+        channel: discord.TextChannel = ctx.channel
+
+        total_deleted = 0
+        progress_msg: Optional[discord.Message] = None
+        last_report = time.monotonic()
+        async for batch in self._iter_purge_batches(channel, limit, check, after):
+            try:
+                await channel.delete_messages(batch)
+
+            # Someone else has deleted it
+            except discord.NotFound:
+                continue
+
+            total_deleted += len(batch)
+
+            now = time.monotonic()
+            if now - last_report >= PURGE_PROGRESS_INTERVAL:
+                last_report = now
+                progress = RESPONSE_PURGE_PROGRESS.format(deleted=total_deleted)
+                try:
+                    if progress_msg is None:
+                        progress_msg = await ctx.send(progress)
+                    else:
+                        await progress_msg.edit(content=progress)
+
+                except discord.HTTPException:
+                    pass
 
-        deleted_msgs = await ctx.channel.purge(limit=limit, check=check, after=after)
-        total_deleted = len(deleted_msgs)
         ending = "" if total_deleted == 1 else "s"
+        response = f"Deleted {total_deleted} message{ending}."
+
+        if progress_msg is not None:
+            try:
+                await progress_msg.edit(content=response)
+                return
+
+            except discord.HTTPException:
+                pass
 
         try:
             og_message = await ctx.channel.fetch_message(ctx.message.id)
@@ -319,7 +692,7 @@ class MemberCommands(commands.Cog, name="Administration"):
         except discord.NotFound:
             og_message = None
 
-        await ctx.send(f"Deleted {total_deleted} message{ending}.", reference=og_message)
+        await ctx.send(response, reference=og_message)
 
     @commands.command(name="masspurge")
     @commands.has_guild_permissions(administrator=True, read_message_history=True)
@@ -330,6 +703,8 @@ class MemberCommands(commands.Cog, name="Administration"):
         """
         Goes through the last messages in this server and deletes them.
         Only delete messages created within last 2 weeks.
+        Channels are scanned concurrently, the progress is reported in the response,
+        the invoker can cancel the purge by reacting to it.
 
         IN:
             limit - the number of messages to go through, maximum 100
@@ -339,24 +714,120 @@ class MemberCommands(commands.Cog, name="Administration"):
         limit = max(min(limit, 100), 0)
         check = lambda message: message.author == target
         after = ctx.message.created_at - datetime.timedelta(weeks=2)
+        guild: discord.Guild = ctx.guild
+
+        # The messages we have in the author index can be bulk deleted without history requests
+        after_id = discord.utils.time_snowflake(after)
+        known_messages, complete_since = self.bot.author_index.get(guild.id, target.id, after_id)
+        # If the index has everything within the bulk delete window, we don't need the history at all
+        if complete_since > after_id:
+            history_before = discord.utils.snowflake_time(complete_since)
+        else:
+            history_before = None
+
+        author_index = self.bot.author_index
+
+        async def purge_channel(channel: Union[discord.TextChannel, discord.Thread]) -> int:
+            amount_deleted = 0
+            # The newest messages, the limit applies to the indexed messages too
+            message_ids = known_messages.get(channel.id, [])
+            message_ids = message_ids[max(len(message_ids) - limit, 0):]
+            for i in range(0, len(message_ids), 100):
+                batch = message_ids[i:i+100]
+                try:
+                    await channel.delete_messages([discord.Object(id=message_id) for message_id in batch])
+
+                # Already deleted
+                except discord.NotFound:
+                    pass
+
+                else:
+                    amount_deleted += len(batch)
+
+                # Only what's gone leaves the index, so a failed channel is retried next time
+                for message_id in batch:
+                    author_index.remove_message(guild.id, message_id)
+
+            # Now go through the history for the messages from before the index
+            history_limit = limit - len(message_ids)
+            if history_before is not None and history_limit > 0:
+                deleted_msgs = await channel.purge(limit=history_limit, check=check, after=after, before=history_before)
+                amount_deleted += len(deleted_msgs)
+
+            return amount_deleted
+
+        if history_before is None:
+            channels = [channel for channel in map(guild.get_channel_or_thread, known_messages) if channel is not None]
+        else:
+            channels = [*guild.text_channels, *guild.threads]
+        # Both history and bulk delete are limited per channel, so the channel is the key
+        jobs = [(channel.id, partial(purge_channel, channel)) for channel in channels]
+        runner = BoundedTaskRunner(MASSPURGE_CONCURRENCY)
         total_deleted = 0
+        total_failed = 0
+
+        def on_channel_done(idx: int, result: Union[int, Exception]) -> None:
+            nonlocal total_deleted, total_failed
+            if isinstance(result, Exception):
+                total_failed += 1
+            else:
+                total_deleted += result
+
+        def get_progress() -> str:
+            return RESPONSE_MASSPURGE_PROGRESS.format(
+                done=runner.done,
+                total=len(jobs),
+                deleted=total_deleted,
+                emoji=EMOJI_CANCEL
+            )
 
-        for channel in ctx.guild.text_channels:
-            deleted_msgs = await channel.purge(limit=limit, check=check, after=after)
-            amount_deleted = len(deleted_msgs)
-            total_deleted += amount_deleted
-            if amount_deleted > 0:
-                await asyncio.sleep(1.0)
+        progress_msg: discord.Message = await ctx.send(get_progress(), reference=ctx.message)
+        try:
+            await progress_msg.add_reaction(EMOJI_CANCEL)
 
-        ending = "" if total_deleted == 1 else "s"
+        except discord.HTTPException:
+            pass
+
+        async def report_progress() -> None:
+            while True:
+                await asyncio.sleep(MASSPURGE_PROGRESS_INTERVAL)
+                try:
+                    await progress_msg.edit(content=get_progress())
+
+                except discord.HTTPException:
+                    pass
+
+        async def wait_for_cancel() -> None:
+            await self.bot.wait_for(
+                "reaction_add",
+                check=lambda reaction, user: (
+                    user == ctx.author
+                    and reaction.message.id == progress_msg.id
+                    and str(reaction.emoji) == EMOJI_CANCEL
+                )
+            )
+            runner.cancel()
 
+        helpers = (asyncio.create_task(report_progress()), asyncio.create_task(wait_for_cancel()))
         try:
-            og_message = await ctx.channel.fetch_message(ctx.message.id)
+            await runner.run(jobs, on_done=on_channel_done)
 
-        except discord.NotFound:
-            og_message = None
+        finally:
+            for task in helpers:
+                task.cancel()
+
+        ending = "" if total_deleted == 1 else "s"
+        response = f"Deleted {total_deleted} message{ending}."
+        if runner.cancelled:
+            response = f"Cancelled after scanning {runner.done}/{len(jobs)} channels. " + response
+        if total_failed:
+            response += f" Could not scan {total_failed} channel{'' if total_failed == 1 else 's'}."
+
+        try:
+            await progress_msg.edit(content=response)
 
-        await ctx.send(f"Deleted {total_deleted} message{ending}.", reference=og_message)
+        except discord.HTTPException:
+            await ctx.send(response, reference=ctx.message)
 
 
 def setup(bot: Bot):
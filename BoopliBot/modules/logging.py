@@ -2,14 +2,19 @@
 Module contains cog for chat logs.
 """
 
-# import datetime
-from textwrap import shorten as shorten_text
+import datetime
+import asyncio
+import logging
+import time
 from typing import (
     Tuple,
     Optional,
-    Union
+    Union,
+    Dict,
+    List
 )
 
+import aiohttp
 import discord
 from discord.ext import commands
 from discord.utils import utcnow
@@ -20,21 +25,140 @@ from ..bot import Bot
 from .. import consts
 from ..utils import (
     register_cog,
-    fmt_datetime
+    word_diff,
+    is_owner_or_admin,
+    sql_utils
 )
 from ..converters import MemberOrUserConverter
-from ..helpers import PartialAuditLogEntry
+from ..helpers import (
+    PartialAuditLogEntry,
+    LogEventQueue,
+    JoinRateTracker,
+    CompactMessage
+)
 
 
 _cogs = set()
 
+logger = logging.getLogger(__name__)
+
+# Priorities of log events, lower is more important
+PRIORITY_MODERATION = 0
+PRIORITY_MEMBERS = 1
+PRIORITY_MESSAGES = 2
+PRIORITY_NAMES = ("moderation", "member", "message")
+
+# Log event categories, each can be routed to its own channel or disabled
+LOG_MESSAGES = 1 << 0
+LOG_MEMBERS = 1 << 1
+LOG_MODERATION = 1 << 2
+LOG_THREADS = 1 << 3
+# Map category name -> (category, guild config column with its channel)
+# NOTE: NULL in the column means fall back to log_channel, 0 means the category is disabled
+LOG_CATEGORIES = {
+    "messages": (LOG_MESSAGES, "log_messages_channel"),
+    "members": (LOG_MEMBERS, "log_members_channel"),
+    "moderation": (LOG_MODERATION, "log_moderation_channel"),
+    "threads": (LOG_THREADS, "log_threads_channel")
+}
+
+DEF_LOG_QUEUE_SIZE = 100
+DEF_LOG_QUEUE_POLICY = LogEventQueue.POLICY_SUMMARIZE
+
+# Raid mode: this many joins within the window switches join/leave logs to summaries
+RAID_WINDOW = 10.0
+RAID_JOIN_THRESHOLD = 10
+RAID_SUMMARY_INTERVAL = 30.0
+# Upper bounds (exclusive) of the account age histogram buckets
+ACCOUNT_AGE_BUCKETS = (
+    ("< 1 hour", datetime.timedelta(hours=1)),
+    ("< 1 day", datetime.timedelta(days=1)),
+    ("< 1 week", datetime.timedelta(weeks=1)),
+    ("< 1 month", datetime.timedelta(days=30)),
+    ("< 1 year", datetime.timedelta(days=365)),
+    ("1 year+", datetime.timedelta.max)
+)
+
+
+class _LogRoutes():
+    """
+    Compiled log routing of a guild
+    """
+    __slots__ = ("mask", "channels")
+
+    def __init__(self, mask: int = 0, channels: Optional[Dict[int, discord.TextChannel]] = None) -> None:
+        """
+        Constructor
+
+        IN:
+            mask - bitmask of the enabled categories
+            channels - map category -> log channel for the enabled categories
+        """
+        self.mask = mask
+        self.channels = channels if channels is not None else dict()
+
+# Shared routes for guilds with logging fully disabled
+_NO_LOG_ROUTES = _LogRoutes()
+
+
+class _RaidBuffer():
+    """
+    Accumulates joins and leaves during raid mode
+    """
+    __slots__ = ("log_channel", "joins", "leaves")
+
+    def __init__(self, log_channel: discord.TextChannel) -> None:
+        """
+        Constructor
+
+        IN:
+            log_channel - the channel to send summaries to
+        """
+        self.log_channel = log_channel
+        # Lists of (user id, account creation datetime)
+        self.joins: List[Tuple[int, datetime.datetime]] = list()
+        self.leaves: List[Tuple[int, datetime.datetime]] = list()
+
 
 class _LogEmbedBuilder():
     """
     A namespace for embed building methods
+    NOTE: message embeds track their length as they are built instead of calling len(embed)
     """
+    # Footers only differ in milliseconds within a second, so we cache the rest
+    _FOOTER_FMT = consts.TIME_FMT.rpartition(":")[0]
+    _footer_cache: Tuple[int, str] = (-1, "")
+    _MSG_BASE_NAMES_LEN = sum(map(len, ("User:", "User ID:", "Channel:", "Message ID:")))
+
     @staticmethod
-    def _validate_field(embed_len: int, field_name: str, field_value: str, placeholder: str = "[...]") -> Tuple[str]:
+    def _shorten(text: str, width: int, placeholder: str = "[...]") -> str:
+        """
+        Shortens the text to the given width, cutting at a word boundary when possible
+        NOTE: unlike textwrap.shorten this doesn't collapse whitespace and returns short strings as is
+
+        IN:
+            text - the text to shorten
+            width - the maximum length
+            placeholder - the placeholder for the cut part of the string
+                (Default: "[...]")
+
+        OUT:
+            str
+        """
+        if len(text) <= width:
+            return text
+
+        cut = width - len(placeholder)
+        text = text[:cut]
+        # Don't cut words in half unless it's one giant word
+        space = text.rfind(" ", cut // 2)
+        if space != -1:
+            text = text[:space]
+
+        return text.rstrip() + placeholder
+
+    @classmethod
+    def _validate_field(cls, embed_len: int, field_name: str, field_value: str, placeholder: str = "[...]") -> Tuple[str]:
         """
         Validates that the given name and value are within discord embed limits
         Shorten them if needed
@@ -50,167 +174,379 @@ class _LogEmbedBuilder():
         """
         name_len = len(field_name)
         if name_len > consts.EMB_NAME_LIMIT:
-            field_name = shorten_text(field_name, width=consts.EMB_NAME_LIMIT, placeholder=placeholder)
+            field_name = cls._shorten(field_name, consts.EMB_NAME_LIMIT, placeholder)
             name_len = len(field_name)
 
         value_len = len(field_value)
         if value_len > consts.EMB_VALUE_LIMIT:
-            field_value = shorten_text(field_value, width=consts.EMB_VALUE_LIMIT, placeholder=placeholder)
+            field_value = cls._shorten(field_value, consts.EMB_VALUE_LIMIT, placeholder)
             value_len = len(field_value)
 
         limit = consts.EMB_TOTAL_LIMIT - (embed_len + name_len)
         if value_len > limit:
             if limit < 0 or limit < len(placeholder):
                 raise ValueError("Can't fit another field in the embed.")
-            field_value = shorten_text(field_value, width=limit, placeholder=placeholder)
+            field_value = cls._shorten(field_value, limit, placeholder)
 
         return field_name, field_value
 
-    @staticmethod
-    def _get_base_embed(title: str) -> discord.Embed:
+    @classmethod
+    def _add_field(cls, embed: discord.Embed, embed_len: int, field_name: str, field_value: str) -> int:
+        """
+        Validates and adds a field to the embed
+
+        IN:
+            embed - the embed
+            embed_len - current len of the embed
+            field_name - the field name
+            field_value - the field value
+
+        OUT:
+            int, the new len of the embed
+        """
+        field_name, field_value = cls._validate_field(embed_len, field_name, field_value)
+        embed.add_field(name=field_name, value=field_value, inline=False)
+        return embed_len + len(field_name) + len(field_value)
+
+    @classmethod
+    def _get_footer_text(cls) -> str:
+        """
+        Returns the current time formatted for embed footers
+        NOTE: same as fmt_datetime(utcnow()), but only calls strftime once a second
+        """
+        now = time.time()
+        second = int(now)
+        cached_second, prefix = cls._footer_cache
+        if second != cached_second:
+            prefix = datetime.datetime.fromtimestamp(second, datetime.timezone.utc).strftime(cls._FOOTER_FMT)
+            cls._footer_cache = (second, prefix)
+
+        return f"{prefix}:{int((now - second) * 1000):03d}"
+
+    @classmethod
+    def _get_base_embed(cls, title: str) -> discord.Embed:
         """
         Builds a base embed for all logs
         """
         return (
             discord.Embed(title=f"Log: {title}")
-            .set_footer(text=fmt_datetime(utcnow()))
+            .set_footer(text=cls._get_footer_text())
         )
 
+    @classmethod
+    def _get_base_msg_embed_from_parts(
+        cls,
+        title: str,
+        avatar_url: Optional[str],
+        user_mention: str,
+        user_id: int,
+        channel_mention: str,
+        message_id: int,
+        jump_url: str
+    ) -> Tuple[discord.Embed, int]:
+        """
+        Builds a base embed for msg logs
+
+        OUT:
+            tuple of the embed and its len
+        """
+        title = f"Log: {title}"
+        footer = cls._get_footer_text()
+        user_id = f"{user_id}"
+        message_id = f"[{message_id}]({jump_url} 'Click to jump to the message')"
+
+        embed = discord.Embed(title=title).set_footer(text=footer)
+        if avatar_url is not None:
+            embed.set_thumbnail(url=avatar_url)
+
+        (
+            embed
+            .add_field(name="User:", value=user_mention, inline=False)
+            .add_field(name="User ID:", value=user_id, inline=False)
+            # .add_field(name=consts.EMPTY_EMBED_VALUE, value=consts.EMPTY_EMBED_VALUE, inline=False)
+            .add_field(name="Channel:", value=channel_mention, inline=False)
+            .add_field(name="Message ID:", value=message_id, inline=False)
+        )
+        embed_len = (
+            len(title)
+            + len(footer)
+            + cls._MSG_BASE_NAMES_LEN
+            + len(user_mention)
+            + len(user_id)
+            + len(channel_mention)
+            + len(message_id)
+        )
+        return embed, embed_len
+
     @classmethod
     def _get_base_msg_embed(
         cls,
         title: str,
         message: discord.Message
-    ) -> discord.Embed:
+    ) -> Tuple[discord.Embed, int]:
         """
         Builds a base embed for msg logs
+
+        OUT:
+            tuple of the embed and its len
         """
         member = message.author
-        channel = message.channel
-        return (
-            cls._get_base_embed(title)
-            .set_thumbnail(url=member.avatar.url)
-            .add_field(name="User:", value=member.mention, inline=False)
-            .add_field(name="User ID:", value=f"{member.id}", inline=False)
-            # .add_field(name=consts.EMPTY_EMBED_VALUE, value=consts.EMPTY_EMBED_VALUE, inline=False)
-            .add_field(name="Channel:", value=channel.mention, inline=False)
-            .add_field(name="Message ID:", value=f"[{message.id}]({message.jump_url} 'Click to jump to the message')", inline=False)
+        return cls._get_base_msg_embed_from_parts(
+            title,
+            member.avatar.url,
+            member.mention,
+            member.id,
+            message.channel.mention,
+            message.id,
+            message.jump_url
         )
 
     @classmethod
-    def get_msg_edit_embed(
+    def _get_base_cached_msg_embed(
         cls,
-        old_message: discord.Message,
-        new_message: discord.Message
-    ) -> Optional[discord.Embed]:
+        title: str,
+        guild: discord.Guild,
+        message: CompactMessage
+    ) -> Tuple[discord.Embed, int]:
         """
-        Builds an embed for msg edit logs
+        Builds a base embed for msg logs using a message from our own store
+
+        OUT:
+            tuple of the embed and its len
+        """
+        author_id = message.author_id
+        channel_id = message.channel_id
+        member = guild.get_member(author_id)
+
+        return cls._get_base_msg_embed_from_parts(
+            title,
+            member.avatar.url if member is not None else None,
+            f"<@{author_id}>",
+            author_id,
+            f"<#{channel_id}>",
+            message.id,
+            f"https://discord.com/channels/{guild.id}/{channel_id}/{message.id}"
+        )
+
+    @classmethod
+    def _add_msg_edit_fields(
+        cls,
+        embed: discord.Embed,
+        embed_len: int,
+        old_content: str,
+        new_content: str,
+        old_attachments: Tuple[str, ...],
+        new_attachments: Tuple[str, ...]
+    ) -> bool:
+        """
+        Adds fields describing a msg edit to the embed
 
         IN:
-            old_message - the original msg
-            new_message - the new msg
+            embed - the embed to add the fields to
+            embed_len - current len of the embed
+            old_content - the original msg content
+            new_content - the new msg content
+            old_attachments - urls of the original msg attachments
+            new_attachments - urls of the new msg attachments
 
         OUT:
-            Embed or None
+            boolean whether or not anything has changed
         """
-        embed = cls._get_base_msg_embed("Message Edited", old_message)
-        old_content = old_message.content
-        new_content = new_message.content
-        old_attachments = set(old_message.attachments)
-        new_attachments = set(new_message.attachments)
         is_valid_embed = False
 
         if old_content != new_content:
             is_valid_embed = True
-            old_content_field = "Old content:"
-            new_content_field = "New content:"
-            embed_len = len(embed)
-            old_content_field, old_content = cls._validate_field(embed_len, old_content_field, old_content)
-            # This may happen if someone added a text to a message with just an attachment
-            if old_content:
-                embed.add_field(name=old_content_field, value=old_content, inline=False)
-
-            embed_len = len(embed)
-            new_content_field, new_content = cls._validate_field(embed_len, new_content_field, new_content)
-            # Or removed text, I guess?
-            if not new_content:
-                new_content = consts.ZERO_WIDTH_CHAR
-
-            embed.add_field(name=new_content_field, value=new_content, inline=False)
+            # Only show what has changed, the full message is behind the jump link
+            # Whitespace only edits have no changed words to mark, so they get the full contents
+            changes = ""
+            if old_content and new_content and old_content.split() != new_content.split():
+                changes = word_diff(old_content, new_content)
+
+            if changes:
+                embed_len = cls._add_field(embed, embed_len, "Changes:", changes)
+
+            else:
+                # This may happen if someone added a text to a message with just an attachment
+                if old_content.strip():
+                    embed_len = cls._add_field(embed, embed_len, "Old content:", old_content)
+
+                # Or removed text, I guess?
+                if not new_content.strip():
+                    new_content = consts.ZERO_WIDTH_CHAR
+
+                embed_len = cls._add_field(embed, embed_len, "New content:", new_content)
 
         if old_attachments != new_attachments:
-            is_valid_embed = True
-            fields_data = (
-                # For removed attachments
-                {
-                    "files": tuple(old_attachments - new_attachments),
-                    "field_names": ("Removed image:", "Removed multiple images:")
-                },
-                # For added attachments
-                {
-                    "files": tuple(new_attachments - old_attachments),
-                    "field_names": ("Added image:", "Added multiple images:")
-                }
-            )
-            for data in fields_data:
-                files = data["files"]
-                if len(files) > 0:
+            old_attachments = set(old_attachments)
+            new_attachments = set(new_attachments)
+            if old_attachments != new_attachments:
+                is_valid_embed = True
+                fields_data = (
+                    # For removed attachments
+                    (tuple(old_attachments - new_attachments), "Removed image:", "Removed multiple images:"),
+                    # For added attachments
+                    (tuple(new_attachments - old_attachments), "Added image:", "Added multiple images:")
+                )
+                for files, single_field_name, multi_field_name in fields_data:
                     if len(files) == 1:
                         # If there's a single img, we attach it
-                        field_name = data["field_names"][0]
-                        img_url = files[0].proxy_url
-                        embed.add_field(name=field_name, value=consts.ZERO_WIDTH_CHAR, inline=False)
-                        embed.set_image(url=img_url)
+                        embed_len = cls._add_field(embed, embed_len, single_field_name, consts.ZERO_WIDTH_CHAR)
+                        embed.set_image(url=files[0])
 
-                    else:
+                    elif len(files) > 1:
                         # If there's multiple imgs, we just send their urls
-                        field_name = data["field_names"][1]
-                        imgs_links = "\n".join((f.proxy_url for f in files))
-                        embed_len = len(embed)
-                        field_name, imgs_links = cls._validate_field(embed_len, field_name, imgs_links)
-                        embed.add_field(name=field_name, value=imgs_links, inline=False)
+                        embed_len = cls._add_field(embed, embed_len, multi_field_name, "\n".join(files))
+
+        return is_valid_embed
 
+    @classmethod
+    def get_msg_edit_embed(
+        cls,
+        old_message: discord.Message,
+        new_message: discord.Message
+    ) -> Optional[discord.Embed]:
+        """
+        Builds an embed for msg edit logs
+
+        IN:
+            old_message - the original msg
+            new_message - the new msg
+
+        OUT:
+            Embed or None
+        """
+        embed, embed_len = cls._get_base_msg_embed("Message Edited", old_message)
+        is_valid_embed = cls._add_msg_edit_fields(
+            embed,
+            embed_len,
+            old_message.content,
+            new_message.content,
+            tuple(a.proxy_url for a in old_message.attachments),
+            tuple(a.proxy_url for a in new_message.attachments)
+        )
         return embed if is_valid_embed else None
 
     @classmethod
-    def get_msg_del_embed(cls, message: discord.Message) -> Optional[discord.Embed]:
+    def get_cached_msg_edit_embed(
+        cls,
+        guild: discord.Guild,
+        old_message: CompactMessage,
+        new_message: CompactMessage
+    ) -> Optional[discord.Embed]:
         """
-        Builds an embed for msg deletion logs
+        Builds an embed for msg edit logs using messages from our own store
 
         IN:
-            message - the deleted msg
+            guild - the guild
+            old_message - the original msg
+            new_message - the new msg
 
         OUT:
             Embed or None
         """
-        embed = cls._get_base_msg_embed("Message Deleted", message)
-        embed_len = len(embed)
-        content = message.content
-        attachments = message.attachments
+        embed, embed_len = cls._get_base_cached_msg_embed("Message Edited", guild, old_message)
+        is_valid_embed = cls._add_msg_edit_fields(
+            embed,
+            embed_len,
+            old_message.content,
+            new_message.content,
+            old_message.attachments,
+            new_message.attachments
+        )
+        return embed if is_valid_embed else None
+
+    @classmethod
+    def _add_msg_del_fields(cls, embed: discord.Embed, embed_len: int, content: str, attachments: Tuple[str, ...]) -> bool:
+        """
+        Adds fields describing a deleted msg to the embed
+
+        IN:
+            embed - the embed to add the fields to
+            embed_len - current len of the embed
+            content - the msg content
+            attachments - urls of the msg attachments
+
+        OUT:
+            boolean whether or not the msg had anything to log
+        """
         is_valid_embed = False
 
         if content:
             is_valid_embed = True
-            field_name = "Content:"
-            field_name, content = cls._validate_field(embed_len, field_name, content)
-            embed.add_field(name=field_name, value=content, inline=False)
+            embed_len = cls._add_field(embed, embed_len, "Content:", content)
 
         if len(attachments) > 0:
             is_valid_embed = True
             if len(attachments) == 1:
-                field_name = "Attachment:"
-                embed.add_field(name=field_name, value=consts.ZERO_WIDTH_CHAR, inline=False)
-                embed.set_image(url=attachments[0].proxy_url)
+                embed_len = cls._add_field(embed, embed_len, "Attachment:", consts.ZERO_WIDTH_CHAR)
+                embed.set_image(url=attachments[0])
 
             else:
-                embed_len = len(embed)
-                field_name = "Attachments:"
-                imgs_links = "\n".join((f.proxy_url for f in attachments))
-                field_name, imgs_links = cls._validate_field(embed_len, field_name, imgs_links)
-                embed.add_field(name=field_name, value=imgs_links, inline=False)
+                embed_len = cls._add_field(embed, embed_len, "Attachments:", "\n".join(attachments))
+
+        return is_valid_embed
 
+    @classmethod
+    def get_msg_del_embed(cls, message: discord.Message) -> Optional[discord.Embed]:
+        """
+        Builds an embed for msg deletion logs
+
+        IN:
+            message - the deleted msg
+
+        OUT:
+            Embed or None
+        """
+        embed, embed_len = cls._get_base_msg_embed("Message Deleted", message)
+        is_valid_embed = cls._add_msg_del_fields(
+            embed,
+            embed_len,
+            message.content,
+            tuple(a.proxy_url for a in message.attachments)
+        )
+        return embed if is_valid_embed else None
+
+    @classmethod
+    def get_cached_msg_del_embed(cls, guild: discord.Guild, message: CompactMessage) -> Optional[discord.Embed]:
+        """
+        Builds an embed for msg deletion logs using a message from our own store
+
+        IN:
+            guild - the guild
+            message - the deleted msg
+
+        OUT:
+            Embed or None
+        """
+        embed, embed_len = cls._get_base_cached_msg_embed("Message Deleted", guild, message)
+        is_valid_embed = cls._add_msg_del_fields(embed, embed_len, message.content, message.attachments)
         return embed if is_valid_embed else None
 
+    @classmethod
+    def get_bulk_msg_del_embed(cls, channel_id: int, total: int, messages: List[Tuple[int, str]]) -> discord.Embed:
+        """
+        Builds an embed for bulk msg deletion logs
+
+        IN:
+            channel_id - the id of the channel
+            total - total number of deleted msgs
+            messages - list of tuples (author id, content) for the msgs we know about
+        """
+        embed = (
+            cls._get_base_embed("Messages Bulk Deleted")
+            .add_field(name="Channel:", value=f"<#{channel_id}>", inline=False)
+            .add_field(name="Count:", value=f"{total}", inline=False)
+        )
+        if messages:
+            lines = "\n".join(
+                f"<@{author_id}>: {cls._shorten(' '.join(content.split()), 100) or '[attachment]'}"
+                for author_id, content in messages
+            )
+            field_name, lines = cls._validate_field(len(embed), "Known messages:", lines)
+            embed.add_field(name=field_name, value=lines, inline=False)
+
+        return embed
+
     @classmethod
     def _get_user_join_left_embed(cls, title: str, member: discord.Member) -> discord.Embed:
         """
@@ -237,6 +573,41 @@ class _LogEmbedBuilder():
         """
         return cls._get_user_join_left_embed("User Has Left", member)
 
+    @classmethod
+    def get_raid_summary_embed(cls, title: str, members: List[Tuple[int, datetime.datetime]]) -> discord.Embed:
+        """
+        Builds an embed summarising joins/leaves during raid mode
+
+        IN:
+            title - the embed title
+            members - list of tuples (user id, account creation datetime)
+        """
+        now = utcnow()
+        histogram = [0] * len(ACCOUNT_AGE_BUCKETS)
+        for user_id, created_at in members:
+            age = now - created_at
+            for i, (bucket_name, bucket_limit) in enumerate(ACCOUNT_AGE_BUCKETS):
+                if age < bucket_limit:
+                    histogram[i] += 1
+                    break
+
+        age_lines = "\n".join(
+            f"- {bucket_name}: {amount}"
+            for (bucket_name, bucket_limit), amount in zip(ACCOUNT_AGE_BUCKETS, histogram)
+            if amount
+        )
+
+        embed = (
+            cls._get_base_embed(title)
+            .add_field(name="Count:", value=f"{len(members)}", inline=False)
+            .add_field(name="Account age:", value=age_lines, inline=False)
+        )
+        embed_len = len(embed)
+        field_name, ids = cls._validate_field(embed_len, "User IDs:", "\n".join(str(user_id) for user_id, created_at in members))
+        embed.add_field(name=field_name, value=ids, inline=False)
+
+        return embed
+
     @classmethod
     def _get_mod_action_embed(
         cls,
@@ -261,7 +632,7 @@ class _LogEmbedBuilder():
             if log_entry.reason:
                 reason = log_entry.reason
 
-        reason = shorten_text(reason, width=consts.EMB_VALUE_LIMIT, placeholder="[...]")
+        reason = cls._shorten(reason, consts.EMB_VALUE_LIMIT)
 
         return (
             cls._get_base_embed(title)
@@ -272,18 +643,26 @@ class _LogEmbedBuilder():
         )
 
     @classmethod
-    def get_warn_embed(cls, member: discord.Member, log_entry: PartialAuditLogEntry) -> discord.Embed:
+    def get_warn_embed(cls, member: discord.Member, log_entry: PartialAuditLogEntry, warnings: Optional[int] = None) -> discord.Embed:
         """
         Builds an embed for warn event
         """
-        return cls._get_mod_action_embed("User Has Been Warned", member, log_entry)
+        embed = cls._get_mod_action_embed("User Has Been Warned", member, log_entry)
+        if warnings is not None:
+            embed.add_field(name="Warnings:", value=str(warnings), inline=False)
+
+        return embed
 
     @classmethod
-    def get_unwarn_embed(cls, member: discord.Member, log_entry: PartialAuditLogEntry) -> discord.Embed:
+    def get_unwarn_embed(cls, member: discord.Member, log_entry: PartialAuditLogEntry, warnings: Optional[int] = None) -> discord.Embed:
         """
         Builds an embed for unwarn event
         """
-        return cls._get_mod_action_embed("User Has Been Unwarned", member, log_entry)
+        embed = cls._get_mod_action_embed("User Has Been Unwarned", member, log_entry)
+        if warnings is not None:
+            embed.add_field(name="Warnings:", value=str(warnings), inline=False)
+
+        return embed
 
     @classmethod
     def get_kick_embed(cls, member: discord.Member, log_entry: discord.AuditLogEntry) -> discord.Embed:
@@ -306,6 +685,32 @@ class _LogEmbedBuilder():
         """
         return cls._get_mod_action_embed("User Has Been Unbanned", member, log_entry)
 
+    @classmethod
+    def get_mass_action_embed(
+        cls,
+        action: str,
+        targets: List[Union[discord.Member, discord.Object]],
+        log_entry: PartialAuditLogEntry
+    ) -> discord.Embed:
+        """
+        Builds one embed for a mass ban/kick
+
+        IN:
+            action - the action name ('ban' or 'kick')
+            targets - the members who were banned/kicked
+            log_entry - the entry with the moderator and reason
+        """
+        moderator = log_entry.user.mention
+        reason = cls._shorten(log_entry.reason or "Unknown", consts.EMB_VALUE_LIMIT)
+        users = cls._shorten(" ".join(f"<@{target.id}>" for target in targets), consts.EMB_VALUE_LIMIT)
+
+        return (
+            cls._get_base_embed(f"Mass {action.capitalize()}: {len(targets)} Users")
+            .add_field(name="By:", value=moderator, inline=False)
+            .add_field(name="With Reason:", value=reason, inline=False)
+            .add_field(name="Users:", value=users, inline=False)
+        )
+
     @classmethod
     def _get_base_thread_embed(
         cls,
@@ -336,6 +741,24 @@ class _LogEmbedBuilder():
         """
         return cls._get_base_thread_embed("Thread deleted", thread)
 
+    @classmethod
+    def get_skipped_events_embed(cls, summary: List[int]) -> discord.Embed:
+        """
+        Builds an embed for log events that were skipped due to a full log queue
+
+        IN:
+            summary - list with the number of skipped events per priority
+        """
+        lines = [
+            f"- {PRIORITY_NAMES[priority].capitalize()} events: {amount}"
+            for priority, amount in enumerate(summary)
+            if amount
+        ]
+        return (
+            cls._get_base_embed("Events Skipped")
+            .add_field(name="Skipped due to high load:", value="\n".join(lines), inline=False)
+        )
+
 
 @register_cog(_cogs)
 class Logger(commands.Cog, command_attrs=dict(hidden=True)):
@@ -351,10 +774,310 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
         """
         self.bot = bot
 
-    # @commands.Cog.listener(name="on_raw_message_edit")
-    # async def on_raw_message_edit(self, payload):
-    #     from pprint import pprint
-    #     pprint(payload.data)
+        config = bot.config
+        self.log_queue_size: int = config.log_queue_size or DEF_LOG_QUEUE_SIZE
+        self.log_queue_policy: str = config.log_queue_policy or DEF_LOG_QUEUE_POLICY
+        self.log_queues: Dict[int, LogEventQueue] = dict()
+        self._log_workers: Dict[int, asyncio.Task] = dict()
+
+        self.join_tracker = JoinRateTracker(RAID_WINDOW, RAID_JOIN_THRESHOLD)
+        self._raid_buffers: Dict[int, _RaidBuffer] = dict()
+        self._raid_flushers: Dict[int, asyncio.Task] = dict()
+
+        # Map guild id -> compiled log routes
+        self._log_routes: Dict[int, _LogRoutes] = dict()
+
+    def cog_unload(self) -> None:
+        """
+        Callback on cog unloading, stops log delivery
+        """
+        for task in (*self._log_workers.values(), *self._raid_flushers.values()):
+            task.cancel()
+        self._log_workers.clear()
+        self._raid_flushers.clear()
+        self._raid_buffers.clear()
+        self.log_queues.clear()
+        self.join_tracker.clear()
+        self._log_routes.clear()
+
+    def get_queue_stats(self) -> Tuple[int, int, int]:
+        """
+        Returns totals for all log queues
+
+        OUT:
+            tuple of pending, dropped and summarized events
+        """
+        pending = dropped = summarized = 0
+        for queue in self.log_queues.values():
+            pending += len(queue)
+            dropped += queue.dropped
+            summarized += queue.summarized
+
+        return pending, dropped, summarized
+
+    def _compile_log_routes(self, guild: discord.Guild) -> _LogRoutes:
+        """
+        Builds and caches the log routes of a guild from its config
+
+        IN:
+            guild - the guild
+
+        OUT:
+            the compiled routes
+        """
+        guild_config = self.bot.guilds_configs.get(guild.id)
+        if guild_config is None:
+            routes = _NO_LOG_ROUTES
+
+        else:
+            default_channel_id: Optional[int] = guild_config.log_channel
+            mask = 0
+            channels = dict()
+            for category, column in LOG_CATEGORIES.values():
+                channel_id: Optional[int] = guild_config.get(column)
+                if channel_id is None:
+                    channel_id = default_channel_id
+                # 0 disables the category
+                if not channel_id:
+                    continue
+
+                channel = guild.get_channel(channel_id)
+                if channel is not None:
+                    mask |= category
+                    channels[category] = channel
+
+            routes = _LogRoutes(mask, channels) if mask else _NO_LOG_ROUTES
+
+        # We only store messages for guilds that log them
+        if not routes.mask & LOG_MESSAGES:
+            self.bot.message_store.remove_guild(guild.id)
+
+        self._log_routes[guild.id] = routes
+        return routes
+
+    def _get_log_channel(self, guild: discord.Guild, category: int) -> Optional[discord.TextChannel]:
+        """
+        Returns the log channel for a category of events in a guild
+
+        IN:
+            guild - the guild
+            category - the category of the event
+
+        OUT:
+            the log channel or None if logging of this category is disabled in this guild
+        """
+        try:
+            routes = self._log_routes[guild.id]
+
+        except KeyError:
+            routes = self._compile_log_routes(guild)
+
+        if not routes.mask & category:
+            return None
+
+        return routes.channels[category]
+
+    def invalidate_log_routes(self, guild_id: Optional[int] = None) -> None:
+        """
+        Drops the compiled log routes so they are built again on the next event
+
+        IN:
+            guild_id - the id of the guild to invalidate the routes for,
+                if None, invalidates all guilds
+                (Default: None)
+        """
+        if guild_id is None:
+            self._log_routes.clear()
+
+        else:
+            self._log_routes.pop(guild_id, None)
+
+    def submit_log(self, guild: discord.Guild, log_channel: discord.TextChannel, embed: discord.Embed, priority: int) -> None:
+        """
+        Adds a log embed to the guild log queue, starts delivery if needed
+
+        IN:
+            guild - the guild the event happened in
+            log_channel - the channel to send the embed to
+            embed - the embed
+            priority - the event priority
+        """
+        guild_id = guild.id
+        queue = self.log_queues.get(guild_id, None)
+        if queue is None:
+            queue = LogEventQueue(self.log_queue_size, policy=self.log_queue_policy)
+            self.log_queues[guild_id] = queue
+
+        queue.put_nowait((log_channel, embed), priority)
+
+        if guild_id not in self._log_workers:
+            self._log_workers[guild_id] = asyncio.create_task(self._deliver_logs(guild_id, queue))
+
+    async def _deliver_logs(self, guild_id: int, queue: LogEventQueue) -> None:
+        """
+        Sends queued log embeds one by one until the queue is empty
+        NOTE: runs as a task, one per guild
+
+        IN:
+            guild_id - the guild id
+            queue - the guild log queue
+        """
+        try:
+            while queue:
+                log_channel, embed = queue.get_nowait()
+                await self._send_log(log_channel, embed)
+
+                summary = queue.pop_summary()
+                if any(summary):
+                    await self._send_log(log_channel, _LogEmbedBuilder.get_skipped_events_embed(summary))
+
+        finally:
+            # NOTE: no awaits between the last check and this, so we can't miss new items
+            if self._log_workers.get(guild_id, None) is asyncio.current_task():
+                del self._log_workers[guild_id]
+
+    async def _send_log(self, log_channel: discord.TextChannel, embed: discord.Embed) -> None:
+        """
+        Sends a log embed, errors are logged and suppressed so the delivery can continue
+        NOTE: discord.py re-raises network errors after its retries, those are suppressed too
+
+        IN:
+            log_channel - the channel to send the embed to
+            embed - the embed
+        """
+        try:
+            await log_channel.send(embed=embed)
+
+        except (discord.HTTPException, OSError, aiohttp.ClientError) as e:
+            logger.warning(f"Failed to send a log to the channel {log_channel.id}: {repr(e)}")
+
+    def _buffer_raid_event(self, guild: discord.Guild, log_channel: discord.TextChannel, member: discord.Member, joined: bool) -> None:
+        """
+        Adds a join/leave to the guild raid buffer, starts summary flushing if needed
+
+        IN:
+            guild - the guild
+            log_channel - the channel to send summaries to
+            member - the member who joined or left
+            joined - True for joins, False for leaves
+        """
+        guild_id = guild.id
+        buffer = self._raid_buffers.get(guild_id, None)
+        if buffer is None:
+            buffer = self._raid_buffers[guild_id] = _RaidBuffer(log_channel)
+            self._raid_flushers[guild_id] = asyncio.create_task(self._flush_raid_summaries(guild, buffer))
+
+        buffer.log_channel = log_channel
+        data = (member.id, member.created_at)
+        if joined:
+            buffer.joins.append(data)
+
+        else:
+            buffer.leaves.append(data)
+
+    async def _flush_raid_summaries(self, guild: discord.Guild, buffer: _RaidBuffer) -> None:
+        """
+        Periodically submits summaries of the raid buffer until the raid is over
+        NOTE: runs as a task, one per guild in raid mode
+
+        IN:
+            guild - the guild
+            buffer - the guild raid buffer
+        """
+        guild_id = guild.id
+        try:
+            while True:
+                await asyncio.sleep(RAID_SUMMARY_INTERVAL)
+
+                if buffer.joins:
+                    embed = _LogEmbedBuilder.get_raid_summary_embed("Users Have Joined (Raid Mode)", buffer.joins)
+                    self.submit_log(guild, buffer.log_channel, embed, PRIORITY_MEMBERS)
+                    buffer.joins = list()
+
+                if buffer.leaves:
+                    embed = _LogEmbedBuilder.get_raid_summary_embed("Users Have Left (Raid Mode)", buffer.leaves)
+                    self.submit_log(guild, buffer.log_channel, embed, PRIORITY_MEMBERS)
+                    buffer.leaves = list()
+
+                if not self.join_tracker.is_raid(guild_id, time.monotonic()):
+                    break
+
+        finally:
+            if self._raid_flushers.get(guild_id, None) is asyncio.current_task():
+                del self._raid_flushers[guild_id]
+                del self._raid_buffers[guild_id]
+
+    @commands.Cog.listener(name="on_guild_config_update")
+    async def on_guild_config_update(self, guild_id: Optional[int]) -> None:
+        """
+        Callback on guild config changes
+        NOTE: custom event
+
+        IN:
+            guild_id - the id of the guild whose config has changed, None if all configs were reloaded
+        """
+        self.invalidate_log_routes(guild_id)
+
+    @commands.Cog.listener(name="on_guild_channel_delete")
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        """
+        Callback on channel deletion
+
+        IN:
+            channel - the deleted channel
+        """
+        self.invalidate_log_routes(channel.guild.id)
+
+    @commands.Cog.listener(name="on_guild_channel_update")
+    async def on_guild_channel_update(self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel) -> None:
+        """
+        Callback on channel updates, a channel that changed its type is a new object
+
+        IN:
+            before - the channel before the update
+            after - the channel after the update
+        """
+        self.invalidate_log_routes(after.guild.id)
+
+    @commands.Cog.listener(name="on_guild_available")
+    async def on_guild_available(self, guild: discord.Guild) -> None:
+        """
+        Callback when a guild becomes available after an outage, its channels are new objects now
+
+        IN:
+            guild - the guild
+        """
+        self.invalidate_log_routes(guild.id)
+
+    @commands.Cog.listener(name="on_guild_remove")
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """
+        Callback when the bot leaves/gets kicked from a guild
+
+        IN:
+            guild - the guild
+        """
+        self.invalidate_log_routes(guild.id)
+
+    @commands.Cog.listener(name="on_message")
+    async def on_message(self, message: discord.Message) -> None:
+        """
+        Callback on new messages, adds them to the message store for edit and delete logs
+
+        IN:
+            message - the message
+        """
+        if message.author.bot:
+            return
+
+        guild: discord.Guild = message.guild
+        if guild is None:
+            return
+
+        if self._get_log_channel(guild, LOG_MESSAGES) is None:
+            return
+
+        self.bot.message_store.add(guild.id, CompactMessage.from_message(message))
 
     @commands.Cog.listener(name="on_message_edit")
     async def on_message_edit(self, before: discord.Message, after: discord.Message) -> None:
@@ -374,15 +1097,46 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
         if guild is None:
             return
 
-        log_channel = self.bot.guilds_configs[guild.id].log_channel
-        # No log channel means logging is disabled
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MESSAGES)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_msg_edit_embed(before, after)
         if embed is not None:
-            await log_channel.send(embed=embed)
+            self.submit_log(guild, log_channel, embed, PRIORITY_MESSAGES)
+
+    @commands.Cog.listener(name="on_cached_message_edit")
+    async def on_cached_message_edit(
+        self,
+        payload: discord.RawMessageUpdateEvent,
+        before: CompactMessage,
+        after: CompactMessage
+    ) -> None:
+        """
+        Callback on message editing, logs edits of messages that aren't in the discord.py cache,
+        but are in our message store
+        NOTE: custom event
+
+        IN:
+            payload - the raw event payload
+            before - the message before edit
+            after - the message after edit
+        """
+        # discord.py has the message, on_message_edit will log it
+        if payload.cached_message is not None:
+            return
+
+        guild: Optional[discord.Guild] = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+
+        log_channel = self._get_log_channel(guild, LOG_MESSAGES)
+        if log_channel is None:
+            return
+
+        embed = _LogEmbedBuilder.get_cached_msg_edit_embed(guild, before, after)
+        if embed is not None:
+            self.submit_log(guild, log_channel, embed, PRIORITY_MESSAGES)
 
     @commands.Cog.listener(name="on_message_delete")
     async def on_message_delete(self, message: discord.Message) -> None:
@@ -399,14 +1153,72 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
         if guild is None:
             return
 
-        log_channel = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MESSAGES)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_msg_del_embed(message)
         if embed is not None:
-            await log_channel.send(embed=embed)
+            self.submit_log(guild, log_channel, embed, PRIORITY_MESSAGES)
+
+    @commands.Cog.listener(name="on_cached_message_delete")
+    async def on_cached_message_delete(self, payload: discord.RawMessageDeleteEvent, message: CompactMessage) -> None:
+        """
+        Callback on message deleting, logs messages that aren't in the discord.py cache,
+        but are in our message store
+        NOTE: custom event
+
+        IN:
+            payload - the raw event payload
+            message - the deleted message
+        """
+        # discord.py has the message, on_message_delete will log it
+        if payload.cached_message is not None:
+            return
+
+        guild: Optional[discord.Guild] = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+
+        log_channel = self._get_log_channel(guild, LOG_MESSAGES)
+        if log_channel is None:
+            return
+
+        embed = _LogEmbedBuilder.get_cached_msg_del_embed(guild, message)
+        if embed is not None:
+            self.submit_log(guild, log_channel, embed, PRIORITY_MESSAGES)
+
+    @commands.Cog.listener(name="on_cached_bulk_message_delete")
+    async def on_cached_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent, messages: List[CompactMessage]) -> None:
+        """
+        Callback on bulk message deleting, logs one embed for the whole batch
+        NOTE: custom event
+
+        IN:
+            payload - the raw event payload
+            messages - the deleted messages we had in our message store
+        """
+        guild: Optional[discord.Guild] = self.bot.get_guild(payload.guild_id)
+        if guild is None:
+            return
+
+        log_channel = self._get_log_channel(guild, LOG_MESSAGES)
+        if log_channel is None:
+            return
+
+        # Map message id -> (author id, content)
+        known_messages = {m.id: (m.author_id, m.content) for m in messages}
+        # Also add messages that only discord.py knows about
+        for message in payload.cached_messages:
+            if message.id not in known_messages and not message.author.bot:
+                known_messages[message.id] = (message.author.id, message.content)
+
+        embed = _LogEmbedBuilder.get_bulk_msg_del_embed(
+            payload.channel_id,
+            len(payload.message_ids),
+            [known_messages[message_id] for message_id in sorted(known_messages)]
+        )
+        self.submit_log(guild, log_channel, embed, PRIORITY_MESSAGES)
 
     @commands.Cog.listener(name="on_member_join")
     async def on_member_join(self, member: discord.Member) -> None:
@@ -420,13 +1232,17 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
         if guild is None:
             return
 
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MEMBERS)
         if log_channel is None:
             return
 
+        # During raids we only send summaries
+        if self.join_tracker.hit(guild.id, time.monotonic()):
+            self._buffer_raid_event(guild, log_channel, member, joined=True)
+            return
+
         embed = _LogEmbedBuilder.get_user_join_embed(member)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MEMBERS)
 
     @commands.Cog.listener(name="on_member_left")
     async def on_member_left(self, member: discord.Member) -> None:
@@ -441,16 +1257,25 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
         if guild is None:
             return
 
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MEMBERS)
         if log_channel is None:
             return
 
+        if self.join_tracker.is_raid(guild.id, time.monotonic()):
+            self._buffer_raid_event(guild, log_channel, member, joined=False)
+            return
+
         embed = _LogEmbedBuilder.get_user_left_embed(member)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MEMBERS)
 
     @commands.Cog.listener(name="on_member_warn")
-    async def on_member_warn(self, guild: discord.Guild, member: MemberOrUserConverter, log_entry: PartialAuditLogEntry) -> None:
+    async def on_member_warn(
+        self,
+        guild: discord.Guild,
+        member: MemberOrUserConverter,
+        log_entry: PartialAuditLogEntry,
+        warnings: Optional[int] = None
+    ) -> None:
         """
         Callback on user warn
         NOTE: custom event
@@ -459,18 +1284,24 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             guild - Guild object
             member - either User or Member object
             log_entry - the audit log entry
+            warnings - the number of warnings the user has now
                 (Default: None)
         """
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MODERATION)
         if log_channel is None:
             return
 
-        embed = _LogEmbedBuilder.get_warn_embed(member, log_entry)
-        await log_channel.send(embed=embed)
+        embed = _LogEmbedBuilder.get_warn_embed(member, log_entry, warnings)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MODERATION)
 
     @commands.Cog.listener(name="on_member_unwarn")
-    async def on_member_unwarn(self, guild: discord.Guild, member: MemberOrUserConverter, log_entry: PartialAuditLogEntry) -> None:
+    async def on_member_unwarn(
+        self,
+        guild: discord.Guild,
+        member: MemberOrUserConverter,
+        log_entry: PartialAuditLogEntry,
+        warnings: Optional[int] = None
+    ) -> None:
         """
         Callback on user unwarn
         NOTE: custom event
@@ -479,15 +1310,15 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             guild - Guild object
             member - either User or Member object
             log_entry - the audit log entry
+            warnings - the number of warnings the user has now
                 (Default: None)
         """
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MODERATION)
         if log_channel is None:
             return
 
-        embed = _LogEmbedBuilder.get_unwarn_embed(member, log_entry)
-        await log_channel.send(embed=embed)
+        embed = _LogEmbedBuilder.get_unwarn_embed(member, log_entry, warnings)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MODERATION)
 
     @commands.Cog.listener(name="on_member_kick")
     async def on_member_kick(self, guild: discord.Guild, member: discord.Member, log_entry: discord.AuditLogEntry) -> None:
@@ -500,13 +1331,12 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             member - Member object
             log_entry - the audit log entry
         """
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MODERATION)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_kick_embed(member, log_entry)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MODERATION)
 
     @commands.Cog.listener(name="on_member_ban_custom")
     async def on_member_ban(self, guild: discord.Guild, member: discord.Member, log_entry: Optional[discord.AuditLogEntry] = None) -> None:
@@ -520,13 +1350,12 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             log_entry - the audit log entry (not passed in officially, only via our custom callback)
                 (Default: None)
         """
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MODERATION)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_ban_embed(member, log_entry)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MODERATION)
 
     @commands.Cog.listener(name="on_member_unban_custom")
     async def on_member_unban(self, guild: discord.Guild, user: discord.User, log_entry: Optional[discord.AuditLogEntry] = None) -> None:
@@ -540,13 +1369,37 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             log_entry - the audit log entry (not passed in officially, only via our custom callback)
                 (Default: None)
         """
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_MODERATION)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_unban_embed(user, log_entry)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MODERATION)
+
+    @commands.Cog.listener(name="on_member_mass_action")
+    async def on_member_mass_action(
+        self,
+        guild: discord.Guild,
+        action: str,
+        targets: List[Union[discord.Member, discord.Object]],
+        log_entry: PartialAuditLogEntry
+    ) -> None:
+        """
+        Callback on mass ban/kick, logs one embed for all the members
+        NOTE: custom event
+
+        IN:
+            guild - Guild object
+            action - the action name ('ban' or 'kick')
+            targets - the members who were banned/kicked
+            log_entry - the entry with the moderator and reason
+        """
+        log_channel = self._get_log_channel(guild, LOG_MODERATION)
+        if log_channel is None:
+            return
+
+        embed = _LogEmbedBuilder.get_mass_action_embed(action, targets, log_entry)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MODERATION)
 
     @commands.Cog.listener(name="on_thread_join")
     async def on_thread_join(self, thread: discord.Thread) -> None:
@@ -561,13 +1414,12 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             return
 
         guild = thread.guild
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_THREADS)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_thread_created_embed(thread)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MEMBERS)
 
     @commands.Cog.listener(name="on_thread_delete")
     async def on_thread_delete(self, thread: discord.Thread) -> None:
@@ -578,13 +1430,139 @@ class Logger(commands.Cog, command_attrs=dict(hidden=True)):
             thread - Thread object
         """
         guild = thread.guild
-        log_channel: Optional[int] = self.bot.guilds_configs[guild.id].log_channel
-        log_channel: Optional[discord.TextChannel] = guild.get_channel(log_channel)
+        log_channel = self._get_log_channel(guild, LOG_THREADS)
         if log_channel is None:
             return
 
         embed = _LogEmbedBuilder.get_thread_deleted_embed(thread)
-        await log_channel.send(embed=embed)
+        self.submit_log(guild, log_channel, embed, PRIORITY_MEMBERS)
+
+    async def _update_log_config(self, ctx: commands.Context, column: str, value: Optional[int]) -> None:
+        """
+        Saves a log setting of the guild and rebuilds its routes
+
+        IN:
+            ctx - the command context
+            column - the guild config column to update
+            value - the new value
+        """
+        guild_id = ctx.guild.id
+        async with sql_utils.NewAsyncSession() as sesh:
+            sesh: sql_utils.AsyncSession
+            stmt = (
+                sql_utils.update(sql_utils.GuildConfig)
+                .values({column: value})
+                .where(sql_utils.GuildConfig.guild_id == guild_id)
+            )
+            await sesh.execute(stmt)
+            await sesh.commit()
+            self.bot.guilds_configs[guild_id][column] = value
+        self.bot.dispatch("guild_config_update", guild_id)
+
+    @staticmethod
+    def _get_log_config_column(category: str, allow_all: bool = True) -> Optional[str]:
+        """
+        Returns the guild config column for a category name
+
+        IN:
+            category - the category name, 'all' means the default log channel
+            allow_all - whether or not 'all' is accepted
+                (Default: True)
+
+        OUT:
+            the column name or None if the category is unknown
+        """
+        category = category.lower()
+        if category == "all":
+            return "log_channel" if allow_all else None
+
+        entry = LOG_CATEGORIES.get(category, None)
+        return entry[1] if entry is not None else None
+
+    async def _send_unknown_log_category(self, ctx: commands.Context, category: str) -> None:
+        """
+        Replies that the given category doesn't exist
+
+        IN:
+            ctx - the command context
+            category - the category name
+        """
+        await ctx.send(
+            f"Unknown log category `{category}`. Available categories: `{'`, `'.join(LOG_CATEGORIES)}`.",
+            reference=ctx.message
+        )
+
+    @commands.group(name="logs", aliases=("log",), invoke_without_command=True, hidden=False)
+    @is_owner_or_admin()
+    @commands.guild_only()
+    async def cmd_logs(self, ctx: commands.Context) -> None:
+        """
+        Shows where each category of logs is sent on this server
+        """
+        guild: discord.Guild = ctx.guild
+        lines = list()
+        for name, (category, _) in LOG_CATEGORIES.items():
+            log_channel = self._get_log_channel(guild, category)
+            lines.append(f"- {name.capitalize()}: {log_channel.mention if log_channel is not None else 'disabled'}")
+
+        embed = discord.Embed(title="Log Channels", description="\n".join(lines), color=consts.EMB_COLOR_GREEN)
+        await ctx.send(embed=embed, reference=ctx.message)
+
+    @cmd_logs.command(name="set")
+    @is_owner_or_admin()
+    @commands.guild_only()
+    async def cmd_logs_set(self, ctx: commands.Context, category: str, channel: discord.TextChannel) -> None:
+        """
+        Sends a category of logs to a channel
+
+        IN:
+            category - the category name, 'all' sets the default channel for categories without their own
+            channel - the log channel
+        """
+        column = self._get_log_config_column(category)
+        if column is None:
+            await self._send_unknown_log_category(ctx, category)
+            return
+
+        await self._update_log_config(ctx, column, channel.id)
+        await ctx.send(f"Logging `{category.lower()}` events to {channel.mention}.", reference=ctx.message)
+
+    @cmd_logs.command(name="off", aliases=("disable",))
+    @is_owner_or_admin()
+    @commands.guild_only()
+    async def cmd_logs_off(self, ctx: commands.Context, category: str) -> None:
+        """
+        Disables a category of logs
+
+        IN:
+            category - the category name, 'all' disables the default channel
+        """
+        column = self._get_log_config_column(category)
+        if column is None:
+            await self._send_unknown_log_category(ctx, category)
+            return
+
+        # The default channel is disabled by NULL, categories by 0
+        await self._update_log_config(ctx, column, None if column == "log_channel" else 0)
+        await ctx.send(f"Disabled logging of `{category.lower()}` events.", reference=ctx.message)
+
+    @cmd_logs.command(name="default", aliases=("reset",))
+    @is_owner_or_admin()
+    @commands.guild_only()
+    async def cmd_logs_default(self, ctx: commands.Context, category: str) -> None:
+        """
+        Makes a category of logs use the default log channel
+
+        IN:
+            category - the category name
+        """
+        column = self._get_log_config_column(category, allow_all=False)
+        if column is None:
+            await self._send_unknown_log_category(ctx, category)
+            return
+
+        await self._update_log_config(ctx, column, None)
+        await ctx.send(f"Logging `{category.lower()}` events to the default log channel.", reference=ctx.message)
 
 
 def setup(bot: Bot):
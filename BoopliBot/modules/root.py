@@ -3,6 +3,7 @@ Module provides main set of commands. This module is required and must always be
 """
 
 import asyncio
+import logging
 import traceback
 import random
 import datetime
@@ -21,8 +22,6 @@ from pprint import pprint as _pprint
 
 import discord
 from discord.ext import commands
-import DiscordStatusPy
-import psutil
 
 
 import BoopliBot
@@ -38,7 +37,12 @@ from ..utils import (
     is_owner_or_mod,
     bypass_for_owner_cooldown,
     validate_prefix,
-    sql_utils
+    sql_utils,
+    log_utils,
+    health_utils,
+    stats_utils,
+    profile_utils,
+    memory_utils
 )
 from ..consts import (
     EMB_COLOR_GREEN,
@@ -53,6 +57,17 @@ from ..errors import (
 )
 
 
+PERF_DEF_ROWS = 10
+PERF_MAX_ROWS = 20
+# Leaves room for the code block
+PERF_MAX_TEXT_LEN = 1980
+PERF_MAX_STATEMENT_LEN = 120
+PERF_MAX_SAMPLE_SIZE = 1000
+# In seconds
+PROFILE_DEF_DURATION = 10.0
+PROFILE_MAX_DURATION = 300.0
+
+
 _cogs = set()
 
 
@@ -84,6 +99,7 @@ class RootCommands(commands.Cog, name="Root"):
             bot - the bot object
         """
         self.bot = bot
+        self.memory_tracker = memory_utils.MemoryTracker()
 
     @commands.command(name="ping", aliases=("latency", "statistic", "stats"))
     @commands.max_concurrency(10, wait=True)
@@ -105,13 +121,23 @@ class RootCommands(commands.Cog, name="Root"):
             0
         )
 
-        # Get db latency
-        async with sql_utils.NewAsyncSession() as sesh:
-            start = time.perf_counter()
-            await sesh.execute(sql_utils.select(1))
-            end = time.perf_counter()
+        # The rest comes from the background sampler
+        snapshot = self.bot.health_sampler.snapshot
+        if snapshot is not None:
+            sampled_at = datetime.datetime.fromtimestamp(snapshot.sampled_at, datetime.timezone.utc)
+            sampled_text = f"Sampled {discord.utils.format_dt(sampled_at, 'R')}"
+
+        else:
+            sampled_text = "No sample has been taken yet"
+            # Every sampled field shows "No data" until the first sample
+            snapshot = health_utils.HealthSnapshot(0.0, None, None, None)
+
+        sql_db_latency = snapshot.sql_db_latency
+        if sql_db_latency is not None:
+            sql_db_latency_text = f"{sql_db_latency:0.0f} ms"
 
-            sql_db_latency = (end - start)*1000
+        else:
+            sql_db_latency_text = "No data"
 
         # Get discord status
         disc_status_desc = "No data"
@@ -119,79 +145,69 @@ class RootCommands(commands.Cog, name="Root"):
         disc_status_update = ""
         disc_components = "No data"
 
-        async with DiscordStatusPy.APIClient() as api_client:
-            api_client: DiscordStatusPy.APIClient
-            data = await api_client.get_status()
-            try:
-                temp_var: str = data["status"]["indicator"]
-                if temp_var and temp_var != "none":
-                    disc_status_ind = f" ({temp_var})"
-
-                temp_var: str = data["status"]["description"]
-                if temp_var:
-                    disc_status_desc = temp_var
-
-                temp_var = data["page"]["updated_at"]
-                if temp_var:
-                    temp_var: str = discord.utils.format_dt(
-                        datetime.datetime.fromisoformat(temp_var),
-                        "R"
-                    )
-                    disc_status_update = f" (last updated {temp_var})"
-
-            except KeyError:
-                pass
-
-            data = await api_client.get_components()
-            try:
-                names = {"API", "CloudFlare", "Media Proxy", "Search", "Voice"}
-                components = filter(lambda item: item["name"] in names, data["components"])
-                parts = list()
-                for item in components:
-                    name = item["name"]
-                    status = "✅" if item["status"] == "operational" else "❌"
-                    parts.append(f"- {name} {status}")
+        disc_status = snapshot.discord_status
+        if disc_status is not None:
+            if disc_status.indicator and disc_status.indicator != "none":
+                disc_status_ind = f" ({disc_status.indicator})"
+
+            if disc_status.description:
+                disc_status_desc = disc_status.description
 
-                disc_components = "\n".join(parts)
+            if disc_status.updated_at:
+                disc_status_update = " (last updated {0})".format(discord.utils.format_dt(disc_status.updated_at, "R"))
 
-            except KeyError:
-                pass
+            if disc_status.components:
+                disc_components = "\n".join(
+                    f"- {name} {'✅' if is_operational else '❌'}"
+                    for name, is_operational in disc_status.components
+                )
 
         discord_status = f"{disc_status_desc}{disc_status_ind}:\n{disc_components}"
 
         # Get process stats
-        # mem_stats = psutil.virtual_memory()
-        cpu_usage = psutil.cpu_percent()
-        # total_mem = mem_stats.total
-        # mem_usage = mem_stats.percent
-        proc = psutil.Process()
-        with proc.oneshot():
-            proc.cpu_percent()
-            # proc_cpu_usage = proc.cpu_percent()
-            # if not proc_cpu_usage:
-            #     proc_cpu_usage = 0.1
-            proc_mem_usage = proc.memory_percent()
-            proc_mem_used = proc.memory_full_info().uss
-            runtime_s = int(time.time() - proc.create_time())
+        proc_stats = snapshot.process
+        if proc_stats is not None:
+            runtime_s = int(time.time() - proc_stats.create_time)
             runtime_m = runtime_s // 60
             runtime_h = runtime_m // 60
             runtime_m %= 60
             runtime_d = runtime_h // 24
             runtime_h %= 24
 
-        server_stats = (
-            f"Runtime: {runtime_d} Days, {runtime_h} Hours, {runtime_m} Minutes\n"
-            f"CPU Usage: {cpu_usage:0.1f}%\n"
-            f"Memory Usage: {proc_mem_used / 1024**2:0.0f} MiB ({proc_mem_usage:0.1f}%)"
-        )
+            server_stats = (
+                f"Runtime: {runtime_d} Days, {runtime_h} Hours, {runtime_m} Minutes\n"
+                f"CPU Usage: {proc_stats.cpu_usage:0.1f}%\n"
+                f"Memory Usage: {proc_stats.mem_used / 1024**2:0.0f} MiB ({proc_stats.mem_usage:0.1f}%)"
+            )
+
+        else:
+            server_stats = "No data"
+
+        lag_histogram = self.bot.loop_monitor.histogram
+        if lag_histogram.count:
+            loop_lag_text = (
+                f"p50 {lag_histogram.quantile(0.5):0.1f} ms, "
+                f"p99 {lag_histogram.quantile(0.99):0.1f} ms, "
+                f"max {lag_histogram.max:0.0f} ms"
+            )
+
+        else:
+            loop_lag_text = "No data"
+
+        server_stats += f"\n{sampled_text}"
 
         embed = discord.Embed()
         embed.add_field(name="Bot Latency:", value=f"{bot_latency:0.0f} ms", inline=False)
         embed.add_field(name="WS Latency:", value=f"{ws_latency:0.0f} ms", inline=False)
-        embed.add_field(name="SQL DB Latency:", value=f"{sql_db_latency:0.0f} ms", inline=False)
+        embed.add_field(name="SQL DB Latency:", value=sql_db_latency_text, inline=False)
+        embed.add_field(name="Event Loop Lag:", value=loop_lag_text, inline=False)
         embed.add_field(name=f"Discord Status{disc_status_update}:", value=discord_status, inline=False)
         embed.add_field(name="Bot Status:", value=server_stats, inline=False)
 
+        # Missing db latency doesn't affect the color
+        if sql_db_latency is None:
+            sql_db_latency = 0
+
         if (
             bot_latency <= 50
             and ws_latency <= 150
@@ -248,6 +264,7 @@ class RootCommands(commands.Cog, name="Root"):
             await sesh.execute(stmt)
             await sesh.commit()
             self.bot.guilds_configs[guild_id].prefix = new_prefix
+        self.bot.dispatch("guild_config_update", guild_id)
 
         await ctx.send(f"{response} `{new_prefix}`.", reference=ctx.message)
 
@@ -319,6 +336,266 @@ class RootCommands(commands.Cog, name="Root"):
 
         await ctx.channel.send(msg, reference=ctx.message)
 
+    @commands.group(name="perf", invoke_without_command=True)
+    @commands.is_owner()
+    async def cmd_perf(self, ctx: commands.Context) -> None:
+        """
+        Group of performance stats commands
+        """
+        if ctx.invoked_subcommand is None:
+            raise MissingRequiredSubCommand()
+
+    @cmd_perf.command(name="commands", aliases=("cmds", "c"))
+    @commands.is_owner()
+    async def cmd_perf_commands(self, ctx: commands.Context, amount: int = PERF_DEF_ROWS) -> None:
+        """
+        Prints the slowest commands by p99 latency, times are in ms,
+        DB/REST/Local are mean times spent on DB queries, REST requests and everything else
+
+        IN:
+            amount - how many commands to show
+        """
+        amount = min(max(amount, 1), PERF_MAX_ROWS)
+        entries = self.bot.command_stats.get_slowest(amount)
+        if not entries:
+            await ctx.send("No commands were used yet.", reference=ctx.message)
+            return
+
+        table = stats_utils.format_command_entries(entries)
+        await ctx.send(to_code_block(table[:PERF_MAX_TEXT_LEN]), reference=ctx.message)
+
+    @cmd_perf.command(name="events", aliases=("e",))
+    @commands.is_owner()
+    async def cmd_perf_events(self, ctx: commands.Context, amount: int = PERF_DEF_ROWS) -> None:
+        """
+        Prints the event handlers that took the most loop time, times are in ms,
+        Busy is the time on the loop, Wall also includes waiting on I/O
+
+        IN:
+            amount - how many handlers to show
+        """
+        amount = min(max(amount, 1), PERF_MAX_ROWS)
+        entries = self.bot.event_stats.get_busiest(amount)
+        if not entries:
+            await ctx.send("No events were handled yet.", reference=ctx.message)
+            return
+
+        lines = [f"{'Handler':<40} {'Calls':>7} {'Busy':>9} {'Max':>7} {'Wall':>9}"]
+        for (event_name, handler_name), stats in entries:
+            name = f"{event_name} {handler_name}"
+            if len(name) > 40:
+                name = name[:39] + "…"
+            lines.append(
+                f"{name:<40} {stats.calls:>7} {stats.busy * 1000:>9.1f} {stats.max_busy * 1000:>7.1f} {stats.wall * 1000:>9.1f}"
+            )
+
+        text = "\n".join(lines)
+        await ctx.send(to_code_block(text[:PERF_MAX_TEXT_LEN]), reference=ctx.message)
+
+    @cmd_perf.command(name="queries", aliases=("sql", "q"))
+    @commands.is_owner()
+    async def cmd_perf_queries(self, ctx: commands.Context, amount: int = PERF_DEF_ROWS) -> None:
+        """
+        Prints the queries with the most total time and the slowest queries, times are in ms
+
+        IN:
+            amount - how many queries to show
+        """
+        profiler = sql_utils.query_profiler
+        if profiler is None:
+            await ctx.send(
+                f"Query profiling is off. Use `{ctx.prefix}perf profiling on` to turn it on.",
+                reference=ctx.message
+            )
+            return
+
+        amount = min(max(amount, 1), PERF_MAX_ROWS)
+        top = profiler.get_top(amount)
+        if not top:
+            await ctx.send("No queries were made yet.", reference=ctx.message)
+            return
+
+        lines = ["Top by total time:"]
+        for statement, site, stats in top:
+            lines.append(
+                f"{stats.total:>9.1f} total {stats.count:>6}x {stats.total / stats.count:>7.2f} avg {stats.max:>7.2f} max  {site}"
+            )
+            lines.append(f"    {statement[:PERF_MAX_STATEMENT_LEN]}")
+
+        lines.append("")
+        lines.append("Slowest:")
+        for query in profiler.get_slowest()[:amount]:
+            lines.append(f"{query.elapsed:>9.2f}  {query.site}")
+            lines.append(f"    {query.statement[:PERF_MAX_STATEMENT_LEN]}")
+
+        text = "\n".join(lines)
+        await ctx.send(to_code_block(text[:PERF_MAX_TEXT_LEN]), reference=ctx.message)
+
+    @cmd_perf.command(name="profiling")
+    @commands.is_owner()
+    async def cmd_perf_profiling(self, ctx: commands.Context, enable: bool) -> None:
+        """
+        Turns query profiling on/off, turning it off drops the collected stats
+
+        IN:
+            enable - whether or not to profile
+        """
+        if enable:
+            sql_utils.enable_query_profiling()
+            response = "Query profiling is on."
+
+        else:
+            sql_utils.disable_query_profiling()
+            response = "Query profiling is off."
+
+        await ctx.send(response, reference=ctx.message)
+
+    @cmd_perf.command(name="profile", aliases=("sample",))
+    @commands.is_owner()
+    @commands.max_concurrency(1)
+    async def cmd_perf_profile(
+        self,
+        ctx: commands.Context,
+        duration: float = PROFILE_DEF_DURATION,
+        all_threads: bool = False
+    ) -> None:
+        """
+        Samples the stacks for the given time and uploads them in the collapsed stacks format,
+        the file can be opened with speedscope or rendered with flamegraph.pl
+
+        IN:
+            duration - for how long to sample, in seconds
+            all_threads - whether or not to sample all threads, by default only the event loop is sampled
+        """
+        duration = min(max(duration, 1.0), PROFILE_MAX_DURATION)
+        await ctx.send(f"Sampling stacks for {duration:0.0f} s...", reference=ctx.message)
+
+        sampler = await profile_utils.sample_stacks(duration, all_threads=all_threads)
+        if not sampler.stacks:
+            await ctx.send("Didn't get any samples.", reference=ctx.message)
+            return
+
+        filename = "profile_{0}.txt".format(discord.utils.utcnow().strftime("%Y%m%d_%H%M%S"))
+        await ctx.send(
+            f"Took {sampler.sample_count} samples over {sampler.elapsed:0.1f} s, {len(sampler.stacks)} unique stacks.",
+            file=discord.File(io.BytesIO(sampler.to_collapsed().encode("utf-8")), filename=filename),
+            reference=ctx.message
+        )
+
+    @cmd_perf.command(name="memory", aliases=("mem",))
+    @commands.is_owner()
+    async def cmd_perf_memory(self, ctx: commands.Context, sample_size: int = memory_utils.DEF_SAMPLE_SIZE) -> None:
+        """
+        Prints the estimated sizes of the major structures and how they changed since the previous run,
+        big containers are estimated from a sample of their entries
+
+        IN:
+            sample_size - the max number of entries of a container to measure
+        """
+        sample_size = min(max(sample_size, 1), PERF_MAX_SAMPLE_SIZE)
+        results = await self.memory_tracker.measure(self.bot, sample_size)
+        table = memory_utils.format_structure_sizes(results)
+        await ctx.send(to_code_block(table[:PERF_MAX_TEXT_LEN]), reference=ctx.message)
+
+    @cmd_perf.command(name="tracing")
+    @commands.is_owner()
+    async def cmd_perf_tracing(self, ctx: commands.Context, enable: bool) -> None:
+        """
+        Turns tracemalloc on/off, tracing slows down allocations
+
+        IN:
+            enable - whether or not to trace
+        """
+        if enable:
+            self.memory_tracker.start_tracing()
+            response = "Memory tracing is on."
+
+        else:
+            self.memory_tracker.stop_tracing()
+            response = "Memory tracing is off."
+
+        await ctx.send(response, reference=ctx.message)
+
+    @cmd_perf.command(name="snapshot", aliases=("snap",))
+    @commands.is_owner()
+    async def cmd_perf_snapshot(self, ctx: commands.Context, amount: int = PERF_DEF_ROWS) -> None:
+        """
+        Takes a tracemalloc snapshot, prints the lines that allocated the most
+        and the lines that grew the most since the previous snapshot
+
+        IN:
+            amount - how many lines to show
+        """
+        if not self.memory_tracker.is_tracing():
+            await ctx.send(
+                f"Memory tracing is off. Use `{ctx.prefix}perf tracing on` to turn it on.",
+                reference=ctx.message
+            )
+            return
+
+        amount = min(max(amount, 1), PERF_MAX_ROWS)
+        top, diff = await self.memory_tracker.take_snapshot(amount)
+
+        text = memory_utils.format_snapshot(top, diff)
+        await ctx.send(to_code_block(text[:PERF_MAX_TEXT_LEN]), reference=ctx.message)
+
+    @cmd_perf.group(name="loglevel", aliases=("ll",), invoke_without_command=True)
+    @commands.is_owner()
+    async def cmd_perf_loglevel(self, ctx: commands.Context) -> None:
+        """
+        Prints the effective levels of the loggers and the level of the main log
+        """
+        if ctx.invoked_subcommand is not None:
+            return
+
+        lines = [f"main log: {logging.getLevelName(log_utils.get_verbosity())}"]
+        lines.extend(f"{name}: {logging.getLevelName(level)}" for name, level in log_utils.get_levels().items())
+        await ctx.send(to_code_block("\n".join(lines)[:PERF_MAX_TEXT_LEN]), reference=ctx.message)
+
+    @cmd_perf_loglevel.command(name="verbosity", aliases=("v",))
+    @commands.is_owner()
+    async def cmd_perf_loglevel_verbosity(self, ctx: commands.Context, level: log_utils.parse_level) -> None:
+        """
+        Sets the level of the main log, the loggers levels follow it
+
+        IN:
+            level - the level name (e.g. debug) or number
+        """
+        log_utils.set_verbosity(level)
+        await ctx.send(f"The main log level is {logging.getLevelName(level)}.", reference=ctx.message)
+
+    @cmd_perf_loglevel.command(name="set", aliases=("s",))
+    @commands.is_owner()
+    async def cmd_perf_loglevel_set(self, ctx: commands.Context, logger_name: str, level: Optional[log_utils.parse_level] = None) -> None:
+        """
+        Sets the level of a logger (e.g. to silence discord.gateway), it can't go below the main log level
+
+        IN:
+            logger_name - the logger name
+            level - the level name or number, omit to reset
+        """
+        log_utils.set_logger_level(logger_name, level)
+        if level is None:
+            response = f"Reset the level of `{logger_name}`."
+
+        else:
+            effective_level = logging.getLogger(logger_name).getEffectiveLevel()
+            response = f"The level of `{logger_name}` is {logging.getLevelName(effective_level)}."
+
+        await ctx.send(response, reference=ctx.message)
+
+    @cmd_perf.command(name="reset")
+    @commands.is_owner()
+    async def cmd_perf_reset(self, ctx: commands.Context) -> None:
+        """
+        Resets the performance stats
+        """
+        self.bot.command_stats.clear()
+        self.bot.event_stats.clear()
+        if sql_utils.query_profiler is not None:
+            sql_utils.query_profiler.clear()
+        await ctx.send("Reset the performance stats.", reference=ctx.message)
+
     @commands.group(name="module", aliases=("modules", "m"), invoke_without_command=True)
     @commands.is_owner()
     async def cmd_module(self, ctx: commands.Context) -> None:
@@ -8,6 +8,7 @@ import json
 import logging
 import datetime
 import re
+from difflib import SequenceMatcher
 from collections.abc import (
     Callable
 )
@@ -29,7 +30,12 @@ import BoopliBot
 from . import (
     config_utils,
     log_utils,
-    sql_utils
+    sql_utils,
+    health_utils,
+    stats_utils,
+    metrics_utils,
+    profile_utils,
+    memory_utils
 )
 from ..consts import (
     TIME_FMT,
@@ -40,6 +46,14 @@ from ..consts import (
 from ..errors import BadBotPrefix, MissingPermissionsAndNotOnSelf
 
 
+# Splits text into words with their trailing whitespace
+_DIFF_TOKEN_PATTERN = re.compile(r"^\s+|\S+\s*")
+# Max product of the changed region lengths (in tokens) we run the matcher on,
+# bigger regions are rendered as a single replacement
+DIFF_MAX_COST = 40000
+DIFF_ELLIPSIS = "…"
+
+
 def init(should_log=True) -> None:
     """
     Inits sub-modules
@@ -50,6 +64,13 @@ def init(should_log=True) -> None:
     # NOTE: ORDER IS IMPORTANT
     log_utils.init(should_log=should_log)
     config_utils.init(should_log=should_log)
+    # The log settings are in the config, so we can apply them only now
+    config = config_utils.bot_config
+    log_utils.configure(
+        log_format=config.log_format,
+        buffer_size=config.log_buffer_size,
+        flush_interval=config.log_flush_interval
+    )
     sql_utils.init(should_log=should_log)
 
 def deinit(should_log=True) -> None:
@@ -100,6 +121,175 @@ def fmt_datetime(dt: datetime.datetime) -> str:
     """
     return dt.strftime(TIME_FMT)[:-3]
 
+def _common_prefix_len(a: str, b: str) -> int:
+    """
+    Returns the length of the common start of two strings
+    NOTE: compares slices so the work is done in C
+
+    IN:
+        a - the first string
+        b - the second string
+
+    OUT:
+        int
+    """
+    low = 0
+    high = min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[:mid] == b[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+
+    return low
+
+def _fmt_diff_head(text: str, context: int) -> str:
+    """
+    Formats the unchanged text before the first change
+
+    IN:
+        text - the text, ends with whitespace
+        context - the number of words to keep
+
+    OUT:
+        str
+    """
+    parts = text.rsplit(None, context)
+    # Only shorten if we skip more than a single word
+    if len(parts) <= context or len(parts[0].split(None, 1)) < 2:
+        return text
+
+    return f"{DIFF_ELLIPSIS} {text[len(parts[0]):].lstrip()}"
+
+def _fmt_diff_tail(text: str, context: int) -> str:
+    """
+    Formats the unchanged text after the last change
+
+    IN:
+        text - the text, ends with whitespace
+        context - the number of words to keep
+
+    OUT:
+        str
+    """
+    parts = text.split(None, context)
+    if len(parts) <= context or len(parts[-1].split(None, 1)) < 2:
+        return text
+
+    return f"{text[:len(text) - len(parts[-1])]}{DIFF_ELLIPSIS}"
+
+def _fmt_diff_context(tokens: List[str], context: int) -> str:
+    """
+    Formats unchanged words between two changes
+
+    IN:
+        tokens - the unchanged words
+        context - the number of words to keep next to each change
+
+    OUT:
+        str
+    """
+    if len(tokens) <= context * 2 + 1:
+        return "".join(tokens)
+
+    return f"{''.join(tokens[:context])}{DIFF_ELLIPSIS} {''.join(tokens[-context:])}"
+
+def _fmt_diff_change(removed: List[str], added: List[str]) -> str:
+    """
+    Formats a changed region
+
+    IN:
+        removed - the removed words
+        added - the added words
+
+    OUT:
+        str
+    """
+    removed = "".join(removed)
+    added = "".join(added)
+    core_removed = removed.rstrip()
+    core_added = added.rstrip()
+    # Keep the whitespace after the change outside of the markers
+    trailing = added[len(core_added):] if added else removed[len(core_removed):]
+
+    parts = list()
+    if core_removed:
+        parts.append(f"[-{core_removed}-]")
+    if core_added:
+        parts.append(f"{{+{core_added}+}}")
+    parts.append(trailing)
+
+    return "".join(parts)
+
+def word_diff(old: str, new: str, context: int = 3, max_cost: int = DIFF_MAX_COST) -> str:
+    """
+    Builds a word level diff of two strings, showing only the changed parts and
+    a few words around them. Removed text is rendered as [-text-], added text as {+text+}
+    NOTE: the common start and end are stripped before matching, so typical edits take linear time,
+        regions costlier than max_cost are rendered as a single replacement
+
+    IN:
+        old - the old string
+        new - the new string
+        context - the number of unchanged words to show around changes
+            (Default: 3)
+        max_cost - the max product of the changed regions lengths (in words) to run the matcher on
+            (Default: DIFF_MAX_COST)
+
+    OUT:
+        str with the diff, empty if the strings are equal
+    """
+    # The trailing space makes the last word equal to the same word in the middle of the other string
+    old = old.rstrip() + " "
+    new = new.rstrip() + " "
+    if old == new:
+        return ""
+
+    # Strip the common start and end, cutting only at word boundaries,
+    # a word that ends in both strings is a boundary even if the whitespace after it differs
+    start = _common_prefix_len(old, new)
+    while start and not (old[start-1].isspace() or (old[start].isspace() and new[start].isspace())):
+        start -= 1
+
+    end = _common_prefix_len(old[:start-1:-1], new[:start-1:-1]) if start else _common_prefix_len(old[::-1], new[::-1])
+    while end and not (
+        (end == len(old) - start or old[-end-1].isspace())
+        and (end == len(new) - start or new[-end-1].isspace())
+    ):
+        end -= 1
+
+    old_mid = _DIFF_TOKEN_PATTERN.findall(old[start:len(old)-end])
+    new_mid = _DIFF_TOKEN_PATTERN.findall(new[start:len(new)-end])
+    if (
+        # A single word that was replaced, the most common edit
+        (len(old_mid) == 1 and old_mid[0] not in new_mid)
+        or (len(new_mid) == 1 and new_mid[0] not in old_mid)
+    ):
+        opcodes = (("replace", 0, len(old_mid), 0, len(new_mid)),)
+
+    elif old_mid and new_mid and len(old_mid) * len(new_mid) <= max_cost:
+        opcodes = SequenceMatcher(None, old_mid, new_mid, autojunk=False).get_opcodes()
+
+    else:
+        opcodes = (("replace", 0, len(old_mid), 0, len(new_mid)),)
+
+    parts = list()
+    if start:
+        parts.append(_fmt_diff_head(old[:start], context))
+
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            parts.append(_fmt_diff_context(old_mid[i1:i2], context))
+
+        else:
+            parts.append(_fmt_diff_change(old_mid[i1:i2], new_mid[j1:j2]))
+
+    if end:
+        parts.append(_fmt_diff_tail(old[-end:], context))
+
+    return "".join(parts).rstrip()
+
 def validate_prefix(prefix: str) -> None:
     """
     Validates the given prefix, if the prefix is invalid, raises BadBotPrefix
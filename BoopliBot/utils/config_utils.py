@@ -14,6 +14,11 @@ from typing import (
 
 import BoopliBot
 from ..errors import BadConfig, BadBotPrefix
+from ..helpers import LogEventQueue
+from . import (
+    health_utils,
+    log_utils
+)
 
 
 CONFIG_FILE = "config.json"
@@ -36,7 +41,23 @@ class Config:
         "activity_text",
         "description",
         "case_insensitive",
-        "strip_after_prefix"
+        "strip_after_prefix",
+        "max_messages",
+        "log_queue_size",
+        "log_queue_policy",
+        "message_store_budget",
+        "message_store_total_budget",
+        "health_sample_interval",
+        "health_sources",
+        "loop_lag_threshold",
+        "loop_debug",
+        "metrics_port",
+        "metrics_host",
+        "sql_profiling",
+        "event_summary_interval",
+        "log_format",
+        "log_buffer_size",
+        "log_flush_interval"
     )
     _ALL_SETTINGS = _REQUIRED_SETTINGS + _SUPPORTED_SETTINGS
     _OTHER_ATTRS = (
@@ -112,6 +133,82 @@ class Config:
         except BadBotPrefix as e:
             raise BadConfig(f"Invalid default prefix: {e}") from None
 
+        log_queue_size = settings.get("log_queue_size", None)
+        if log_queue_size is not None and (not isinstance(log_queue_size, int) or log_queue_size < 1):
+            raise BadConfig("Log queue size should be a positive integer.")
+
+        message_store_budget = settings.get("message_store_budget", None)
+        if message_store_budget is not None and (not isinstance(message_store_budget, int) or message_store_budget < 1):
+            raise BadConfig("Message store budget should be a positive integer.")
+
+        message_store_total_budget = settings.get("message_store_total_budget", None)
+        if message_store_total_budget is not None and (not isinstance(message_store_total_budget, int) or message_store_total_budget < 1):
+            raise BadConfig("Message store total budget should be a positive integer.")
+
+        log_queue_policy = settings.get("log_queue_policy", None)
+        if log_queue_policy is not None and log_queue_policy not in LogEventQueue.POLICIES:
+            raise BadConfig(
+                "Unknown log queue policy '{0}', expected one of: {1}.".format(
+                    log_queue_policy,
+                    ", ".join(LogEventQueue.POLICIES)
+                )
+            )
+
+        health_sample_interval = settings.get("health_sample_interval", None)
+        if health_sample_interval is not None and (
+            not isinstance(health_sample_interval, (int, float)) or health_sample_interval <= 0
+        ):
+            raise BadConfig("Health sample interval should be a positive number.")
+
+        health_sources = settings.get("health_sources", None)
+        if health_sources is not None:
+            if not isinstance(health_sources, list):
+                raise BadConfig("Health sources should be a list.")
+
+            unknown_sources = set(health_sources).difference(health_utils.SOURCES)
+            if unknown_sources:
+                raise BadConfig(
+                    "Unknown health sources: {0}, expected any of: {1}.".format(
+                        ", ".join(sorted(unknown_sources)),
+                        ", ".join(health_utils.SOURCES)
+                    )
+                )
+
+        loop_lag_threshold = settings.get("loop_lag_threshold", None)
+        if loop_lag_threshold is not None and (
+            not isinstance(loop_lag_threshold, (int, float)) or loop_lag_threshold <= 0
+        ):
+            raise BadConfig("Loop lag threshold should be a positive number.")
+
+        event_summary_interval = settings.get("event_summary_interval", None)
+        if event_summary_interval is not None and (
+            not isinstance(event_summary_interval, (int, float)) or event_summary_interval < 0
+        ):
+            raise BadConfig("Event summary interval should be a non-negative number.")
+
+        log_format = settings.get("log_format", None)
+        if log_format is not None and log_format not in log_utils.FORMATS:
+            raise BadConfig(
+                "Unknown log format: {0}, expected one of: {1}.".format(
+                    log_format,
+                    ", ".join(log_utils.FORMATS)
+                )
+            )
+
+        log_buffer_size = settings.get("log_buffer_size", None)
+        if log_buffer_size is not None and (not isinstance(log_buffer_size, int) or log_buffer_size < 0):
+            raise BadConfig("Log buffer size should be a non-negative integer.")
+
+        log_flush_interval = settings.get("log_flush_interval", None)
+        if log_flush_interval is not None and (
+            not isinstance(log_flush_interval, (int, float)) or log_flush_interval <= 0
+        ):
+            raise BadConfig("Log flush interval should be a positive number.")
+
+        metrics_port = settings.get("metrics_port", None)
+        if metrics_port is not None and (not isinstance(metrics_port, int) or not 0 < metrics_port < 65536):
+            raise BadConfig("Metrics port should be an integer in range 1-65535.")
+
         # TODO: add more as needed
 
     def __getattr__(self, name: str) -> Any:
@@ -0,0 +1,473 @@
+"""
+Module that samples the bot health (db latency, discord status, process stats) in the background
+and monitors the event loop lag
+"""
+
+import sys
+import asyncio
+import datetime
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+from collections.abc import (
+    Awaitable,
+    Callable,
+    Iterable
+)
+from typing import (
+    Optional,
+    List,
+    Tuple,
+    NamedTuple,
+    Deque
+)
+
+
+import DiscordStatusPy
+import psutil
+
+
+from . import sql_utils
+from ..helpers import Histogram
+
+
+SOURCE_SQL = "sql"
+SOURCE_DISCORD_STATUS = "discord_status"
+SOURCE_PROCESS = "process"
+SOURCES = (SOURCE_SQL, SOURCE_DISCORD_STATUS, SOURCE_PROCESS)
+
+# In seconds
+DEF_INTERVAL = 60.0
+# Components of the status page we report
+DISCORD_COMPONENTS = frozenset(("API", "CloudFlare", "Media Proxy", "Search", "Voice"))
+
+# In seconds
+DEF_LAG_INTERVAL = 0.5
+# In ms
+DEF_LAG_THRESHOLD = 100.0
+MAX_LAG_OFFENDERS = 20
+LAG_STACK_DEPTH = 12
+
+logger = logging.getLogger(__name__)
+
+
+class DiscordStatus(NamedTuple):
+    """
+    Parsed discordstatus.com summary
+    """
+    description: Optional[str]
+    indicator: Optional[str]
+    updated_at: Optional[datetime.datetime]
+    # (name, is operational)
+    components: List[Tuple[str, bool]]
+
+class ProcessStats(NamedTuple):
+    """
+    Stats of the bot process
+    """
+    cpu_usage: float
+    mem_usage: float
+    mem_used: int
+    create_time: float
+
+class HealthSnapshot(NamedTuple):
+    """
+    Results of one sampling, None means the source is disabled or failed
+    """
+    sampled_at: float
+    sql_db_latency: Optional[float]
+    discord_status: Optional[DiscordStatus]
+    process: Optional[ProcessStats]
+
+
+async def fetch_discord_status() -> Optional[dict]:
+    """
+    Fetches the summary of discordstatus.com (status and components in one request)
+
+    OUT:
+        dict or None
+    """
+    async with DiscordStatusPy.APIClient() as api_client:
+        api_client: DiscordStatusPy.APIClient
+        return await api_client.get_summary()
+
+def parse_discord_status(data: Optional[dict]) -> Optional[DiscordStatus]:
+    """
+    Parses the summary of discordstatus.com
+
+    IN:
+        data - the summary
+
+    OUT:
+        DiscordStatus or None if the data is malformed
+    """
+    if not data:
+        return None
+
+    try:
+        status = data["status"]
+        updated_at = data["page"]["updated_at"]
+        if updated_at:
+            updated_at = datetime.datetime.fromisoformat(updated_at)
+
+        components = [
+            (item["name"], item["status"] == "operational")
+            for item in data["components"]
+            if item["name"] in DISCORD_COMPONENTS
+        ]
+
+        return DiscordStatus(
+            status["description"] or None,
+            status["indicator"] or None,
+            updated_at or None,
+            components
+        )
+
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class HealthSampler():
+    """
+    Periodically samples the bot health into a snapshot, so reading it is free
+    NOTE:
+        The snapshot is replaced as a whole, readers never see a partially updated one
+    """
+    __slots__ = ("interval", "sources", "snapshot", "__status_fetcher", "__process", "__task")
+
+    def __init__(
+        self,
+        interval: float = DEF_INTERVAL,
+        sources: Iterable[str] = SOURCES,
+        status_fetcher: Callable[[], Awaitable[Optional[dict]]] = fetch_discord_status
+    ) -> None:
+        """
+        Constructor
+
+        IN:
+            interval - the time between samplings in seconds
+                (Default: DEF_INTERVAL)
+            sources - what to sample, subset of SOURCES
+                (Default: SOURCES)
+            status_fetcher - coroutine function returning the discordstatus.com summary
+                (Default: fetch_discord_status)
+        """
+        if interval <= 0:
+            raise ValueError(f"Interval must be positive, got {interval}.")
+
+        sources = frozenset(sources)
+        unknown = sources.difference(SOURCES)
+        if unknown:
+            raise ValueError("Unknown health sources: {0}.".format(", ".join(sorted(unknown))))
+
+        self.interval = interval
+        self.sources = sources
+        self.snapshot: Optional[HealthSnapshot] = None
+        self.__status_fetcher = status_fetcher
+        self.__process = psutil.Process()
+        self.__task: Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        """
+        Checks if the sampler is running
+        """
+        return self.__task is not None and not self.__task.done()
+
+    def start(self) -> None:
+        """
+        Starts sampling in the background, does nothing if it's already running
+        """
+        if not self.is_running():
+            self.__task = asyncio.create_task(self.__run())
+
+    def stop(self) -> None:
+        """
+        Stops sampling
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def __run(self) -> None:
+        """
+        Sampling loop
+        """
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def sample(self) -> HealthSnapshot:
+        """
+        Samples all sources once and updates the snapshot
+
+        OUT:
+            the new snapshot
+        """
+        sql_db_latency, discord_status, process = await asyncio.gather(
+            self.__sample_source(SOURCE_SQL, self.__sample_sql),
+            self.__sample_source(SOURCE_DISCORD_STATUS, self.__sample_discord_status),
+            self.__sample_source(SOURCE_PROCESS, self.__sample_process)
+        )
+        self.snapshot = HealthSnapshot(time.time(), sql_db_latency, discord_status, process)
+
+        return self.snapshot
+
+    async def __sample_source(self, source: str, sampler: Callable[[], Awaitable]) -> Optional[object]:
+        """
+        Runs a sampler if the source is enabled, errors are logged and give None
+
+        IN:
+            source - the source name
+            sampler - the coroutine function sampling the source
+
+        OUT:
+            the sampled value or None
+        """
+        if source not in self.sources:
+            return None
+
+        try:
+            return await sampler()
+
+        except Exception:
+            logger.exception(f"Failed to sample health source '{source}'.")
+            return None
+
+    @staticmethod
+    async def __sample_sql() -> Optional[float]:
+        """
+        Measures the latency of a trivial query
+
+        OUT:
+            latency in ms or None if the db isn't available
+        """
+        sesh = sql_utils.NewAsyncSession()
+        if sesh is None:
+            return None
+
+        async with sesh:
+            sesh: sql_utils.AsyncSession
+            start = time.perf_counter()
+            await sesh.execute(sql_utils.select(1))
+            end = time.perf_counter()
+
+        return (end - start)*1000
+
+    async def __sample_discord_status(self) -> Optional[DiscordStatus]:
+        """
+        Fetches and parses discord status
+        """
+        return parse_discord_status(await self.__status_fetcher())
+
+    async def __sample_process(self) -> ProcessStats:
+        """
+        Collects process stats in a thread, memory_full_info walks /proc/self/smaps and may be slow
+        """
+        return await asyncio.to_thread(self.__collect_process_stats)
+
+    def __collect_process_stats(self) -> ProcessStats:
+        """
+        Collects process stats, cpu usage is averaged since the previous call
+        """
+        proc = self.__process
+        with proc.oneshot():
+            return ProcessStats(
+                psutil.cpu_percent(),
+                proc.memory_percent(),
+                proc.memory_full_info().uss,
+                proc.create_time()
+            )
+
+
+class LagOffender(NamedTuple):
+    """
+    A moment when the loop was blocked for longer than the threshold
+    """
+    time: float
+    # In ms
+    lag: float
+    # The loop thread stack during the block or the slow callback description, may be None
+    source: Optional[str]
+
+
+class _SlowCallbackHandler(logging.Handler):
+    """
+    Catches the slow callback warnings asyncio emits in debug mode
+    """
+    def __init__(self, monitor: "LoopLagMonitor") -> None:
+        """
+        Constructor
+
+        IN:
+            monitor - the monitor to report to
+        """
+        super().__init__(logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Handles a record
+        """
+        # Executing <Handle ...> took 0.123 seconds
+        if record.msg.startswith("Executing") and len(record.args) == 2:
+            callback, duration = record.args
+            self.monitor.add_offender(duration*1000, f"Callback: {callback}")
+
+
+class LoopLagMonitor():
+    """
+    Measures how late the event loop wakes up a periodic timer,
+    a watchdog thread captures the loop thread stack while the loop is blocked,
+    so we can see what blocked it
+    """
+    __slots__ = (
+        "interval",
+        "threshold",
+        "histogram",
+        "offenders",
+        "__loop",
+        "__loop_thread_id",
+        "__heartbeat",
+        "__stall_stack",
+        "__task",
+        "__watchdog",
+        "__stop_event",
+        "__debug_handler"
+    )
+
+    def __init__(self, interval: float = DEF_LAG_INTERVAL, threshold: float = DEF_LAG_THRESHOLD) -> None:
+        """
+        Constructor
+
+        IN:
+            interval - how often we measure the lag in seconds
+                (Default: DEF_LAG_INTERVAL)
+            threshold - the lag in ms above which we log the offender
+                (Default: DEF_LAG_THRESHOLD)
+        """
+        if interval <= 0 or threshold <= 0:
+            raise ValueError("Interval and threshold must be positive.")
+
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = Histogram()
+        self.offenders: Deque[LagOffender] = deque(maxlen=MAX_LAG_OFFENDERS)
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__loop_thread_id: Optional[int] = None
+        self.__heartbeat = 0.0
+        self.__stall_stack: Optional[str] = None
+        self.__task: Optional[asyncio.Task] = None
+        self.__watchdog: Optional[threading.Thread] = None
+        self.__stop_event = threading.Event()
+        self.__debug_handler: Optional[_SlowCallbackHandler] = None
+
+    def is_running(self) -> bool:
+        """
+        Checks if the monitor is running
+        """
+        return self.__task is not None and not self.__task.done()
+
+    def start(self, debug: bool = False) -> None:
+        """
+        Starts monitoring the running loop, does nothing if it's already running
+
+        IN:
+            debug - whether or not to also enable asyncio debug mode to catch slow callbacks,
+                this has noticeable overhead
+                (Default: False)
+        """
+        if self.is_running():
+            return
+
+        self.__loop = asyncio.get_running_loop()
+        self.__loop_thread_id = threading.get_ident()
+        self.__heartbeat = time.monotonic()
+        self.__stop_event.clear()
+        self.__task = asyncio.create_task(self.__run())
+        self.__watchdog = threading.Thread(target=self.__watch, name="LoopLagWatchdog", daemon=True)
+        self.__watchdog.start()
+
+        if debug:
+            self.__loop.set_debug(True)
+            self.__loop.slow_callback_duration = self.threshold / 1000
+            self.__debug_handler = _SlowCallbackHandler(self)
+            logging.getLogger("asyncio").addHandler(self.__debug_handler)
+
+    def stop(self) -> None:
+        """
+        Stops monitoring
+        """
+        self.__stop_event.set()
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+        # The watchdog wakes up at least every threshold / 2, so this is a short wait,
+        # without it a quick restart could clear the event before the old watchdog sees it
+        if self.__watchdog is not None:
+            self.__watchdog.join()
+            self.__watchdog = None
+
+        if self.__debug_handler is not None:
+            logging.getLogger("asyncio").removeHandler(self.__debug_handler)
+            self.__debug_handler = None
+            self.__loop.set_debug(False)
+
+    def add_offender(self, lag: float, source: Optional[str]) -> None:
+        """
+        Records and logs an offender
+
+        IN:
+            lag - the lag in ms
+            source - what caused it, if known
+        """
+        self.offenders.append(LagOffender(time.time(), lag, source))
+        if source:
+            logger.warning(f"Event loop was blocked for {lag:0.0f} ms.\n{source}")
+
+        else:
+            logger.warning(f"Event loop was blocked for {lag:0.0f} ms.")
+
+    async def __run(self) -> None:
+        """
+        Measures the timer drift
+        """
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.__heartbeat = now
+
+            lag = max(now - start - self.interval, 0.0) * 1000
+            self.histogram.add(lag)
+            if lag >= self.threshold:
+                stack, self.__stall_stack = self.__stall_stack, None
+                self.add_offender(lag, stack)
+
+            else:
+                self.__stall_stack = None
+
+    def __watch(self) -> None:
+        """
+        Runs in a thread, takes the loop thread stack once the loop is late by the threshold
+        """
+        deadline = self.interval + self.threshold / 1000
+        period = max(self.threshold / 2000, 0.001)
+        last_captured = None
+
+        while not self.__stop_event.wait(period):
+            heartbeat = self.__heartbeat
+            if heartbeat == last_captured or time.monotonic() - heartbeat < deadline:
+                continue
+
+            frame = sys._current_frames().get(self.__loop_thread_id, None)
+            if frame is None:
+                continue
+
+            stack = traceback.format_stack(frame, limit=LAG_STACK_DEPTH)
+            del frame
+            self.__stall_stack = "Stack:\n" + "".join(stack).rstrip()
+            # One capture per stall
+            last_captured = heartbeat
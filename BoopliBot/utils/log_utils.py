@@ -4,13 +4,22 @@ Module that handles logging
 
 import os
 import sys
+import json
 import logging
+import threading
+import traceback
 from logging import handlers as log_handlers
 from queue import Queue
+from typing import (
+    Optional,
+    List,
+    Dict
+)
 
 
 LOG_FOLDER = "logs"
 MAIN_LOG_FILE = "booplibot.log"
+MAIN_JSON_LOG_FILE = "booplibot.jsonl"
 WARNINGS_LOG_FILE = "warnings.log"
 
 DEF_FMT = "[{asctime}] [{levelname}] [{name}]: {message}"
@@ -23,20 +32,334 @@ MAX_LOG_BACKUPS = 10
 EXEC_INFO = logging.INFO + 5
 logging.addLevelName(EXEC_INFO, "EXECUTION")
 
+FORMAT_TEXT = "text"
+FORMAT_JSON = "json"
+FORMATS = (FORMAT_TEXT, FORMAT_JSON)
+# The loggers we route through the queue
+ROOT_LOGGERS = ("BoopliBot", "discord")
+# The main log is buffered, in characters
+DEF_BUFFER_SIZE = 64*1024
+# In seconds
+DEF_FLUSH_INTERVAL = 1.0
+
 
 logger: logging.Logger = None
 # Writes logs in a thread
 log_listener: log_handlers.QueueListener = None
+# The handler of the main log and its settings, so we can reconfigure it
+_main_log_handler: logging.FileHandler = None
+_main_log_settings: tuple = None
+# Map logger name -> the level set for it at runtime
+_logger_levels: Dict[str, int] = dict()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as JSON objects, one per line
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        """
+        Formats a record
+
+        IN:
+            record - the record
+
+        OUT:
+            str with the JSON object
+        """
+        data = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    File handler that keeps formatted records in memory and writes them in batches
+    NOTE: the buffer is written once it reaches buffer_size, every flush_interval seconds,
+        and right away for records of flush_level and above
+    """
+    def __init__(
+        self,
+        filename: str,
+        mode: str = "a",
+        encoding: Optional[str] = None,
+        delay: bool = False,
+        buffer_size: int = DEF_BUFFER_SIZE,
+        flush_interval: float = DEF_FLUSH_INTERVAL,
+        flush_level: int = logging.ERROR
+    ) -> None:
+        """
+        Constructor
+
+        IN:
+            filename - the path to the file
+            mode - the mode to open the file with
+                (Default: "a")
+            encoding - the encoding of the file
+                (Default: None)
+            delay - whether or not to open the file on the first write
+                (Default: False)
+            buffer_size - the number of characters after which we write the buffer
+                (Default: DEF_BUFFER_SIZE)
+            flush_interval - the max time the records stay in the buffer, in seconds
+                (Default: DEF_FLUSH_INTERVAL)
+            flush_level - the min level of records that are written right away
+                (Default: logging.ERROR)
+        """
+        super().__init__(filename, mode=mode, encoding=encoding, delay=delay)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+        self.__buffer: List[str] = list()
+        self.__buffered = 0
+        self.__stop_event = threading.Event()
+        self.__flusher: Optional[threading.Thread] = None
+
+    def __run_flusher(self) -> None:
+        """
+        Runs in a thread, writes the buffer periodically
+        """
+        while not self.__stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        Adds a record to the buffer
+
+        IN:
+            record - the record
+        """
+        try:
+            msg = self.format(record)
+
+        except Exception:
+            self.handleError(record)
+            return
+
+        self.__buffer.append(msg)
+        self.__buffered += len(msg)
+
+        if self.__buffered >= self.buffer_size or record.levelno >= self.flush_level:
+            try:
+                self.flush()
+
+            except Exception:
+                self.handleError(record)
+
+        elif self.__flusher is None:
+            self.__flusher = threading.Thread(target=self.__run_flusher, name="LogFlusher", daemon=True)
+            self.__flusher.start()
+
+    def flush(self) -> None:
+        """
+        Writes the buffer to the file
+        """
+        self.acquire()
+        try:
+            if self.__buffer:
+                if self.stream is None:
+                    if self.mode == "w" and self._closed:
+                        return
+                    self.stream = self._open()
+
+                terminator = self.terminator
+                self.stream.write(terminator.join(self.__buffer) + terminator)
+                self.__buffer.clear()
+                self.__buffered = 0
+
+            super().flush()
+
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        """
+        Writes the buffer and closes the file
+        """
+        self.__stop_event.set()
+        if self.__flusher is not None and self.__flusher is not threading.current_thread():
+            self.__flusher.join()
+        self.__flusher = None
+
+        try:
+            self.flush()
+
+        finally:
+            super().close()
+
+
+def _get_main_log_handler(logs_path: str, log_format: str, buffer_size: int, flush_interval: float, mode: str) -> logging.FileHandler:
+    """
+    Creates the main log handler
+
+    IN:
+        logs_path - the path to the logs folder
+        log_format - the format of the log (one of FORMATS)
+        buffer_size - the size of the write buffer, 0 to write every record right away
+        flush_interval - the max time the records stay in the buffer, in seconds
+        mode - the mode to open the file with
+
+    OUT:
+        the handler
+    """
+    if log_format == FORMAT_JSON:
+        filename = os.path.join(logs_path, MAIN_JSON_LOG_FILE)
+        formatter = JsonFormatter()
+
+    else:
+        filename = os.path.join(logs_path, MAIN_LOG_FILE)
+        formatter = logging.Formatter(fmt=DEF_FMT, datefmt=DEF_DATEFMT, style=F_STYLE)
+
+    if buffer_size > 0:
+        handler = BufferedFileHandler(
+            filename=filename,
+            mode=mode,
+            encoding="utf-8",
+            delay=True,
+            buffer_size=buffer_size,
+            flush_interval=flush_interval
+        )
+
+    else:
+        handler = logging.FileHandler(
+            filename=filename,
+            mode=mode,
+            encoding="utf-8",
+            delay=True
+        )
+
+    handler.setFormatter(formatter)
+    handler.setLevel(logging.INFO)
+
+    return handler
+
+
+def parse_level(value: str) -> int:
+    """
+    Converts a level name or number into a level
+
+    IN:
+        value - the name (case insensitive) or the number
 
+    OUT:
+        int
+    """
+    if value.isdigit():
+        return int(value)
+
+    level = logging.getLevelName(value.upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {value}")
+
+    return level
+
+def get_handlers_level() -> int:
+    """
+    Returns the lowest level our handlers write, records below it would be dropped by every handler
+
+    OUT:
+        int
+    """
+    return min(handler.level for handler in log_listener.handlers)
+
+def _apply_levels() -> None:
+    """
+    Sets the levels of our loggers from the handlers levels, so records that no handler
+    would write are never created and queued
+    """
+    handlers_level = get_handlers_level()
+    for name in ROOT_LOGGERS:
+        logging.getLogger(name).setLevel(max(_logger_levels.get(name, logging.NOTSET), handlers_level))
+
+    for name, level in _logger_levels.items():
+        if name not in ROOT_LOGGERS:
+            logging.getLogger(name).setLevel(max(level, handlers_level))
+
+def get_levels() -> Dict[str, int]:
+    """
+    Returns the effective levels of our loggers and the loggers that had their level set
+
+    OUT:
+        dict logger name -> level
+    """
+    return {
+        name: logging.getLogger(name).getEffectiveLevel()
+        for name in (*ROOT_LOGGERS, *sorted(_logger_levels.keys() - set(ROOT_LOGGERS)))
+    }
+
+def get_verbosity() -> int:
+    """
+    Returns the level of the main log
+
+    OUT:
+        int
+    """
+    return _main_log_handler.level
+
+def set_verbosity(level: int) -> None:
+    """
+    Sets the level of the main log and updates the loggers levels
+
+    IN:
+        level - the new level
+    """
+    _main_log_handler.setLevel(level)
+    _apply_levels()
 
-def init(should_log=True) -> None:
+def set_logger_level(name: str, level: Optional[int]) -> None:
+    """
+    Sets the level of a logger, it can't go below what the handlers write
+
+    IN:
+        name - the logger name
+        level - the new level, None to reset
+    """
+    if level is None:
+        _logger_levels.pop(name, None)
+        if name not in ROOT_LOGGERS:
+            logging.getLogger(name).setLevel(logging.NOTSET)
+
+    else:
+        _logger_levels[name] = level
+
+    _apply_levels()
+
+def init(
+    should_log=True,
+    log_format: str = FORMAT_TEXT,
+    buffer_size: int = DEF_BUFFER_SIZE,
+    flush_interval: float = DEF_FLUSH_INTERVAL
+) -> None:
     """
     Inits logs
 
     IN:
         should_log - whether or not we should log about successful init
+        log_format - the format of the main log (one of FORMATS)
+            (Default: FORMAT_TEXT)
+        buffer_size - the size of the main log write buffer, 0 to write every record right away
+            (Default: DEF_BUFFER_SIZE)
+        flush_interval - the max time the records stay in the buffer, in seconds
+            (Default: DEF_FLUSH_INTERVAL)
     """
-    global logger, log_listener
+    global logger, log_listener, _main_log_handler, _main_log_settings
 
     # First of all, check the folder
     logs_path = os.path.join(os.getcwd(), LOG_FOLDER)
@@ -52,14 +375,9 @@ def init(should_log=True) -> None:
     console_handler.setLevel(EXEC_INFO)
 
     # Main log handler - info+
-    main_log_handler = logging.FileHandler(
-        filename=os.path.join(logs_path, MAIN_LOG_FILE),
-        mode="w",
-        encoding="utf-8",
-        delay=True
-    )
-    main_log_handler.setFormatter(def_formatter)
-    main_log_handler.setLevel(logging.INFO)
+    main_log_handler = _get_main_log_handler(logs_path, log_format, buffer_size, flush_interval, "w")
+    _main_log_handler = main_log_handler
+    _main_log_settings = (log_format, buffer_size, flush_interval)
 
     # Persistent log handler - warnings+
     warnings_log_handler = log_handlers.RotatingFileHandler(
@@ -86,13 +404,9 @@ def init(should_log=True) -> None:
         respect_handler_level=True
     )
 
-    booplibot_logger = logging.getLogger("BoopliBot")
-    booplibot_logger.setLevel(logging.DEBUG)
-    booplibot_logger.addHandler(queue_handler)
-
-    discordpy_logger = logging.getLogger("discord")
-    discordpy_logger.setLevel(logging.DEBUG)
-    discordpy_logger.addHandler(queue_handler)
+    for logger_name in ROOT_LOGGERS:
+        logging.getLogger(logger_name).addHandler(queue_handler)
+    _apply_levels()
 
     log_listener.start()
 
@@ -100,6 +414,48 @@ def init(should_log=True) -> None:
     if should_log:
         logger.info("Logs inited.")
 
+def configure(
+    log_format: Optional[str] = None,
+    buffer_size: Optional[int] = None,
+    flush_interval: Optional[float] = None
+) -> None:
+    """
+    Reconfigures the main log, used once the config is loaded
+    NOTE: the listener is restarted, so the records in the queue are written with the old handler
+
+    IN:
+        log_format - the format of the main log (one of FORMATS), None for the default
+            (Default: None)
+        buffer_size - the size of the main log write buffer, None for the default
+            (Default: None)
+        flush_interval - the max time the records stay in the buffer, None for the default
+            (Default: None)
+    """
+    global _main_log_handler, _main_log_settings
+
+    settings = (
+        log_format or FORMAT_TEXT,
+        DEF_BUFFER_SIZE if buffer_size is None else buffer_size,
+        flush_interval or DEF_FLUSH_INTERVAL
+    )
+    if settings == _main_log_settings:
+        return
+
+    old_handler = _main_log_handler
+    log_listener.stop()
+    old_handler.flush()
+    # Keep what was already written if we continue the same file
+    mode = "a" if settings[0] == _main_log_settings[0] and old_handler.stream is not None else "w"
+    old_handler.close()
+    _main_log_handler = _get_main_log_handler(os.path.dirname(old_handler.baseFilename), *settings, mode)
+    _main_log_handler.setLevel(old_handler.level)
+    _main_log_settings = settings
+    log_listener.handlers = tuple(
+        _main_log_handler if handler is old_handler else handler
+        for handler in log_listener.handlers
+    )
+    log_listener.start()
+
 def deinit(should_log=True) -> None:
     """
     Deinits logs
@@ -111,7 +467,11 @@ def deinit(should_log=True) -> None:
         logger.info("Logs deinited.")
     log_listener.stop()
 
-    for logger_name in ("BoopliBot", "discord"):
+    for logger_name in _logger_levels.keys():
+        logging.getLogger(logger_name).setLevel(logging.NOTSET)
+    _logger_levels.clear()
+
+    for logger_name in ROOT_LOGGERS:
         logger_ = logging.getLogger(logger_name)
         for handler in logger_.handlers:
             logger_.removeHandler(handler)
@@ -0,0 +1,496 @@
+"""
+Module that estimates memory usage of the bot structures and tracks allocations with tracemalloc
+"""
+
+import os
+import sys
+import asyncio
+import enum
+import logging
+import random
+import tracemalloc
+import weakref
+from collections import deque
+from types import (
+    BuiltinFunctionType,
+    CodeType,
+    FrameType,
+    FunctionType,
+    MethodType,
+    ModuleType
+)
+from collections.abc import (
+    Iterable
+)
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Optional,
+    List,
+    Set,
+    Tuple,
+    Dict,
+    NamedTuple
+)
+
+
+import discord
+import discord.http
+import discord.state
+import sqlalchemy
+import sqlalchemy.orm
+
+
+from . import (
+    log_utils,
+    sql_utils
+)
+
+if TYPE_CHECKING:
+    from ..bot import Bot
+
+
+# How many children of a container we measure, bigger containers are extrapolated
+DEF_SAMPLE_SIZE = 100
+MAX_DEPTH = 64
+DEF_TRACE_FRAMES = 1
+DEF_TOP_STATS = 10
+
+# Objects we never count as part of a structure, they are shared by everything
+_SHARED_TYPES = (
+    type,
+    ModuleType,
+    FunctionType,
+    BuiltinFunctionType,
+    MethodType,
+    CodeType,
+    FrameType,
+    enum.Enum,
+    weakref.ref,
+    logging.Logger,
+    asyncio.AbstractEventLoop,
+    discord.Client,
+    discord.state.ConnectionState,
+    discord.http.HTTPClient,
+    sqlalchemy.schema.SchemaItem,
+    sqlalchemy.engine.Dialect,
+    sqlalchemy.orm.Mapper
+)
+_ATOMIC_TYPES = (str, bytes, bytearray, int, float, complex, bool, type(None))
+
+
+class StructureSize(NamedTuple):
+    """
+    Estimated size of a structure
+    """
+    name: str
+    # The number of entries
+    count: int
+    # In bytes
+    nbytes: int
+
+
+def _is_shared(obj: Any, is_entry: bool) -> bool:
+    """
+    Checks if an object is shared and should not be counted as a part of the structure
+    NOTE: discord models (anything with an id) are kept in their own caches,
+        so we don't follow references between them
+
+    IN:
+        obj - the object
+        is_entry - whether or not the object is an entry of the structure (or the structure itself)
+
+    OUT:
+        boolean
+    """
+    if isinstance(obj, _SHARED_TYPES):
+        return True
+
+    return (
+        not is_entry
+        and type(obj).__module__.startswith("discord.")
+        and isinstance(getattr(obj, "id", None), int)
+    )
+
+def _get_slot_values(obj: Any) -> List[Any]:
+    """
+    Returns the values of the slots of an object
+
+    IN:
+        obj - the object
+
+    OUT:
+        list of values of the set slots
+    """
+    values = list()
+    for cls in type(obj).__mro__:
+        slots = cls.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+
+        for name in slots:
+            if name.startswith("__") and not name.endswith("__"):
+                name = f"_{cls.__name__.lstrip('_')}{name}"
+
+            descriptor = cls.__dict__.get(name, None)
+            if descriptor is None or not hasattr(descriptor, "__get__"):
+                continue
+
+            try:
+                values.append(descriptor.__get__(obj, cls))
+
+            except AttributeError:
+                pass
+
+    return values
+
+def _get_children(obj: Any) -> List[Any]:
+    """
+    Returns the objects referenced by an object that we count towards its size
+
+    IN:
+        obj - the object
+
+    OUT:
+        list of objects
+    """
+    if isinstance(obj, _ATOMIC_TYPES):
+        return []
+
+    if isinstance(obj, dict):
+        return [*obj.keys(), *obj.values()]
+
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return list(obj)
+
+    children = _get_slot_values(obj)
+    obj_dict = getattr(obj, "__dict__", None)
+    if isinstance(obj_dict, dict):
+        children.append(obj_dict)
+
+    return children
+
+def _estimate_size(obj: Any, entry_depth: int, sample_size: int, seen: Set[int], depth: int) -> float:
+    """
+    Estimates the size of an object and everything it references
+
+    IN:
+        obj - the object
+        entry_depth - the depth of the entries of the structure we measure
+        sample_size - the max number of children of a container we measure
+        seen - the ids of the objects we already counted
+        depth - the current depth
+
+    OUT:
+        size in bytes
+    """
+    obj_id = id(obj)
+    if obj_id in seen or depth > MAX_DEPTH or _is_shared(obj, depth <= entry_depth):
+        return 0
+
+    seen.add(obj_id)
+    size = sys.getsizeof(obj)
+
+    children = _get_children(obj)
+    if not children:
+        return size
+
+    scale = 1.0
+    if len(children) > sample_size:
+        scale = len(children) / sample_size
+        children = random.sample(children, sample_size)
+
+    depth += 1
+    return size + scale * sum(_estimate_size(child, entry_depth, sample_size, seen, depth) for child in children)
+
+def estimate_size(
+    obj: Any,
+    sample_size: int = DEF_SAMPLE_SIZE,
+    entry_depth: int = 0,
+    seen: Optional[Set[int]] = None
+) -> int:
+    """
+    Estimates the size of an object and everything it references, containers with more than
+    sample_size entries are estimated from a random sample of their entries
+    NOTE: shared objects (types, functions, etc) aren't counted, discord models are counted only
+        up to entry_depth (e.g. 2 for a list of dicts of members)
+
+    IN:
+        obj - the object
+        sample_size - the max number of entries of a container we measure
+            (Default: DEF_SAMPLE_SIZE)
+        entry_depth - the depth of the entries of the structure
+            (Default: 0)
+        seen - the ids of the objects to skip, updated in place
+            (Default: None)
+
+    OUT:
+        size in bytes
+    """
+    if seen is None:
+        seen = set()
+
+    return round(_estimate_size(obj, entry_depth, max(sample_size, 1), seen, 0))
+
+
+def _get_bot_structures(bot: "Bot") -> List[Tuple[str, int, Any, int]]:
+    """
+    Returns the structures of the bot we measure
+
+    IN:
+        bot - the bot
+
+    OUT:
+        list of (name, entries count, object, entry depth)
+    """
+    state = bot._connection
+    guilds = bot.guilds
+    users = list(state._users.values())
+    members = [guild._members for guild in guilds]
+    channels = [guild._channels for guild in guilds]
+    messages = state._messages if state._messages is not None else ()
+
+    structures = [
+        ("discord_users", len(users), users, 1),
+        ("discord_members", sum(len(guild_members) for guild_members in members), members, 2),
+        ("discord_channels", sum(len(guild_channels) for guild_channels in channels), channels, 2),
+        ("discord_messages", len(messages), messages, 1),
+        ("guilds_configs", len(bot.guilds_configs), bot.guilds_configs, 0),
+        ("custom_commands", len(bot.custom_commands), bot.custom_commands, 0),
+        ("message_store", len(bot.message_store), bot.message_store, 0),
+        ("author_index", len(bot.author_index), bot.author_index, 0)
+    ]
+
+    log_cog = bot.get_cog("Logger")
+    if log_cog is not None:
+        structures.append(("log_queues", log_cog.get_queue_stats()[0], log_cog.log_queues, 0))
+
+    if log_utils.log_listener is not None:
+        records = log_utils.log_listener.queue.queue
+        structures.append(("log_records", len(records), records, 0))
+
+    if sql_utils.async_engine is not None:
+        compiled_cache = sql_utils.async_engine.sync_engine._compiled_cache
+        if compiled_cache is not None:
+            structures.append(("sql_compiled_cache", len(compiled_cache), compiled_cache, 0))
+
+    if sql_utils.query_profiler is not None:
+        structures.append(("sql_profiler", len(sql_utils.query_profiler.stats), sql_utils.query_profiler, 0))
+
+    return structures
+
+def measure_bot(bot: "Bot", sample_size: int = DEF_SAMPLE_SIZE) -> List[StructureSize]:
+    """
+    Estimates the sizes of the major structures of the bot
+
+    IN:
+        bot - the bot
+        sample_size - the max number of entries of a container we measure
+            (Default: DEF_SAMPLE_SIZE)
+
+    OUT:
+        list of StructureSize
+    """
+    return [
+        StructureSize(name, count, estimate_size(obj, sample_size, entry_depth))
+        for name, count, obj, entry_depth in _get_bot_structures(bot)
+    ]
+
+
+class MemoryTracker():
+    """
+    Keeps the previous measurements so we can see what grows between them
+    """
+    __slots__ = ("sizes", "snapshot", "__started_tracing")
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        # The last measurement, map name -> size
+        self.sizes: Dict[str, StructureSize] = dict()
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.__started_tracing = False
+
+    async def measure(self, bot: "Bot", sample_size: int = DEF_SAMPLE_SIZE) -> List[Tuple[StructureSize, Optional[StructureSize]]]:
+        """
+        Measures the bot structures
+        NOTE: coro, the structures are live objects, so we measure them on the event loop,
+            yielding to it after each structure
+
+        IN:
+            bot - the bot
+            sample_size - the max number of entries of a container we measure
+                (Default: DEF_SAMPLE_SIZE)
+
+        OUT:
+            list of (current size, previous size or None)
+        """
+        sizes = list()
+        for name, count, obj, entry_depth in _get_bot_structures(bot):
+            sizes.append(StructureSize(name, count, estimate_size(obj, sample_size, entry_depth)))
+            await asyncio.sleep(0)
+
+        results = [(size, self.sizes.get(size.name, None)) for size in sizes]
+        self.sizes = {size.name: size for size in sizes}
+
+        return results
+
+    def is_tracing(self) -> bool:
+        """
+        Checks if tracemalloc is tracing
+        """
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self, nframes: int = DEF_TRACE_FRAMES) -> None:
+        """
+        Starts tracemalloc, does nothing if it's already tracing
+        NOTE: tracing slows down allocations, keep it on only while looking for leaks
+
+        IN:
+            nframes - how many frames to store per allocation
+                (Default: DEF_TRACE_FRAMES)
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(nframes)
+            self.__started_tracing = True
+
+    def stop_tracing(self) -> None:
+        """
+        Stops tracemalloc if we started it and drops the snapshot
+        """
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+        self.snapshot = None
+
+    @staticmethod
+    def _take_snapshot(
+        previous: Optional[tracemalloc.Snapshot],
+        amount: int
+    ) -> Tuple[tracemalloc.Snapshot, List[tracemalloc.Statistic], Optional[List[tracemalloc.StatisticDiff]]]:
+        """
+        Takes a tracemalloc snapshot and compares it with the previous one
+        NOTE: doesn't touch the bot, so it's safe to run in a thread
+
+        IN:
+            previous - the previous snapshot or None
+            amount - how many lines to return
+
+        OUT:
+            tuple of the snapshot, the top allocation lines and the top growing lines (None if there was no previous snapshot)
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<unknown>")
+            )
+        )
+        top = snapshot.statistics("lineno")[:amount]
+
+        diff = None
+        if previous is not None:
+            diff = [stat for stat in snapshot.compare_to(previous, "lineno") if stat.size_diff > 0][:amount]
+
+        return snapshot, top, diff
+
+    async def take_snapshot(self, amount: int = DEF_TOP_STATS) -> Tuple[List[tracemalloc.Statistic], Optional[List[tracemalloc.StatisticDiff]]]:
+        """
+        Takes a tracemalloc snapshot and compares it with the previous one
+        NOTE: coro, grouping and comparing the traces takes seconds with many allocations,
+            so it runs in a thread
+
+        IN:
+            amount - how many lines to return
+                (Default: DEF_TOP_STATS)
+
+        OUT:
+            tuple of the top allocation lines and the top growing lines (None if there was no previous snapshot)
+        """
+        snapshot, top, diff = await asyncio.to_thread(self._take_snapshot, self.snapshot, amount)
+        # Tracing could've been stopped while we were waiting
+        if tracemalloc.is_tracing():
+            self.snapshot = snapshot
+
+        return top, diff
+
+
+def fmt_size(nbytes: float) -> str:
+    """
+    Formats a size in bytes into a short string
+
+    IN:
+        nbytes - the size
+
+    OUT:
+        str
+    """
+    sign = "-" if nbytes < 0 else ""
+    nbytes = abs(nbytes)
+    for unit in ("B", "KiB", "MiB"):
+        if nbytes < 1024:
+            return f"{sign}{nbytes:0.0f} {unit}" if unit == "B" else f"{sign}{nbytes:0.1f} {unit}"
+        nbytes /= 1024
+
+    return f"{sign}{nbytes:0.1f} GiB"
+
+def format_structure_sizes(results: Iterable[Tuple[StructureSize, Optional[StructureSize]]]) -> str:
+    """
+    Formats sizes into a fixed width table
+
+    IN:
+        results - list of (current size, previous size or None)
+
+    OUT:
+        the table
+    """
+    lines = [f"{'Structure':<20} {'Entries':>8} {'Size':>11} {'Change':>11}"]
+    total = 0
+    for size, previous in results:
+        total += size.nbytes
+        change = "" if previous is None else fmt_size(size.nbytes - previous.nbytes)
+        lines.append(f"{size.name:<20} {size.count:>8} {fmt_size(size.nbytes):>11} {change:>11}")
+
+    lines.append(f"{'Total':<20} {'':>8} {fmt_size(total):>11}")
+
+    return "\n".join(lines)
+
+def _fmt_frame(frame: tracemalloc.Frame) -> str:
+    """
+    Formats a traceback frame with a short path
+
+    IN:
+        frame - the frame
+
+    OUT:
+        str
+    """
+    parts = frame.filename.replace(os.sep, "/").rsplit("/", 2)
+    return f"{'/'.join(parts[-2:])}:{frame.lineno}"
+
+def format_snapshot(top: Iterable[tracemalloc.Statistic], diff: Optional[Iterable[tracemalloc.StatisticDiff]]) -> str:
+    """
+    Formats the results of MemoryTracker.take_snapshot
+
+    IN:
+        top - the top allocation lines
+        diff - the top growing lines or None
+
+    OUT:
+        str
+    """
+    lines = ["Top by size:"]
+    for stat in top:
+        lines.append(f"{fmt_size(stat.size):>11} {stat.count:>8}x  {_fmt_frame(stat.traceback[0])}")
+
+    lines.append("")
+    if diff is None:
+        lines.append("No previous snapshot to compare with.")
+
+    else:
+        lines.append("Growth since the previous snapshot:")
+        for stat in diff:
+            lines.append(f"{'+' + fmt_size(stat.size_diff):>11} {stat.count_diff:>+8}x  {_fmt_frame(stat.traceback[0])}")
+
+    return "\n".join(lines)
@@ -0,0 +1,298 @@
+"""
+Module that serves bot metrics in the Prometheus text exposition format
+"""
+
+import logging
+import math
+from collections.abc import (
+    Iterable
+)
+from typing import (
+    TYPE_CHECKING,
+    Optional,
+    List,
+    Tuple
+)
+
+
+from aiohttp import web
+
+
+from . import (
+    log_utils,
+    stats_utils
+)
+from ..helpers import Histogram
+
+if TYPE_CHECKING:
+    from ..bot import Bot
+
+
+DEF_HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "booplibot_"
+
+logger = logging.getLogger(__name__)
+
+
+def _escape_label(value: str) -> str:
+    """
+    Escapes a label value
+
+    IN:
+        value - the value
+
+    OUT:
+        escaped value
+    """
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _fmt_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """
+    Formats labels
+
+    IN:
+        labels - (name, value) pairs
+
+    OUT:
+        the labels in braces or an empty string
+    """
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f"{name}=\"{_escape_label(str(value))}\"" for name, value in labels) + "}"
+
+def _fmt_value(value: float) -> str:
+    """
+    Formats a sample value
+    """
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _MetricsWriter():
+    """
+    Builds the exposition text
+    """
+    __slots__ = ("lines",)
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.lines: List[str] = list()
+
+    def header(self, name: str, type_: str, help_: str) -> None:
+        """
+        Writes the HELP and TYPE lines of a metric
+        """
+        self.lines.append(f"# HELP {PREFIX}{name} {help_}")
+        self.lines.append(f"# TYPE {PREFIX}{name} {type_}")
+
+    def sample(self, name: str, value: float, labels: Tuple[Tuple[str, str], ...] = ()) -> None:
+        """
+        Writes a sample
+        """
+        self.lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+
+    def metric(self, name: str, type_: str, help_: str, samples: Iterable[Tuple[Tuple[Tuple[str, str], ...], float]]) -> None:
+        """
+        Writes a metric with its samples
+        """
+        self.header(name, type_, help_)
+        for labels, value in samples:
+            self.sample(name, value, labels)
+
+    def histogram(self, name: str, hist: Histogram, labels: Tuple[Tuple[str, str], ...] = (), scale: float = 1.0) -> None:
+        """
+        Writes the samples of a histogram
+
+        IN:
+            name - the metric name
+            hist - the histogram
+            labels - extra labels
+            scale - multiplier for the bounds and the sum (e.g. 0.001 for ms -> s)
+        """
+        cumulative = 0
+        for bound, count in zip(hist.bounds, hist.counts):
+            cumulative += count
+            self.sample(f"{name}_bucket", cumulative, labels + (("le", _fmt_value(bound * scale)),))
+        self.sample(f"{name}_bucket", hist.count, labels + (("le", "+Inf"),))
+        self.sample(f"{name}_sum", hist.sum * scale, labels)
+        self.sample(f"{name}_count", hist.count, labels)
+
+    def render(self) -> str:
+        """
+        Returns the text
+        """
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics(bot: "Bot") -> str:
+    """
+    Collects the metrics of the bot, everything is read from the existing stats,
+    so the cost is paid only when someone scrapes
+
+    IN:
+        bot - the bot
+
+    OUT:
+        the exposition text
+    """
+    writer = _MetricsWriter()
+
+    writer.metric(
+        "events_total",
+        "counter",
+        "Dispatched events.",
+        (((("event", name),), count) for name, count in sorted(bot.event_stats.counts.items()))
+    )
+
+    handler_totals = sorted(bot.event_stats.get_event_totals().items())
+    writer.metric(
+        "event_handler_busy_seconds_total",
+        "counter",
+        "Event loop time spent in event handlers.",
+        (((("event", name),), total.busy) for name, total in handler_totals)
+    )
+    writer.metric(
+        "event_handler_calls_total",
+        "counter",
+        "Event handler calls.",
+        (((("event", name),), total.calls) for name, total in handler_totals)
+    )
+
+    writer.metric(
+        "shard_latency_seconds",
+        "gauge",
+        "Gateway heartbeat latency per shard.",
+        (((("shard", shard_id),), latency) for shard_id, latency in bot.latencies if math.isfinite(latency))
+    )
+
+    writer.header("command_latency_seconds", "histogram", "Command latency.")
+    command_stats = bot.command_stats.items()
+    for name, entry in command_stats:
+        writer.histogram("command_latency_seconds", entry.total, (("command", name),), 0.001)
+
+    writer.header("command_time_seconds_total", "counter", "Command time by kind (db, rest, local).")
+    for name, entry in command_stats:
+        for kind, hist in (("db", entry.db), ("rest", entry.rest), ("local", entry.local)):
+            writer.sample("command_time_seconds_total", hist.sum * 0.001, (("command", name), ("kind", kind)))
+
+    writer.metric(
+        "command_errors_total",
+        "counter",
+        "Command errors by exception type.",
+        (
+            ((("command", name), ("error", exc_name)), count)
+            for name, entry in command_stats
+            for exc_name, count in entry.errors.items()
+        )
+    )
+
+    writer.header("db_query_seconds", "histogram", "DB query latency.")
+    writer.histogram("db_query_seconds", stats_utils.query_totals.latency, scale=0.001)
+
+    writer.header("loop_lag_seconds", "histogram", "Event loop lag.")
+    writer.histogram("loop_lag_seconds", bot.loop_monitor.histogram, scale=0.001)
+
+    writer.metric(
+        "cache_entries",
+        "gauge",
+        "Number of entries in the bot caches.",
+        (
+            ((("cache", "guilds_configs"),), len(bot.guilds_configs)),
+            ((("cache", "custom_commands"),), len(bot.custom_commands)),
+            ((("cache", "message_store"),), len(bot.message_store)),
+            ((("cache", "author_index"),), len(bot.author_index)),
+            ((("cache", "discord_messages"),), len(bot.cached_messages)),
+            ((("cache", "discord_guilds"),), len(bot.guilds))
+        )
+    )
+
+    log_cog = bot.get_cog("Logger")
+    if log_cog is not None:
+        pending, dropped, summarized = log_cog.get_queue_stats()
+        writer.metric("log_events_pending", "gauge", "Log events waiting for delivery.", (((), pending),))
+        writer.metric("log_events_dropped_total", "counter", "Log events dropped on overflow.", (((), dropped),))
+        writer.metric("log_events_summarized_total", "counter", "Log events summarized on overflow.", (((), summarized),))
+
+    if log_utils.log_listener is not None:
+        writer.metric(
+            "log_records_pending",
+            "gauge",
+            "Log records waiting for the log listener thread.",
+            (((), log_utils.log_listener.queue.qsize()),)
+        )
+
+    rate_limits = bot.rate_limit_counter
+    writer.metric("ratelimit_hits_total", "counter", "REST requests that hit a rate limit (429).", (((), rate_limits.hits),))
+    writer.metric("ratelimit_global_hits_total", "counter", "Global rate limit hits.", (((), rate_limits.global_hits),))
+    writer.metric("ratelimit_wait_seconds_total", "counter", "Time spent waiting on rate limits.", (((), rate_limits.wait_time),))
+
+    return writer.render()
+
+
+class MetricsServer():
+    """
+    Lightweight HTTP server exposing /metrics
+    """
+    __slots__ = ("bot", "host", "port", "__runner")
+
+    def __init__(self, bot: "Bot", port: int, host: str = DEF_HOST) -> None:
+        """
+        Constructor
+
+        IN:
+            bot - the bot
+            port - the port to listen on
+            host - the interface to listen on
+                (Default: DEF_HOST)
+        """
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.__runner: Optional[web.AppRunner] = None
+
+    def is_running(self) -> bool:
+        """
+        Checks if the server is running
+        """
+        return self.__runner is not None
+
+    async def __handle_metrics(self, request: web.Request) -> web.Response:
+        """
+        Handles GET /metrics
+        """
+        return web.Response(body=render_metrics(self.bot).encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self) -> None:
+        """
+        Starts the server, does nothing if it's already running
+        """
+        if self.is_running():
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.__handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+
+        except Exception:
+            await runner.cleanup()
+            raise
+
+        self.__runner = runner
+        logger.info(f"Serving metrics on {self.host}:{self.port}.")
+
+    async def stop(self) -> None:
+        """
+        Stops the server
+        """
+        if self.__runner is not None:
+            runner, self.__runner = self.__runner, None
+            await runner.cleanup()
@@ -0,0 +1,239 @@
+"""
+Module that provides a statistical stack sampler, the results can be exported as collapsed stacks
+(the format used by flamegraph.pl, speedscope and other flame graph tools)
+"""
+
+import os
+import sys
+import asyncio
+import threading
+import time
+from collections import Counter
+from types import (
+    CodeType,
+    FrameType
+)
+from typing import (
+    Optional,
+    List,
+    Dict
+)
+
+
+# In seconds
+DEF_SAMPLE_INTERVAL = 0.01
+MIN_SAMPLE_INTERVAL = 0.001
+# We don't walk deeper than this, recursion could make stacks huge
+MAX_STACK_DEPTH = 128
+
+_PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StackSampler():
+    """
+    Samples thread stacks on a timer thread and counts identical stacks
+    NOTE: the sampled threads aren't interrupted, we only read their current frames,
+        so the overhead is limited to the sampler thread holding the GIL while it walks the stacks
+    """
+    __slots__ = (
+        "interval",
+        "all_threads",
+        "stacks",
+        "sample_count",
+        "elapsed",
+        "__target_thread_id",
+        "__labels",
+        "__thread",
+        "__stop_event"
+    )
+
+    def __init__(self, interval: float = DEF_SAMPLE_INTERVAL, all_threads: bool = False) -> None:
+        """
+        Constructor
+
+        IN:
+            interval - the time between samples, in seconds
+                (Default: DEF_SAMPLE_INTERVAL)
+            all_threads - whether or not to sample all threads, by default
+                we sample only the thread that started the sampler (the event loop thread)
+                (Default: False)
+        """
+        self.interval = max(interval, MIN_SAMPLE_INTERVAL)
+        self.all_threads = all_threads
+        # Map collapsed stack -> number of samples
+        self.stacks: Counter = Counter()
+        self.sample_count = 0
+        # In seconds
+        self.elapsed = 0.0
+        self.__target_thread_id: Optional[int] = None
+        # Cache of frame labels, so we format every code object only once
+        self.__labels: Dict[CodeType, str] = dict()
+        self.__thread: Optional[threading.Thread] = None
+        self.__stop_event = threading.Event()
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return f"<{type(self).__name__}(samples={self.sample_count}, stacks={len(self.stacks)})>"
+
+    def is_running(self) -> bool:
+        """
+        Checks if the sampler is running
+        """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self) -> None:
+        """
+        Starts sampling, does nothing if it's already running
+        """
+        if self.is_running():
+            return
+
+        self.__target_thread_id = threading.get_ident()
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name="StackSampler", daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops sampling and waits for the sampler thread
+        """
+        if self.__thread is not None:
+            self.__stop_event.set()
+            self.__thread.join()
+            self.__thread = None
+
+    def clear(self) -> None:
+        """
+        Drops the collected samples
+        """
+        self.stacks.clear()
+        self.sample_count = 0
+        self.elapsed = 0.0
+
+    def _get_label(self, code: CodeType) -> str:
+        """
+        Returns the label of a frame
+
+        IN:
+            code - the code object of the frame
+
+        OUT:
+            label in the 'function (file:line)' format
+        """
+        label = self.__labels.get(code, None)
+        if label is None:
+            filename = code.co_filename
+            if filename.startswith(_PACKAGE_ROOT):
+                filename = filename[len(_PACKAGE_ROOT) + 1:]
+
+            else:
+                filename = os.path.basename(filename)
+
+            # Semicolons separate frames and spaces separate the count in the collapsed format
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self.__labels[code] = label
+
+        return label
+
+    def _add_stack(self, frame: Optional[FrameType], thread_name: Optional[str] = None) -> None:
+        """
+        Adds a sample
+
+        IN:
+            frame - the top frame of the stack
+            thread_name - the name of the thread to add as the root frame
+                (Default: None)
+        """
+        labels: List[str] = list()
+        get_label = self._get_label
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(get_label(frame.f_code))
+            frame = frame.f_back
+
+        if thread_name is not None:
+            labels.append(thread_name.replace(";", ":").replace(" ", "_"))
+
+        labels.reverse()
+        self.stacks[";".join(labels)] += 1
+
+    def sample(self) -> None:
+        """
+        Takes a single sample
+        """
+        own_id = threading.get_ident()
+        frames = sys._current_frames()
+        try:
+            if self.all_threads:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self._add_stack(frame, names.get(thread_id, str(thread_id)))
+
+            else:
+                frame = frames.get(self.__target_thread_id, None)
+                if frame is None:
+                    return
+                self._add_stack(frame)
+
+        finally:
+            del frames
+
+        self.sample_count += 1
+
+    def __run(self) -> None:
+        """
+        Runs in a thread, samples until stopped
+        """
+        start = time.perf_counter()
+        next_sample = start
+        while True:
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay < 0:
+                # We fell behind, don't try to catch up with a burst of samples
+                next_sample -= delay
+                delay = 0
+
+            if self.__stop_event.wait(delay):
+                break
+
+            self.sample()
+
+        self.elapsed += time.perf_counter() - start
+
+    def to_collapsed(self) -> str:
+        """
+        Exports the samples as collapsed stacks, one 'frame;frame;frame count' line per stack
+
+        OUT:
+            str
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+async def sample_stacks(duration: float, interval: float = DEF_SAMPLE_INTERVAL, all_threads: bool = False) -> StackSampler:
+    """
+    Samples stacks for the given time
+    NOTE: coro, must be called from the event loop thread
+
+    IN:
+        duration - for how long to sample, in seconds
+        interval - the time between samples, in seconds
+            (Default: DEF_SAMPLE_INTERVAL)
+        all_threads - whether or not to sample all threads
+            (Default: False)
+
+    OUT:
+        the stopped sampler with the results
+    """
+    sampler = StackSampler(interval, all_threads)
+    sampler.start()
+    try:
+        await asyncio.sleep(duration)
+
+    finally:
+        sampler.stop()
+
+    return sampler
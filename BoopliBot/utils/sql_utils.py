@@ -2,9 +2,22 @@
 Module that contains utils for sql dbs
 """
 
+import os
+import re
+import sys
+import time
+import heapq
 import logging
+from itertools import count
+from collections.abc import (
+    Iterable
+)
 from typing import (
-    Optional
+    Optional,
+    List,
+    Tuple,
+    Dict,
+    NamedTuple
 )
 
 
@@ -25,12 +38,21 @@ from sqlalchemy import (
     String,
     Boolean
 )
+from sqlalchemy.dialects.sqlite import (
+    insert as sqlite_insert
+)
 from sqlalchemy.orm import (
     declarative_base,
     sessionmaker,
     Session
 )
 
+try:
+    import greenlet
+
+except ImportError:
+    greenlet = None
+
 
 DB_FILE = "booplibot.db"
 ENGINE_URL = f"sqlite:///{DB_FILE}"
@@ -47,6 +69,19 @@ metadata: sqlalchemy.MetaData = Base.metadata
 logger = logging.getLogger(__name__)
 inited = False
 
+# sqlite allows 999 variables per statement in older versions, each row takes 3
+MAX_ROWS_PER_INSERT = 300
+
+DEF_SLOWEST_QUERIES = 20
+# Max number of raw statements we keep normalized forms for
+MAX_NORMALIZED_CACHE = 1000
+_PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_THIS_FILE = os.path.abspath(__file__)
+# Collapse placeholder lists and multi-row values so they group into one statement
+_PLACEHOLDER_LIST_PATTERN = re.compile(r"\?(?:\s*,\s*\?)+")
+_VALUES_ROWS_PATTERN = re.compile(r"\(\?, \.\.\.\)(?:\s*,\s*\(\?, \.\.\.\))+")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
 
 class GuildConfig(Base):
     """
@@ -58,6 +93,11 @@ class GuildConfig(Base):
     prefix = Column(String, nullable=False)
     enable_cc = Column(Boolean, nullable=False, server_default="0")
     log_channel = Column(Integer)
+    # Per category log channels, NULL falls back to log_channel, 0 disables the category
+    log_messages_channel = Column(Integer)
+    log_members_channel = Column(Integer)
+    log_moderation_channel = Column(Integer)
+    log_threads_channel = Column(Integer)
     welcome_channel = Column(Integer)
     system_channel = Column(Integer)
 
@@ -69,6 +109,10 @@ class GuildConfig(Base):
             f"prefix='{self.prefix}', "
             f"enable_cc={self.enable_cc}, "
             f"log_channel={self.log_channel}, "
+            f"log_messages_channel={self.log_messages_channel}, "
+            f"log_members_channel={self.log_members_channel}, "
+            f"log_moderation_channel={self.log_moderation_channel}, "
+            f"log_threads_channel={self.log_threads_channel}, "
             f"welcome_channel={self.welcome_channel}, "
             f"system_channel={self.system_channel})"
         )
@@ -121,6 +165,35 @@ class CustomCommand(Base):
 custom_command_table = CustomCommand.__table__
 
 
+def _add_missing_columns(engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Adds columns that were added to the models after their tables had been created
+    NOTE: create_all doesn't alter existing tables
+    NOTE: only supports nullable columns or columns with a server default
+
+    IN:
+        engine - the engine to use
+    """
+    inspector = sqlalchemy.inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                if not column.nullable and column.server_default is None:
+                    logger.error(f"Can't add column '{column.name}' to table '{table.name}': it requires a default value.")
+                    continue
+
+                column_def = f"{column.name} {column.type.compile(dialect=engine.dialect)}"
+                if not column.nullable:
+                    column_def += " NOT NULL"
+                if column.server_default is not None:
+                    column_def += f" DEFAULT {column.server_default.arg}"
+                conn.execute(sqlalchemy.text(f"ALTER TABLE {table.name} ADD COLUMN {column_def}"))
+                logger.info(f"Added column '{column.name}' to table '{table.name}'.")
+
 def init(should_log=True) -> None:
     """
     Inits sql dbs
@@ -136,6 +209,7 @@ def init(should_log=True) -> None:
     AsyncSessionFactory = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False, future=True)
 
     metadata.create_all(engine)
+    _add_missing_columns(engine)
 
     inited = True
 
@@ -151,6 +225,7 @@ def deinit(should_log=True) -> None:
     """
     global inited, engine, async_engine, SessionFactory, AsyncSessionFactory
 
+    disable_query_profiling()
     inited = False
 
     engine = None
@@ -216,3 +291,356 @@ def to_dict(model) -> dict:
         rv[col] = value
 
     return rv
+
+def get_increment_user_counter_stmts(guild_id: int, user_ids: Iterable[int], counter: str) -> List[sqlalchemy.sql.Insert]:
+    """
+    Builds upsert statements that increment a counter for many users at once
+
+    IN:
+        guild_id - the guild id
+        user_ids - the ids of the users
+        counter - the name of the counter column (e.g. 'total_bans')
+
+    OUT:
+        list of statements, one per MAX_ROWS_PER_INSERT users
+    """
+    counter_column = user_data_table.columns[counter]
+    user_ids = list(user_ids)
+    stmts = list()
+    for i in range(0, len(user_ids), MAX_ROWS_PER_INSERT):
+        stmt = sqlite_insert(User).values(
+            [
+                {"guild_id": guild_id, "user_id": user_id, counter: 1}
+                for user_id in user_ids[i:i+MAX_ROWS_PER_INSERT]
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=(User.guild_id, User.user_id),
+            set_={counter: counter_column + 1}
+        )
+        stmts.append(stmt)
+
+    return stmts
+
+async def increment_user_counter(guild_id: int, user_ids: Iterable[int], counter: str) -> None:
+    """
+    Increments a counter for many users in one transaction
+
+    IN:
+        guild_id - the guild id
+        user_ids - the ids of the users
+        counter - the name of the counter column (e.g. 'total_bans')
+    """
+    stmts = get_increment_user_counter_stmts(guild_id, user_ids, counter)
+    if not stmts:
+        return
+
+    async with NewAsyncSession() as sesh:
+        sesh: AsyncSession
+        for stmt in stmts:
+            await sesh.execute(stmt)
+        await sesh.commit()
+
+def get_warn_user_stmt(guild_id: int, user_id: int) -> sqlalchemy.sql.Insert:
+    """
+    Builds an upsert statement that gives a user a warning and returns their current warnings
+
+    IN:
+        guild_id - the guild id
+        user_id - the user id
+
+    OUT:
+        the statement
+    """
+    stmt = sqlite_insert(User).values(guild_id=guild_id, user_id=user_id, current_warns=1, total_warns=1)
+    return (
+        stmt.on_conflict_do_update(
+            index_elements=(User.guild_id, User.user_id),
+            set_={
+                "current_warns": User.current_warns + 1,
+                "total_warns": User.total_warns + 1
+            }
+        )
+        .returning(User.current_warns)
+    )
+
+def get_unwarn_user_stmt(guild_id: int, user_id: int) -> sqlalchemy.sql.Update:
+    """
+    Builds an update statement that removes a warning from a user and returns their current warnings,
+    doesn't affect users without warnings
+
+    IN:
+        guild_id - the guild id
+        user_id - the user id
+
+    OUT:
+        the statement
+    """
+    return (
+        update(User)
+        .where(User.guild_id == guild_id, User.user_id == user_id, User.current_warns > 0)
+        .values(current_warns=User.current_warns - 1)
+        .returning(User.current_warns)
+    )
+
+async def warn_user(guild_id: int, user_id: int) -> int:
+    """
+    Gives a user a warning in one statement
+
+    IN:
+        guild_id - the guild id
+        user_id - the user id
+
+    OUT:
+        the number of warnings the user has now
+    """
+    async with NewAsyncSession() as sesh:
+        sesh: AsyncSession
+        warnings = (await sesh.execute(get_warn_user_stmt(guild_id, user_id))).scalar_one()
+        await sesh.commit()
+
+    return warnings
+
+async def unwarn_user(guild_id: int, user_id: int) -> Optional[int]:
+    """
+    Removes a warning from a user in one statement
+
+    IN:
+        guild_id - the guild id
+        user_id - the user id
+
+    OUT:
+        the number of warnings the user has now,
+        None if they had no warnings
+    """
+    async with NewAsyncSession() as sesh:
+        sesh: AsyncSession
+        warnings = (await sesh.execute(get_unwarn_user_stmt(guild_id, user_id))).scalar_one_or_none()
+        await sesh.commit()
+
+    return warnings
+
+
+class QueryStats():
+    """
+    Aggregated stats of one normalized statement from one call site, times are in ms
+    """
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return f"<{type(self).__name__}(count={self.count}, total={self.total:0.2f}, max={self.max:0.2f})>"
+
+class SlowQuery(NamedTuple):
+    """
+    One slow query
+    """
+    # In ms
+    elapsed: float
+    statement: str
+    site: str
+    time: float
+
+class QueryProfiler():
+    """
+    Aggregates query times per normalized statement and call site
+    and keeps the slowest queries
+    """
+    __slots__ = ("slowest_amount", "stats", "__slowest", "__counter", "__normalized")
+
+    def __init__(self, slowest_amount: int = DEF_SLOWEST_QUERIES) -> None:
+        """
+        Constructor
+
+        IN:
+            slowest_amount - how many slowest queries we keep
+                (Default: DEF_SLOWEST_QUERIES)
+        """
+        if slowest_amount < 1:
+            raise ValueError(f"Amount of slowest queries must be at least 1, got {slowest_amount}.")
+
+        self.slowest_amount = slowest_amount
+        self.stats: Dict[Tuple[str, str], QueryStats] = dict()
+        # Min heap of (elapsed, seq, SlowQuery)
+        self.__slowest: List[Tuple[float, int, SlowQuery]] = list()
+        self.__counter = count()
+        self.__normalized: Dict[str, str] = dict()
+
+    def normalize(self, statement: str) -> str:
+        """
+        Normalizes a statement, so queries that differ only in the number of parameters group together
+
+        IN:
+            statement - the statement
+
+        OUT:
+            normalized statement
+        """
+        normalized = self.__normalized.get(statement, None)
+        if normalized is None:
+            normalized = _WHITESPACE_PATTERN.sub(" ", statement).strip()
+            normalized = _PLACEHOLDER_LIST_PATTERN.sub("?, ...", normalized)
+            normalized = _VALUES_ROWS_PATTERN.sub("(?, ...), ...", normalized)
+
+            if len(self.__normalized) >= MAX_NORMALIZED_CACHE:
+                self.__normalized.clear()
+            self.__normalized[statement] = normalized
+
+        return normalized
+
+    @staticmethod
+    def get_call_site() -> str:
+        """
+        Finds the first frame in our code outside of this module,
+        for async sessions the search continues from the greenlet that awaits the query
+
+        OUT:
+            'path:line (function)' relative to the package or 'unknown'
+        """
+        frame = sys._getframe(1)
+        current_greenlet = greenlet.getcurrent() if greenlet is not None else None
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(_PACKAGE_DIR) and filename != _THIS_FILE:
+                return f"{filename[len(_PACKAGE_DIR):]}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+            frame = frame.f_back
+            if frame is None and current_greenlet is not None:
+                current_greenlet = current_greenlet.parent
+                if current_greenlet is not None:
+                    frame = current_greenlet.gr_frame
+
+        return "unknown"
+
+    def add(self, statement: str, site: str, elapsed: float) -> None:
+        """
+        Records a query
+
+        IN:
+            statement - the raw statement
+            site - the call site
+            elapsed - the time in ms
+        """
+        normalized = self.normalize(statement)
+        key = (normalized, site)
+        stats = self.stats.get(key, None)
+        if stats is None:
+            stats = self.stats[key] = QueryStats()
+
+        stats.count += 1
+        stats.total += elapsed
+        if elapsed > stats.max:
+            stats.max = elapsed
+
+        slowest = self.__slowest
+        if len(slowest) < self.slowest_amount or elapsed > slowest[0][0]:
+            item = (elapsed, next(self.__counter), SlowQuery(elapsed, normalized, site, time.time()))
+            if len(slowest) < self.slowest_amount:
+                heapq.heappush(slowest, item)
+
+            else:
+                heapq.heapreplace(slowest, item)
+
+    def get_slowest(self) -> List[SlowQuery]:
+        """
+        Returns the slowest queries, from the slowest
+        """
+        return [item[2] for item in sorted(self.__slowest, reverse=True)]
+
+    def get_top(self, amount: int) -> List[Tuple[str, str, QueryStats]]:
+        """
+        Returns the statements with the most total time
+
+        IN:
+            amount - how many to return
+
+        OUT:
+            list of (statement, site, stats)
+        """
+        top = heapq.nlargest(amount, self.stats.items(), key=lambda item: item[1].total)
+        return [(statement, site, stats) for (statement, site), stats in top]
+
+    def clear(self) -> None:
+        """
+        Resets the stats
+        """
+        self.stats.clear()
+        self.__slowest.clear()
+        self.__normalized.clear()
+
+# None when profiling is off
+query_profiler: Optional[QueryProfiler] = None
+
+def _profile_before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    Engine event handler, remembers when the query started
+    """
+    context._profile_start = time.perf_counter()
+
+def _profile_after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    Engine event handler, records the query
+    """
+    start = getattr(context, "_profile_start", None)
+    profiler = query_profiler
+    if start is not None and profiler is not None:
+        elapsed = (time.perf_counter() - start) * 1000
+        profiler.add(statement, QueryProfiler.get_call_site(), elapsed)
+
+def _get_engines() -> List[sqlalchemy.engine.Engine]:
+    """
+    Returns the sync engines we profile
+    """
+    engines = list()
+    if engine is not None:
+        engines.append(engine)
+    if async_engine is not None:
+        engines.append(async_engine.sync_engine)
+
+    return engines
+
+def enable_query_profiling(slowest_amount: int = DEF_SLOWEST_QUERIES) -> QueryProfiler:
+    """
+    Starts profiling queries, without this the profiler has no cost at all
+
+    IN:
+        slowest_amount - how many slowest queries we keep
+            (Default: DEF_SLOWEST_QUERIES)
+
+    OUT:
+        the profiler
+    """
+    global query_profiler
+
+    if query_profiler is None:
+        query_profiler = QueryProfiler(slowest_amount)
+
+    for engine_ in _get_engines():
+        if not sqlalchemy.event.contains(engine_, "before_cursor_execute", _profile_before_cursor_execute):
+            sqlalchemy.event.listen(engine_, "before_cursor_execute", _profile_before_cursor_execute)
+            sqlalchemy.event.listen(engine_, "after_cursor_execute", _profile_after_cursor_execute)
+
+    return query_profiler
+
+def disable_query_profiling() -> None:
+    """
+    Stops profiling queries and drops the stats
+    """
+    global query_profiler
+
+    for engine_ in _get_engines():
+        if sqlalchemy.event.contains(engine_, "before_cursor_execute", _profile_before_cursor_execute):
+            sqlalchemy.event.remove(engine_, "before_cursor_execute", _profile_before_cursor_execute)
+            sqlalchemy.event.remove(engine_, "after_cursor_execute", _profile_after_cursor_execute)
+
+    query_profiler = None
@@ -0,0 +1,626 @@
+"""
+Module that collects runtime stats (command latencies and errors, db queries, events, rate limits)
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from collections.abc import (
+    Callable,
+    Coroutine,
+    Generator,
+    Iterator
+)
+from typing import (
+    Any,
+    Optional,
+    List,
+    Tuple,
+    Dict
+)
+
+
+import sqlalchemy
+
+
+from ..helpers import Histogram
+
+
+class _Timings():
+    """
+    Time spent waiting on external services by the current command
+    """
+    __slots__ = ("db", "rest")
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.db = 0.0
+        self.rest = 0.0
+
+# Timings of the command running in the current task, None outside of commands
+_current_timings: ContextVar[Optional[_Timings]] = ContextVar("current_timings", default=None)
+
+
+def add_db_time(seconds: float) -> None:
+    """
+    Adds DB time to the command running in the current task, if any
+
+    IN:
+        seconds - the time
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.db += seconds
+
+def add_rest_time(seconds: float) -> None:
+    """
+    Adds REST time to the command running in the current task, if any
+
+    IN:
+        seconds - the time
+    """
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.rest += seconds
+
+class QueryTotals():
+    """
+    Count and latency of all DB queries, times are in ms
+    """
+    __slots__ = ("latency",)
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.latency = Histogram()
+
+    @property
+    def count(self) -> int:
+        """
+        Returns the number of queries
+        """
+        return self.latency.count
+
+# Totals for every engine with attached hooks
+query_totals = QueryTotals()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    Engine event handler, remembers when the query started
+    """
+    context._stats_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    """
+    Engine event handler, records the query time and adds it to the command
+    """
+    start = getattr(context, "_stats_start", None)
+    if start is not None:
+        elapsed = time.perf_counter() - start
+        query_totals.latency.add(elapsed * 1000)
+        add_db_time(elapsed)
+
+def attach_sql_hooks(engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Starts measuring queries on the engine
+    NOTE: for async engines pass their sync_engine
+
+    IN:
+        engine - the engine
+    """
+    if not sqlalchemy.event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        sqlalchemy.event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        sqlalchemy.event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def detach_sql_hooks(engine: sqlalchemy.engine.Engine) -> None:
+    """
+    Stops measuring queries on the engine
+
+    IN:
+        engine - the engine
+    """
+    if sqlalchemy.event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        sqlalchemy.event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+        sqlalchemy.event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+def wrap_http_request(request: Callable) -> Callable:
+    """
+    Wraps discord.py HTTPClient.request to measure REST time of commands
+
+    IN:
+        request - the bound request method
+
+    OUT:
+        the wrapper
+    """
+    @wraps(request)
+    async def wrapper(*args, **kwargs) -> Any:
+        if _current_timings.get() is None:
+            return await request(*args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return await request(*args, **kwargs)
+
+        finally:
+            add_rest_time(time.perf_counter() - start)
+
+    return wrapper
+
+
+class RateLimitCounter(logging.Filter):
+    """
+    Counts the rate limits discord.py hits by looking at its log records,
+    attach it to the 'discord.http' logger
+    NOTE: never filters records out
+    """
+    MSG_RATE_LIMITED = "We are being rate limited."
+    MSG_GLOBAL_RATE_LIMITED = "Global rate limit has been hit."
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        super().__init__()
+        self.hits = 0
+        self.global_hits = 0
+        # In seconds
+        self.wait_time = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        Checks a record
+        """
+        if record.levelno >= logging.WARNING and isinstance(record.msg, str):
+            msg = record.msg
+            if msg.startswith(RateLimitCounter.MSG_RATE_LIMITED):
+                self.hits += 1
+                # The last arg is retry_after
+                if "Retrying in" in msg and record.args:
+                    self.wait_time += record.args[-1]
+
+            elif msg.startswith(RateLimitCounter.MSG_GLOBAL_RATE_LIMITED):
+                self.global_hits += 1
+
+        return True
+
+class _BusyTimer():
+    """
+    Awaitable that runs a coroutine and measures the time it spends on the event loop,
+    time spent waiting on futures isn't counted
+    """
+    __slots__ = ("coro", "busy")
+
+    def __init__(self, coro: Coroutine) -> None:
+        """
+        Constructor
+
+        IN:
+            coro - the coroutine
+        """
+        self.coro = coro
+        # In seconds
+        self.busy = 0.0
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        """
+        Drives the coroutine step by step, timing each step
+        """
+        coro = self.coro
+        send_value = None
+        throw_exc = None
+
+        while True:
+            start = time.perf_counter()
+            try:
+                if throw_exc is None:
+                    future = coro.send(send_value)
+
+                else:
+                    exc, throw_exc = throw_exc, None
+                    future = coro.throw(exc)
+
+            except StopIteration as e:
+                self.busy += time.perf_counter() - start
+                return e.value
+
+            except BaseException:
+                self.busy += time.perf_counter() - start
+                raise
+
+            self.busy += time.perf_counter() - start
+
+            try:
+                send_value = yield future
+
+            except GeneratorExit:
+                coro.close()
+                raise
+
+            except BaseException as e:
+                send_value = None
+                throw_exc = e
+
+class HandlerStats():
+    """
+    Cumulative stats of one event handler, times are in seconds
+    NOTE: busy is the time the handler ran on the event loop, wall includes its waits
+    """
+    __slots__ = ("calls", "busy", "wall", "max_busy")
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.calls = 0
+        self.busy = 0.0
+        self.wall = 0.0
+        self.max_busy = 0.0
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return f"<{type(self).__name__}(calls={self.calls}, busy={self.busy:0.3f}, wall={self.wall:0.3f})>"
+
+class EventStats():
+    """
+    Counts dispatched events and measures their handlers
+    """
+    __slots__ = ("counts", "handlers", "__last_summary", "__last_summary_time")
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.counts: Dict[str, int] = dict()
+        # Map (event name, handler name) -> stats
+        self.handlers: Dict[Tuple[str, str], HandlerStats] = dict()
+        # Map event name -> busy time at the previous summary
+        self.__last_summary: Dict[str, float] = dict()
+        self.__last_summary_time = time.monotonic()
+
+    def add(self, event_name: str) -> None:
+        """
+        Counts an event
+
+        IN:
+            event_name - the event name without the 'on_' prefix
+        """
+        counts = self.counts
+        counts[event_name] = counts.get(event_name, 0) + 1
+
+    async def run_handler(self, handler: Callable[..., Coroutine], event_name: str, *args, **kwargs) -> Any:
+        """
+        Runs an event handler and measures it
+
+        IN:
+            handler - the coroutine function
+            event_name - the handler method name (e.g. 'on_message')
+            args - the event args
+            kwargs - the event kwargs
+
+        OUT:
+            the handler result
+        """
+        timer = _BusyTimer(handler(*args, **kwargs))
+        start = time.perf_counter()
+        try:
+            return await timer
+
+        finally:
+            wall = time.perf_counter() - start
+            key = (event_name, getattr(handler, "__qualname__", repr(handler)))
+            stats = self.handlers.get(key, None)
+            if stats is None:
+                stats = self.handlers[key] = HandlerStats()
+
+            stats.calls += 1
+            stats.busy += timer.busy
+            stats.wall += wall
+            if timer.busy > stats.max_busy:
+                stats.max_busy = timer.busy
+
+    def get_event_totals(self) -> Dict[str, HandlerStats]:
+        """
+        Sums up handler stats per event
+
+        OUT:
+            dict event name -> HandlerStats
+        """
+        totals: Dict[str, HandlerStats] = dict()
+        for (event_name, handler_name), stats in self.handlers.items():
+            total = totals.get(event_name, None)
+            if total is None:
+                total = totals[event_name] = HandlerStats()
+
+            total.calls += stats.calls
+            total.busy += stats.busy
+            total.wall += stats.wall
+            total.max_busy = max(total.max_busy, stats.max_busy)
+
+        return totals
+
+    def get_busiest(self, amount: int) -> List[Tuple[Tuple[str, str], HandlerStats]]:
+        """
+        Returns the handlers that took the most loop time
+
+        IN:
+            amount - how many handlers to return
+
+        OUT:
+            list of ((event name, handler name), stats)
+        """
+        return sorted(self.handlers.items(), key=lambda item: item[1].busy, reverse=True)[:amount]
+
+    def clear(self) -> None:
+        """
+        Clears the handlers stats, the event counts are kept
+        """
+        self.handlers.clear()
+        self.__last_summary.clear()
+        self.__last_summary_time = time.monotonic()
+
+    def get_summary(self, amount: int = 10) -> str:
+        """
+        Builds a summary of the events that took the most loop time since the previous summary
+
+        IN:
+            amount - how many events to include
+                (Default: 10)
+
+        OUT:
+            the summary
+        """
+        now = time.monotonic()
+        period = now - self.__last_summary_time
+        totals = self.get_event_totals()
+
+        deltas = [
+            (event_name, total.busy - self.__last_summary.get(event_name, 0.0))
+            for event_name, total in totals.items()
+        ]
+        deltas.sort(key=lambda item: item[1], reverse=True)
+        busy_sum = sum(delta for event_name, delta in deltas)
+
+        lines = [f"Event handlers took {busy_sum:0.2f} s of loop time over the last {period:0.0f} s."]
+        for event_name, delta in deltas[:amount]:
+            if delta <= 0:
+                break
+            share = delta / busy_sum * 100
+            lines.append(f"{event_name}: {delta:0.3f} s ({share:0.1f}%), {self.counts.get(event_name[3:], 0)} dispatched total")
+
+        self.__last_summary = {event_name: total.busy for event_name, total in totals.items()}
+        self.__last_summary_time = now
+
+        return "\n".join(lines)
+
+class EventSummaryLogger():
+    """
+    Periodically logs the event handlers summary, the records go through the logging queue
+    """
+    __slots__ = ("event_stats", "interval", "logger", "__task")
+
+    def __init__(self, event_stats: EventStats, interval: float, logger: logging.Logger) -> None:
+        """
+        Constructor
+
+        IN:
+            event_stats - the stats to summarize
+            interval - the interval between summaries, in seconds
+            logger - the logger to write the summary with
+        """
+        self.event_stats = event_stats
+        self.interval = interval
+        self.logger = logger
+        self.__task: Optional[asyncio.Task] = None
+
+    def is_running(self) -> bool:
+        """
+        Checks if the summary task is running
+        """
+        return self.__task is not None and not self.__task.done()
+
+    def start(self) -> None:
+        """
+        Starts logging summaries, does nothing if it's already running
+        """
+        if not self.is_running():
+            self.__task = asyncio.create_task(self.__run())
+
+    def stop(self) -> None:
+        """
+        Stops logging summaries
+        """
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+
+    async def __run(self) -> None:
+        """
+        Summary loop
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            self.logger.info(self.event_stats.get_summary())
+
+class CommandEntry():
+    """
+    Stats of one command, all times are in ms
+    NOTE:
+        local is the time not spent on DB or REST requests,
+        it includes the time the command waited for the event loop
+    """
+    __slots__ = ("total", "db", "rest", "local", "errors")
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.total = Histogram()
+        self.db = Histogram()
+        self.rest = Histogram()
+        self.local = Histogram()
+        self.errors: Dict[str, int] = dict()
+
+    def __repr__(self) -> str:
+        """
+        Repr override
+        """
+        return f"<{type(self).__name__}(calls={self.total.count}, errors={sum(self.errors.values())})>"
+
+class CommandStats():
+    """
+    Per command latency histograms and error counters
+    """
+    __slots__ = ("__entries",)
+
+    def __init__(self) -> None:
+        """
+        Constructor
+        """
+        self.__entries: Dict[str, CommandEntry] = dict()
+
+    def __len__(self) -> int:
+        """
+        Returns the number of tracked commands
+        """
+        return len(self.__entries)
+
+    def __get_entry(self, name: str) -> CommandEntry:
+        """
+        Returns the entry for a command, creates it if needed
+        """
+        entry = self.__entries.get(name, None)
+        if entry is None:
+            entry = self.__entries[name] = CommandEntry()
+
+        return entry
+
+    def get(self, name: str) -> Optional[CommandEntry]:
+        """
+        Returns the entry for a command
+
+        IN:
+            name - the qualified name of the command
+
+        OUT:
+            CommandEntry or None if the command wasn't used
+        """
+        return self.__entries.get(name, None)
+
+    def items(self) -> List[Tuple[str, CommandEntry]]:
+        """
+        Returns (name, entry) pairs
+        """
+        return list(self.__entries.items())
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """
+        Measures a command invocation, DB and REST time spent by the current task is attributed to it
+
+        IN:
+            name - the qualified name of the command
+        """
+        timings = _Timings()
+        token = _current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            yield
+
+        finally:
+            total = (time.perf_counter() - start) * 1000
+            _current_timings.reset(token)
+
+            db = timings.db * 1000
+            rest = timings.rest * 1000
+            entry = self.__get_entry(name)
+            entry.total.add(total)
+            entry.db.add(db)
+            entry.rest.add(rest)
+            entry.local.add(max(total - db - rest, 0.0))
+
+    def add_error(self, name: str, exc: BaseException) -> None:
+        """
+        Counts an error of a command
+
+        IN:
+            name - the qualified name of the command
+            exc - the exception
+        """
+        # Unwrap CommandInvokeError and friends
+        exc = getattr(exc, "original", exc)
+        errors = self.__get_entry(name).errors
+        exc_name = type(exc).__name__
+        errors[exc_name] = errors.get(exc_name, 0) + 1
+
+    def get_slowest(self, amount: int, quantile: float = 0.99) -> List[Tuple[str, CommandEntry]]:
+        """
+        Returns the slowest commands
+
+        IN:
+            amount - how many commands to return
+            quantile - the latency quantile to sort by
+                (Default: 0.99)
+
+        OUT:
+            list of (name, entry) sorted from the slowest
+        """
+        entries = [item for item in self.__entries.items() if item[1].total.count]
+        entries.sort(key=lambda item: item[1].total.quantile(quantile), reverse=True)
+
+        return entries[:amount]
+
+    def clear(self) -> None:
+        """
+        Resets the stats
+        """
+        self.__entries.clear()
+
+def format_command_entries(entries: List[Tuple[str, CommandEntry]], name_width: int = 20) -> str:
+    """
+    Formats command stats into a fixed width table
+
+    IN:
+        entries - list of (name, entry)
+        name_width - the width of the name column
+            (Default: 20)
+
+    OUT:
+        the table
+    """
+    lines = [
+        f"{'Command':<{name_width}} {'Calls':>6} {'p50':>8} {'p99':>8} {'DB':>7} {'REST':>7} {'Local':>7} {'Errors':>6}"
+    ]
+    for name, entry in entries:
+        if len(name) > name_width:
+            name = name[:name_width - 1] + "…"
+
+        lines.append(
+            f"{name:<{name_width}} "
+            f"{entry.total.count:>6} "
+            f"{entry.total.quantile(0.5):>8.1f} "
+            f"{entry.total.quantile(0.99):>8.1f} "
+            f"{entry.db.mean:>7.1f} "
+            f"{entry.rest.mean:>7.1f} "
+            f"{entry.local.mean:>7.1f} "
+            f"{sum(entry.errors.values()):>6}"
+        )
+
+    errors = [
+        f"{name}: " + ", ".join(f"{exc_name} x{count}" for exc_name, count in entry.errors.items())
+        for name, entry in entries
+        if entry.errors
+    ]
+    if errors:
+        lines.append("")
+        lines.extend(errors)
+
+    return "\n".join(lines)
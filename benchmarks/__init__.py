@@ -0,0 +1,3 @@
+"""
+Package of benchmarks for BoopliBot
+"""
@@ -0,0 +1,155 @@
+"""
+Replays synthetic message edit traffic through Bot.on_message_edit and measures CPU time per edit.
+
+The traffic mix approximates a busy guild:
+    - link embeds unfurling (content is the same, embeds differ)
+    - regular typo fixes (content changed, no prefix)
+    - edited commands (content changed, starts with the prefix)
+
+process_commands is replaced with the part of it that doesn't need a connection:
+prefix resolution and argument parsing setup.
+
+Usage:
+    python -m benchmarks.bench_edit_replay [--edits N] [--seed N]
+"""
+
+import time
+import random
+import asyncio
+import argparse
+from functools import partial
+from types import SimpleNamespace
+
+
+import discord
+from discord.ext.commands.view import StringView
+
+
+from BoopliBot.bot import Bot
+from BoopliBot.helpers import NestedDictWrapper
+
+
+GUILDS = 100
+BOT_ID = 863427405765541918
+# Share of each kind of edit in the traffic
+UNFURL_SHARE = 0.6
+TYPO_SHARE = 0.38
+
+
+def _get_bot():
+    """
+    Returns a stand-in for the bot with loaded guild configs
+    """
+    guilds_configs = NestedDictWrapper(nesting_depth=1)
+    for guild_id in range(GUILDS):
+        guilds_configs[guild_id] = NestedDictWrapper(
+            dict(guild_id=guild_id, prefix="!", enable_cc=False, log_channel=None),
+            nesting_depth=0
+        )
+
+    processed = 0
+    async def process_commands(message):
+        nonlocal processed
+        processed += 1
+        prefixes = Bot._Bot__get_prefixes(bot, message)
+        view = StringView(message.content)
+        for prefix in prefixes:
+            if view.skip_string(prefix):
+                break
+
+    bot = SimpleNamespace(
+        guilds_configs=guilds_configs,
+        def_prefix="b!",
+        user=SimpleNamespace(id=BOT_ID, mention=f"<@{BOT_ID}>"),
+        process_commands=process_commands,
+        get_processed=lambda: processed
+    )
+    bot._Bot__get_guild_prefix = partial(Bot._Bot__get_guild_prefix, bot)
+    return bot
+
+def _get_message(guild, channel, author, content, embeds):
+    """
+    Returns a synthetic message
+    """
+    return SimpleNamespace(
+        guild=guild,
+        channel=channel,
+        author=author,
+        content=content,
+        pinned=False,
+        attachments=[],
+        embeds=embeds,
+        components=[]
+    )
+
+def _get_edits(amount: int, seed: int):
+    """
+    Returns pairs of synthetic messages (before, after)
+    """
+    rng = random.Random(seed)
+    author = SimpleNamespace(id=647602717296164864, bot=False)
+    guilds = [SimpleNamespace(id=guild_id) for guild_id in range(GUILDS)]
+    channels = [SimpleNamespace(id=guild_id + 1000) for guild_id in range(GUILDS)]
+    words = ("hello", "there", "this", "is", "a", "regular", "chat", "message", "with", "some", "words")
+
+    edits = list()
+    for i in range(amount):
+        guild_id = i % GUILDS
+        guild = guilds[guild_id]
+        channel = channels[guild_id]
+        roll = rng.random()
+        text = " ".join(rng.choice(words) for _ in range(rng.randint(3, 20)))
+
+        if roll < UNFURL_SHARE:
+            content = f"{text} https://example.com/{i}"
+            before = _get_message(guild, channel, author, content, [])
+            after = _get_message(guild, channel, author, content, [discord.Embed(title="Example", url=f"https://example.com/{i}")])
+
+        elif roll < UNFURL_SHARE + TYPO_SHARE:
+            before = _get_message(guild, channel, author, text + "x", [])
+            after = _get_message(guild, channel, author, text, [])
+
+        else:
+            before = _get_message(guild, channel, author, "!pnig", [])
+            after = _get_message(guild, channel, author, "!ping", [])
+
+        edits.append((before, after))
+
+    return edits
+
+async def _run(bot, edits) -> float:
+    """
+    Replays the edits
+
+    OUT:
+        used CPU time
+    """
+    on_message_edit = Bot.on_message_edit
+    start = time.process_time()
+    for before, after in edits:
+        await on_message_edit(bot, before, after)
+
+    return time.process_time() - start
+
+def main() -> None:
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edits", type=int, default=500000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    bot = _get_bot()
+    edits = _get_edits(args.edits, args.seed)
+    elapsed = asyncio.run(_run(bot, edits))
+
+    print(
+        f"Replayed {args.edits} edits in {elapsed:0.2f} s of CPU time "
+        f"({elapsed / args.edits * 1e9:0.0f} ns/edit), "
+        f"{bot.get_processed()} reached process_commands"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of log embed building for message edit/delete events.
+
+Usage:
+    python -m benchmarks.bench_log_embeds [--events N]
+"""
+
+import json
+import time
+import random
+import string
+import argparse
+from types import SimpleNamespace
+
+
+from BoopliBot.modules.logging import _LogEmbedBuilder
+
+
+def _get_messages(amount: int):
+    """
+    Generates pairs of synthetic messages (before, after) that quack like discord.Message
+    """
+    rng = random.Random(42)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(1, 10))) for i in range(2000)]
+    authors = [
+        SimpleNamespace(
+            id=647602717296164864 + i,
+            mention=f"<@{647602717296164864 + i}>",
+            avatar=SimpleNamespace(url=f"https://cdn.discordapp.com/avatars/{i}/avatar.png"),
+            bot=False
+        )
+        for i in range(100)
+    ]
+    channels = [SimpleNamespace(id=i, mention=f"<#{i}>") for i in range(20)]
+
+    for i in range(amount):
+        # Mostly short messages, some very long ones
+        length = rng.choice((5, 10, 20, 50, 400))
+        content = " ".join(rng.choices(words, k=length))
+        new_content = content.replace(rng.choice(content.split()), "edited", 1)
+        attachments = []
+        if rng.random() < 0.05:
+            attachments = [SimpleNamespace(proxy_url=f"https://media.discordapp.net/attachments/{i}/{j}.png") for j in range(3)]
+
+        message_id = 880000000000000000 + i
+        kwargs = dict(
+            id=message_id,
+            author=rng.choice(authors),
+            channel=rng.choice(channels),
+            jump_url=f"https://discord.com/channels/1/2/{message_id}",
+            attachments=attachments
+        )
+        yield SimpleNamespace(content=content, **kwargs), SimpleNamespace(content=new_content, **kwargs)
+
+def main() -> None:
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+
+    pairs = list(_get_messages(args.events // 2))
+
+    start = time.perf_counter()
+    for before, after in pairs:
+        _LogEmbedBuilder.get_msg_edit_embed(before, after)
+        _LogEmbedBuilder.get_msg_del_embed(before)
+    elapsed = time.perf_counter() - start
+
+    total = len(pairs) * 2
+    print(f"Built {total} edit/delete embeds in {elapsed:0.2f} s ({elapsed / total * 1e6:0.1f} us/event)")
+
+    # Payload of the edit logs
+    edit_embeds = [_LogEmbedBuilder.get_msg_edit_embed(before, after) for before, after in pairs]
+    embeds_len = sum(len(embed) for embed in edit_embeds if embed is not None)
+    payload_len = sum(len(json.dumps(embed.to_dict())) for embed in edit_embeds if embed is not None)
+    print(f"Edit embeds: {embeds_len / len(pairs):0.0f} chars/embed, {payload_len / len(pairs):0.0f} bytes of json/embed")
+
+
+if __name__ == "__main__":
+    main()
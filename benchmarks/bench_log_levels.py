@@ -0,0 +1,110 @@
+"""
+Benchmark of the CPU time spent on gateway debug logging, with the discord logger
+at DEBUG (records are created, queued and dropped by the handlers) and with the levels
+computed from the handlers levels.
+
+Usage:
+    python -m benchmarks.bench_log_levels [--events N] [--repeat N]
+"""
+
+import os
+import time
+import logging
+import argparse
+import tempfile
+
+
+from BoopliBot.utils import log_utils
+
+
+def _get_payload(i: int) -> dict:
+    """
+    Returns a payload that looks like a MESSAGE_CREATE dispatch
+    """
+    return {
+        "t": "MESSAGE_CREATE",
+        "s": i,
+        "op": 0,
+        "d": {
+            "id": str(1100000000000000000 + i),
+            "channel_id": "1000000000000000000",
+            "guild_id": "900000000000000000",
+            "content": "Hello there, this is a message of a typical length " * 2,
+            "author": {
+                "id": "647602717296164864",
+                "username": "someone",
+                "global_name": "Someone",
+                "avatar": "a_0123456789abcdef0123456789abcdef",
+                "discriminator": "0"
+            },
+            "member": {"roles": ["1", "2", "3"], "nick": None, "joined_at": "2021-01-01T00:00:00+00:00"},
+            "attachments": [],
+            "embeds": [],
+            "mentions": [],
+            "mention_roles": [],
+            "pinned": False,
+            "tts": False,
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "type": 0
+        }
+    }
+
+def _run(payloads, force_debug: bool) -> float:
+    """
+    Logs the payloads like discord.py does for every gateway event
+
+    IN:
+        payloads - the payloads
+        force_debug - whether or not to set the discord logger to DEBUG
+
+    OUT:
+        CPU time, including the listener thread
+    """
+    log_utils.init(should_log=False)
+    if force_debug:
+        logging.getLogger("discord").setLevel(logging.DEBUG)
+
+    gateway_logger = logging.getLogger("discord.gateway")
+    try:
+        start = time.process_time()
+        for payload in payloads:
+            gateway_logger.debug("For Shard ID %s: WebSocket Event: %s", 0, payload)
+        # Waits for the listener to handle everything
+        log_utils.log_listener.stop()
+        elapsed = time.process_time() - start
+        log_utils.log_listener.start()
+
+    finally:
+        log_utils.deinit(should_log=False)
+
+    return elapsed
+
+def main() -> None:
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = [_get_payload(i) for i in range(args.events)]
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            debug = min(_run(payloads, True) for i in range(args.repeat))
+            computed = min(_run(payloads, False) for i in range(args.repeat))
+
+        finally:
+            os.chdir(cwd)
+
+    scale = 10000 / args.events
+    print(f"discord at DEBUG:      {debug * scale * 1000:>8.1f} ms CPU per 10k events")
+    print(f"levels from handlers:  {computed * scale * 1000:>8.1f} ms CPU per 10k events")
+    print(f"saved:                 {(debug - computed) * scale * 1000:>8.1f} ms CPU per 10k events")
+
+
+if __name__ == "__main__":
+    main()
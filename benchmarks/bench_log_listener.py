@@ -0,0 +1,95 @@
+"""
+Benchmark of the log listener thread throughput for the main log formats and buffering.
+
+Usage:
+    python -m benchmarks.bench_log_listener [--records N]
+"""
+
+import os
+import time
+import random
+import string
+import logging
+import argparse
+import tempfile
+from logging import handlers as log_handlers
+from queue import Queue
+
+
+from BoopliBot.utils import log_utils
+
+
+def _get_records(amount: int):
+    """
+    Generates records that look like the discord.py gateway debug output, already prepared by QueueHandler
+    """
+    rng = random.Random(42)
+    queue_handler = log_handlers.QueueHandler(None)
+    records = list()
+    for i in range(amount):
+        payload = "".join(rng.choices(string.ascii_letters + string.digits, k=rng.choice((80, 200, 600))))
+        record = logging.LogRecord(
+            "discord.gateway",
+            logging.INFO,
+            __file__,
+            1,
+            "For Shard ID %s: WebSocket Event: {'t': 'MESSAGE_CREATE', 's': %s, 'op': 0, 'd': '%s'}",
+            (i % 4, i, payload),
+            None
+        )
+        records.append(queue_handler.prepare(record))
+
+    return records
+
+def _run(records, handler: logging.Handler) -> float:
+    """
+    Feeds the records through a listener with the handler
+
+    OUT:
+        elapsed time
+    """
+    queue = Queue(-1)
+    for record in records:
+        queue.put_nowait(record)
+
+    listener = log_handlers.QueueListener(queue, handler, respect_handler_level=True)
+    start = time.perf_counter()
+    listener.start()
+    # Waits for the queue to be drained
+    listener.stop()
+    handler.close()
+
+    return time.perf_counter() - start
+
+def main() -> None:
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    records = _get_records(args.records)
+
+    with tempfile.TemporaryDirectory() as logs_path:
+        for log_format in log_utils.FORMATS:
+            for buffer_size in (0, log_utils.DEF_BUFFER_SIZE):
+                handler = log_utils._get_main_log_handler(
+                    logs_path,
+                    log_format,
+                    buffer_size,
+                    log_utils.DEF_FLUSH_INTERVAL,
+                    "w"
+                )
+                elapsed = _run(records, handler)
+                size = os.path.getsize(handler.baseFilename)
+                name = f"{log_format}, " + ("buffered" if buffer_size else "unbuffered")
+
+                print(
+                    f"{name:<18} {args.records / elapsed:>9.0f} records/s "
+                    f"({elapsed / args.records * 1e6:0.2f} us/record, {size / 1024 ** 2:0.1f} MiB written)"
+                )
+
+
+if __name__ == "__main__":
+    main()
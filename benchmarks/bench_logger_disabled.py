@@ -0,0 +1,87 @@
+"""
+Benchmark of Logger.on_message_edit throughput for guilds that have logging disabled.
+
+Usage:
+    python -m benchmarks.bench_logger_disabled [--events N]
+"""
+
+import time
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+
+from BoopliBot.helpers import (
+    NestedDictWrapper,
+    MessageStore
+)
+from BoopliBot.modules.logging import Logger
+
+
+GUILDS = 1000
+
+
+def _get_bot():
+    """
+    Returns a stand-in for the bot with loaded guild configs, none of them have a log channel
+    """
+    guilds_configs = NestedDictWrapper(nesting_depth=1)
+    for guild_id in range(GUILDS):
+        guilds_configs[guild_id] = NestedDictWrapper(
+            dict(guild_id=guild_id, prefix="!", enable_cc=False, log_channel=None),
+            nesting_depth=0
+        )
+
+    return SimpleNamespace(
+        guilds_configs=guilds_configs,
+        config=SimpleNamespace(log_queue_size=None, log_queue_policy=None),
+        message_store=MessageStore(256 * 1024),
+        get_guild=lambda guild_id: None
+    )
+
+def _get_events(amount: int):
+    """
+    Returns pairs of synthetic messages (before, after)
+    """
+    author = SimpleNamespace(id=647602717296164864, bot=False)
+    guilds = [SimpleNamespace(id=guild_id, get_channel=lambda channel_id: None) for guild_id in range(GUILDS)]
+    events = list()
+    for i in range(amount):
+        guild = guilds[i % GUILDS]
+        before = SimpleNamespace(id=i, author=author, guild=guild, content="before")
+        after = SimpleNamespace(id=i, author=author, guild=guild, content="after")
+        events.append((before, after))
+
+    return events
+
+async def _run(cog: Logger, events) -> float:
+    """
+    Feeds the events to the listener
+
+    OUT:
+        elapsed time
+    """
+    on_message_edit = cog.on_message_edit
+    start = time.perf_counter()
+    for before, after in events:
+        await on_message_edit(before, after)
+
+    return time.perf_counter() - start
+
+def main() -> None:
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args()
+
+    cog = Logger(_get_bot())
+    events = _get_events(args.events)
+    elapsed = asyncio.run(_run(cog, events))
+
+    print(f"Processed {args.events} edits in {elapsed:0.2f} s ({args.events / elapsed:0.0f} edits/s, {elapsed / args.events * 1e9:0.0f} ns/edit)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark comparing memory usage of discord.py message cache (a deque of full discord.Message objects)
+against our MessageStore at equal retention.
+
+Usage:
+    python -m benchmarks.bench_message_store [--messages N]
+"""
+
+import sys
+import gc
+import argparse
+import subprocess
+import random
+import string
+from collections import deque
+
+
+import psutil
+import discord
+from discord.state import ConnectionState
+
+
+from BoopliBot.helpers import CompactMessage, MessageStore
+
+
+GUILD_ID = 626871007185207297
+CHANNELS = 50
+AUTHORS = 500
+
+
+def _get_payloads(amount: int):
+    """
+    Generates synthetic message payloads
+    """
+    rng = random.Random(42)
+    base_id = 880000000000000000
+    for i in range(amount):
+        author_id = 647602717296164864 + rng.randrange(AUTHORS)
+        content_len = min(int(rng.expovariate(1 / 80)), 2000)
+        attachments = []
+        if rng.random() < 0.1:
+            attachments.append(
+                {
+                    "id": str(base_id + i),
+                    "filename": "image.png",
+                    "size": 1024,
+                    "url": f"https://cdn.discordapp.com/attachments/{i}/image.png",
+                    "proxy_url": f"https://media.discordapp.net/attachments/{i}/image.png"
+                }
+            )
+
+        yield {
+            "id": str(base_id + i),
+            "channel_id": str(rng.randrange(CHANNELS)),
+            "guild_id": str(GUILD_ID),
+            "author": {
+                "id": str(author_id),
+                "username": f"user{author_id % AUTHORS}",
+                "discriminator": "0001",
+                "avatar": None
+            },
+            "content": "".join(rng.choices(string.ascii_letters + " ", k=content_len)),
+            "timestamp": "2021-08-01T00:00:00+00:00",
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": attachments,
+            "embeds": [],
+            "pinned": False,
+            "type": 0
+        }
+
+def _get_rss() -> int:
+    """
+    Returns current RSS in bytes
+    """
+    gc.collect()
+    return psutil.Process().memory_info().rss
+
+def _run_mode(mode: str, amount: int) -> None:
+    """
+    Fills a cache of the given kind and prints the RSS delta (runs in a subprocess)
+    """
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, http=None)
+    channels = [
+        discord.PartialMessageable(state=state, id=i, guild_id=GUILD_ID)
+        for i in range(CHANNELS)
+    ]
+    payloads = list(_get_payloads(amount))
+    gc.collect()
+
+    start = _get_rss()
+    if mode == "discord":
+        cache = deque(maxlen=amount)
+        for data in payloads:
+            cache.append(discord.Message(state=state, channel=channels[int(data["channel_id"])], data=data))
+
+        retained = len(cache)
+
+    else:
+        # Give the store exactly enough budget to retain every message
+        messages = [
+            CompactMessage(
+                int(data["id"]),
+                int(data["channel_id"]),
+                int(data["author"]["id"]),
+                data["content"],
+                tuple(a["proxy_url"] for a in data["attachments"])
+            )
+            for data in payloads
+        ]
+        budget = sum(m.nbytes for m in messages)
+        cache = MessageStore(budget)
+        for message in messages:
+            cache.add(GUILD_ID, message)
+        del messages
+        retained = len(cache)
+
+    used = _get_rss() - start
+    print(f"{mode}\t{retained}\t{used}")
+
+def main() -> None:
+    """
+    Runs the benchmark
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--mode", choices=("discord", "store"), default=None)
+    args = parser.parse_args()
+
+    if args.mode is not None:
+        _run_mode(args.mode, args.messages)
+        return
+
+    results = dict()
+    for mode in ("discord", "store"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_message_store", "--mode", mode, "--messages", str(args.messages)],
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout
+        mode, retained, used = output.split()
+        results[mode] = (int(retained), int(used))
+
+    for mode, (retained, used) in results.items():
+        print(f"{mode:>8}: {retained} messages retained, RSS +{used / 1024**2:0.1f} MiB ({used / retained:0.0f} B/message)")
+
+    ratio = results["discord"][1] / max(results["store"][1], 1)
+    print(f"MessageStore uses {ratio:0.1f}x less memory than max_messages at equal retention.")
+
+
+if __name__ == "__main__":
+    main()
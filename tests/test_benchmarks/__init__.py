@@ -0,0 +1,3 @@
+"""
+Modules with tests for the benchmarks
+"""
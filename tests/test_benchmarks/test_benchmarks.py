@@ -0,0 +1,48 @@
+"""
+Module with smoke tests for the benchmarks, each one is run with a tiny workload
+"""
+
+import os
+import sys
+import subprocess
+import unittest
+
+
+PACKAGE_FOLDER = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(os.path.abspath(__file__)))))
+BENCHMARKS_FOLDER = os.path.join(PACKAGE_FOLDER, "benchmarks")
+# Map benchmark -> arguments for a tiny run
+BENCHMARK_ARGS = {
+    "bench_edit_replay": ("--edits", "200"),
+    "bench_log_embeds": ("--events", "100"),
+    "bench_log_levels": ("--events", "100", "--repeat", "1"),
+    "bench_log_listener": ("--records", "100"),
+    "bench_logger_disabled": ("--events", "100"),
+    "bench_message_store": ("--messages", "100")
+}
+
+
+class BenchmarksTest(unittest.TestCase):
+    """
+    Test case for the benchmarks
+    """
+    def test_all_benchmarks_listed(self) -> None:
+        benchmarks = {
+            file_[:-3]
+            for file_ in os.listdir(BENCHMARKS_FOLDER)
+            if file_.startswith("bench_") and file_.endswith(".py")
+        }
+        self.assertEqual(benchmarks, set(BENCHMARK_ARGS))
+
+    def test_benchmarks_run(self) -> None:
+        for benchmark, args in BENCHMARK_ARGS.items():
+            with self.subTest(benchmark=benchmark):
+                # Every benchmark runs in its own process, they change global state like the logging setup
+                result = subprocess.run(
+                    (sys.executable, "-m", f"benchmarks.{benchmark}", *args),
+                    cwd=PACKAGE_FOLDER,
+                    capture_output=True,
+                    text=True,
+                    timeout=120
+                )
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertTrue(result.stdout)
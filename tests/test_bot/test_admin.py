@@ -0,0 +1,428 @@
+"""
+Module with tests for the administration commands
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+from types import SimpleNamespace
+from typing import (
+    Optional
+)
+
+
+import discord
+from discord.utils import utcnow, time_snowflake
+
+
+from BoopliBot.helpers import AuthorMessageIndex
+from BoopliBot.modules import admin
+
+
+class _FakeHTTP():
+    """
+    Stand-in for the discord HTTP client: every request takes some time,
+    requests to the same channel share a rate limit bucket and are serialized
+    """
+    LATENCY = 0.01
+
+    def __init__(self) -> None:
+        self.buckets = dict()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+    async def request(self, channel_id: int) -> None:
+        bucket = self.buckets.setdefault(channel_id, asyncio.Lock())
+        async with bucket:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.requests += 1
+            await asyncio.sleep(self.LATENCY)
+            self.in_flight -= 1
+
+class _FakeChannel():
+    """
+    Stand-in for a text channel with a few messages from the target
+    """
+    def __init__(self, channel_id: int, http: _FakeHTTP, messages: int) -> None:
+        self.id = channel_id
+        self.http = http
+        self.messages = messages
+
+    async def purge(self, *, limit, check, after, before=None) -> list:
+        # History request
+        await self.http.request(self.id)
+        deleted = list(range(min(self.messages, limit)))
+        if deleted:
+            # Bulk delete request
+            await self.http.request(self.id)
+        self.messages -= len(deleted)
+        return deleted
+
+    async def delete_messages(self, messages) -> None:
+        await self.http.request(self.id)
+
+class MassPurgeTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for the masspurge command
+    """
+    CHANNELS = 300
+    MESSAGES_PER_CHANNEL = 3
+    TARGET_ID = 647602717296164864
+
+    def setUp(self) -> None:
+        self.http = _FakeHTTP()
+        self.channels = [
+            _FakeChannel(i, self.http, self.MESSAGES_PER_CHANNEL if i % 2 else 0)
+            for i in range(self.CHANNELS)
+        ]
+        self.progress_msg = SimpleNamespace(id=1, add_reaction=AsyncMock(), edit=AsyncMock())
+        self.cancel_after = None
+
+        async def wait_for(event, *, check):
+            if self.cancel_after is None:
+                await asyncio.Future()
+            await asyncio.sleep(self.cancel_after)
+
+        # The index was just created, so the history has to be scanned
+        self.index = AuthorMessageIndex(1000, time_snowflake(utcnow()))
+        self.bot = SimpleNamespace(author_index=self.index, wait_for=wait_for)
+        self.ctx = SimpleNamespace(
+            guild=SimpleNamespace(
+                id=2,
+                text_channels=self.channels,
+                threads=[],
+                get_channel_or_thread=lambda channel_id: self.channels[channel_id] if channel_id < len(self.channels) else None
+            ),
+            message=SimpleNamespace(id=3, created_at=utcnow()),
+            author=SimpleNamespace(id=4),
+            send=AsyncMock(return_value=self.progress_msg)
+        )
+        self.target = SimpleNamespace(id=self.TARGET_ID)
+        self.cog = admin.MemberCommands(self.bot)
+
+    async def test_masspurge_concurrent(self) -> None:
+        start = time.perf_counter()
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 100, target=self.target)
+        elapsed = time.perf_counter() - start
+
+        # One history request per channel plus one bulk delete per non-empty channel
+        self.assertEqual(self.http.requests, self.CHANNELS + self.CHANNELS // 2)
+        self.assertLessEqual(self.http.max_in_flight, admin.MASSPURGE_CONCURRENCY)
+        # Sequential scanning would take at least CHANNELS * LATENCY
+        sequential_time = self.http.requests * _FakeHTTP.LATENCY
+        self.assertLess(elapsed, sequential_time / 4)
+
+        deleted = self.CHANNELS // 2 * self.MESSAGES_PER_CHANNEL
+        self.progress_msg.edit.assert_awaited_with(content=f"Deleted {deleted} messages.")
+
+    async def test_masspurge_cancel(self) -> None:
+        self.cancel_after = _FakeHTTP.LATENCY * 3
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 100, target=self.target)
+
+        response = self.progress_msg.edit.await_args.kwargs["content"]
+        self.assertTrue(response.startswith("Cancelled after scanning"))
+        self.assertLess(self.http.requests, self.CHANNELS)
+
+    async def test_masspurge_indexed(self) -> None:
+        # The index has seen everything within the bulk delete window
+        self.index.tracking_since = 0
+        now_id = time_snowflake(utcnow())
+        for i in range(250):
+            channel_id = (i % 5) * 7
+            self.index.add(self.ctx.guild.id, self.TARGET_ID, channel_id, now_id - i * 1000)
+        # Other authors and guilds are ignored
+        self.index.add(self.ctx.guild.id, self.TARGET_ID + 1, 1, now_id + 1)
+        self.index.add(self.ctx.guild.id + 1, self.TARGET_ID, 1, now_id)
+
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 100, target=self.target)
+
+        # 5 channels with 50 messages each, 1 bulk delete per channel, no history requests
+        self.assertEqual(self.http.requests, 5)
+        self.progress_msg.edit.assert_awaited_with(content="Deleted 250 messages.")
+        self.assertEqual(self.index.get(self.ctx.guild.id, self.TARGET_ID, 0)[0], dict())
+
+    def _index_messages(self, amount: int, channels: int) -> None:
+        self.index.tracking_since = 0
+        now_id = time_snowflake(utcnow())
+        for i in range(amount):
+            self.index.add(self.ctx.guild.id, self.TARGET_ID, (i % channels) * 7, now_id - i * 1000)
+
+    async def test_masspurge_indexed_limit(self) -> None:
+        self._index_messages(250, 5)
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 10, target=self.target)
+
+        self.progress_msg.edit.assert_awaited_with(content="Deleted 50 messages.")
+        # The older messages are still known
+        messages, _ = self.index.get(self.ctx.guild.id, self.TARGET_ID, 0)
+        self.assertEqual(sum(map(len, messages.values())), 200)
+
+    async def test_masspurge_indexed_failure(self) -> None:
+        self._index_messages(20, 2)
+        failing_channel = self.channels[7]
+        failing_channel.delete_messages = AsyncMock(side_effect=discord.HTTPException(Mock(status=500), "error"))
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 100, target=self.target)
+
+        response = self.progress_msg.edit.await_args.kwargs["content"]
+        self.assertEqual(response, "Deleted 10 messages. Could not scan 1 channel.")
+        # The next purge still knows about the messages in the failed channel
+        messages, complete_since = self.index.get(self.ctx.guild.id, self.TARGET_ID, 0)
+        self.assertEqual(list(messages.keys()), [7])
+        self.assertEqual(len(messages[7]), 10)
+        self.assertEqual(complete_since, 0)
+
+    async def test_masspurge_thread(self) -> None:
+        thread = _FakeChannel(1000, self.http, 0)
+        self.ctx.guild.get_channel_or_thread = lambda channel_id: thread if channel_id == thread.id else None
+        self.index.tracking_since = 0
+        self.index.add(self.ctx.guild.id, self.TARGET_ID, thread.id, time_snowflake(utcnow()))
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 100, target=self.target)
+
+        self.progress_msg.edit.assert_awaited_with(content="Deleted 1 message.")
+        self.assertEqual(self.http.requests, 1)
+
+    async def test_masspurge_history_threads(self) -> None:
+        thread = _FakeChannel(1000, self.http, 2)
+        self.ctx.guild.threads = [thread]
+        await admin.MemberCommands.cmd_masspurge.callback(self.cog, self.ctx, 100, target=self.target)
+
+        self.assertEqual(thread.messages, 0)
+
+class PurgeTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for the purge command
+    """
+    MESSAGES = 2500
+    TARGET_ID = 647602717296164864
+
+    def setUp(self) -> None:
+        now = utcnow()
+        author = SimpleNamespace(id=self.TARGET_ID)
+        other_author = SimpleNamespace(id=self.TARGET_ID + 1)
+        # Newest first, one message per 10 minutes, some of them are older than 14 days
+        self.messages = [
+            SimpleNamespace(id=i, author=author if i % 4 else other_author, created_at=now - timedelta(minutes=i * 10))
+            for i in range(self.MESSAGES)
+        ]
+        self.history_calls = 0
+        self.deleted_batches = list()
+
+        async def history(*, limit, after, oldest_first):
+            self.assertFalse(oldest_first)
+            self.history_calls += 1
+            for message in self.messages[:limit]:
+                if message.created_at <= after:
+                    return
+                yield message
+
+        async def delete_messages(messages):
+            self.deleted_batches.append(len(messages))
+
+        self.response = SimpleNamespace(edit=AsyncMock())
+        channel = SimpleNamespace(
+            history=history,
+            delete_messages=delete_messages,
+            fetch_message=AsyncMock(return_value=None)
+        )
+        self.ctx = SimpleNamespace(
+            channel=channel,
+            message=SimpleNamespace(id=0, created_at=now),
+            send=AsyncMock(return_value=self.response)
+        )
+        self.cog = admin.MemberCommands(SimpleNamespace())
+
+    async def test_purge_batches(self) -> None:
+        await admin.MemberCommands.cmd_purge.callback(self.cog, self.ctx, 1000, target=None)
+
+        self.assertEqual(self.deleted_batches, [100] * 10)
+        self.ctx.send.assert_awaited_with("Deleted 1000 messages.", reference=None)
+
+    async def test_purge_window(self) -> None:
+        target = SimpleNamespace(id=self.TARGET_ID)
+        await admin.MemberCommands.cmd_purge.callback(self.cog, self.ctx, admin.PURGE_MAX_LIMIT, target=target)
+
+        # Only the target's messages within 14 days minus the margin
+        after = self.ctx.message.created_at - timedelta(weeks=2) + admin.PURGE_WINDOW_MARGIN
+        expected = sum(1 for m in self.messages if m.created_at > after and m.author.id == self.TARGET_ID)
+        self.assertLess(expected, self.MESSAGES)
+        self.assertEqual(sum(self.deleted_batches), expected)
+        self.assertTrue(all(size <= 100 for size in self.deleted_batches))
+        self.assertEqual(self.history_calls, 1)
+
+class MassBanTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for the massban command
+    """
+    TARGETS = 200
+    LATENCY = 0.005
+
+    def setUp(self) -> None:
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.banned = list()
+
+        async def ban(user, *, reason, delete_message_days):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(self.LATENCY)
+            self.in_flight -= 1
+            if user.id == 13:
+                raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown User")
+            self.banned.append(user.id)
+
+        self.suppressed = set()
+        self.bot = SimpleNamespace(
+            suppress_member_events=lambda guild_id, user_id: self.suppressed.add(user_id),
+            unsuppress_member_events=lambda guild_id, user_id: self.suppressed.discard(user_id),
+            dispatch=Mock()
+        )
+        self.progress_msg = SimpleNamespace(edit=AsyncMock())
+        self.author = SimpleNamespace(id=1, mention="<@1>")
+        self.ctx = SimpleNamespace(
+            guild=SimpleNamespace(id=100, name="Test", owner_id=2, me=SimpleNamespace(id=3), ban=ban),
+            author=self.author,
+            message=SimpleNamespace(id=4),
+            send=AsyncMock(return_value=self.progress_msg)
+        )
+        self.cog = admin.MemberCommands(self.bot)
+
+    async def test_massban(self) -> None:
+        # The author, the owner and the bot are never banned, duplicates are ignored
+        targets = [discord.Object(id=i) for i in range(1, self.TARGETS + 1)] + [discord.Object(id=10)]
+        flags = SimpleNamespace(reason="raid", dm=False)
+
+        with patch.object(admin.sql_utils, "increment_user_counter", AsyncMock()) as increment:
+            start = time.perf_counter()
+            await admin.MemberCommands.cmd_massban.callback(self.cog, self.ctx, targets, flags=flags)
+            elapsed = time.perf_counter() - start
+
+        expected = [i for i in range(4, self.TARGETS + 1) if i != 13]
+        self.assertEqual(sorted(self.banned), expected)
+        self.assertLessEqual(self.max_in_flight, admin.MASS_ACTION_CONCURRENCY)
+        self.assertLess(elapsed, self.TARGETS * self.LATENCY / 2)
+        # Gateway events are suppressed for everyone we banned, but not for the failed ones
+        self.assertEqual(self.suppressed, set(expected))
+
+        # One db write and one log event
+        increment.assert_awaited_once()
+        guild_id, user_ids, counter = increment.await_args.args
+        self.assertEqual(sorted(user_ids), expected)
+        self.assertEqual(counter, "total_bans")
+        self.bot.dispatch.assert_called_once()
+        self.assertEqual(self.bot.dispatch.call_args.args[0], "member_mass_action")
+
+        self.progress_msg.edit.assert_awaited_with(
+            content=(
+                f"Banned {len(expected)} member(s)."
+                " Skipped 3 member(s) you or I can't act on."
+                " Failed to act on 1 member(s)."
+            )
+        )
+
+class ModerationDMTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for DM notifications in the moderation commands
+    """
+    DM_LATENCY = 0.3
+
+    def setUp(self) -> None:
+        self.reply = SimpleNamespace(edit=AsyncMock())
+        self.ctx = SimpleNamespace(
+            guild=SimpleNamespace(
+                id=100,
+                name="Test",
+                me=SimpleNamespace(top_role=10),
+                fetch_ban=AsyncMock(),
+                unban=AsyncMock()
+            ),
+            author=SimpleNamespace(id=1, top_role=5),
+            message=SimpleNamespace(id=4),
+            send=AsyncMock(return_value=self.reply)
+        )
+        self.cog = admin.MemberCommands(SimpleNamespace())
+
+    def tearDown(self) -> None:
+        self.cog.cog_unload()
+
+    def _get_member(self, deliver: bool, error: Optional[Exception] = None) -> SimpleNamespace:
+        async def send(content):
+            await asyncio.sleep(self.DM_LATENCY)
+            if error is not None:
+                raise error
+            if not deliver:
+                raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Cannot send messages to this user")
+
+        return SimpleNamespace(id=2, mention="<@2>", bot=False, top_role=1, send=send, kick=AsyncMock())
+
+    async def test_reply_before_dm(self) -> None:
+        member = self._get_member(deliver=False)
+
+        start = time.perf_counter()
+        await admin.MemberCommands.cmd_unban.callback(self.cog, self.ctx, member)
+        elapsed = time.perf_counter() - start
+
+        # Replied without waiting for the DM
+        self.assertLess(elapsed, self.DM_LATENCY / 2)
+        self.ctx.send.assert_awaited_once_with("Unbanned <@2>.", reference=self.ctx.message)
+        self.reply.edit.assert_not_awaited()
+        self.assertEqual(len(self.cog.dm_notifier), 2)
+
+        # The note comes later
+        await asyncio.sleep(self.DM_LATENCY * 1.5)
+        self.reply.edit.assert_awaited_once_with(content="Unbanned <@2>." + admin.ATTENTION_NO_DM)
+        self.assertEqual(len(self.cog.dm_notifier), 0)
+
+    async def test_delivered(self) -> None:
+        member = self._get_member(deliver=True)
+
+        await admin.MemberCommands.cmd_unban.callback(self.cog, self.ctx, member)
+        await asyncio.sleep(self.DM_LATENCY * 1.5)
+
+        self.reply.edit.assert_not_awaited()
+
+    async def test_kick_waits_for_dm(self) -> None:
+        member = self._get_member(deliver=False)
+
+        await admin.MemberCommands.cmd_kick.callback(self.cog, self.ctx, member)
+
+        # The DM finished within the grace time, so the note is in the reply
+        member.kick.assert_awaited_once()
+        self.ctx.send.assert_awaited_once_with("Kicked <@2>." + admin.ATTENTION_NO_DM, reference=self.ctx.message)
+        self.reply.edit.assert_not_awaited()
+
+    async def test_kick_dm_unexpected_error(self) -> None:
+        # Within the grace time
+        member = self._get_member(deliver=False, error=OSError("Connection reset"))
+        with self.assertLogs(admin.logger, "WARNING"):
+            await admin.MemberCommands.cmd_kick.callback(self.cog, self.ctx, member)
+
+        member.kick.assert_awaited_once()
+        self.ctx.send.assert_awaited_once_with("Kicked <@2>." + admin.ATTENTION_NO_DM, reference=self.ctx.message)
+
+        # After the grace time
+        self.ctx.send.reset_mock()
+        member = self._get_member(deliver=False, error=OSError("Connection reset"))
+        with patch.object(admin, "DM_GRACE_TIME", self.DM_LATENCY / 3), self.assertLogs(admin.logger, "WARNING"):
+            await admin.MemberCommands.cmd_kick.callback(self.cog, self.ctx, member)
+            self.ctx.send.assert_awaited_once_with("Kicked <@2>.", reference=self.ctx.message)
+            await asyncio.sleep(self.DM_LATENCY)
+
+        self.reply.edit.assert_awaited_once_with(content="Kicked <@2>." + admin.ATTENTION_NO_DM)
+        self.assertEqual(len(self.cog.dm_notifier), 0)
+
+    async def test_kick_grace_time(self) -> None:
+        member = self._get_member(deliver=False)
+
+        with patch.object(admin, "DM_GRACE_TIME", self.DM_LATENCY / 3):
+            start = time.perf_counter()
+            await admin.MemberCommands.cmd_kick.callback(self.cog, self.ctx, member)
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, self.DM_LATENCY)
+        self.ctx.send.assert_awaited_once_with("Kicked <@2>.", reference=self.ctx.message)
+
+        await asyncio.sleep(self.DM_LATENCY)
+        self.reply.edit.assert_awaited_once_with(content="Kicked <@2>." + admin.ATTENTION_NO_DM)
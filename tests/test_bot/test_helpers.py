@@ -2,9 +2,15 @@
 Module with tests for the helper sub-module
 """
 
+import asyncio
 import unittest
 # from copy import deepcopy
 from itertools import zip_longest
+from functools import partial
+from types import SimpleNamespace
+
+
+import discord
 
 
 from BoopliBot import helpers
@@ -121,3 +127,509 @@ class NestedDictWrapperTest(unittest.TestCase):
         def_value = object()
         self.assertNotIn(nonexisting_key, self.ndw)
         self.assertEqual(self.ndw.get(nonexisting_key, def_value), def_value)
+
+class LogEventQueueTest(unittest.TestCase):
+    """
+    Test case for LogEventQueue
+    """
+    MAX_SIZE = 5
+
+    def test_helpers_leq_priority_order(self) -> None:
+        queue = helpers.LogEventQueue(self.MAX_SIZE)
+        queue.put_nowait("low", 2)
+        queue.put_nowait("mid", 1)
+        queue.put_nowait("high", 0)
+        queue.put_nowait("low_2", 2)
+
+        self.assertEqual(len(queue), 4)
+        self.assertEqual(
+            [queue.get_nowait() for i in range(4)],
+            ["high", "mid", "low", "low_2"]
+        )
+        self.assertFalse(queue)
+        with self.assertRaises(IndexError):
+            queue.get_nowait()
+
+    def test_helpers_leq_evicts_lower_priority(self) -> None:
+        queue = helpers.LogEventQueue(self.MAX_SIZE, policy=helpers.LogEventQueue.POLICY_DROP)
+        for i in range(self.MAX_SIZE):
+            self.assertTrue(queue.put_nowait(f"edit_{i}", 2))
+
+        # Full, but moderation events should still get in
+        self.assertTrue(queue.put_nowait("ban", 0))
+        self.assertEqual(len(queue), self.MAX_SIZE)
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual(queue.get_nowait(), "ban")
+        # The oldest edit was evicted
+        self.assertEqual(queue.get_nowait(), "edit_1")
+
+    def test_helpers_leq_discards_same_priority(self) -> None:
+        queue = helpers.LogEventQueue(self.MAX_SIZE, policy=helpers.LogEventQueue.POLICY_DROP)
+        for i in range(self.MAX_SIZE):
+            queue.put_nowait(f"join_{i}", 1)
+
+        self.assertFalse(queue.put_nowait("edit", 2))
+        self.assertFalse(queue.put_nowait("join", 1))
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(queue.summarized, 0)
+        self.assertEqual(len(queue), self.MAX_SIZE)
+
+    def test_helpers_leq_summary(self) -> None:
+        queue = helpers.LogEventQueue(self.MAX_SIZE, policy=helpers.LogEventQueue.POLICY_SUMMARIZE)
+        for i in range(self.MAX_SIZE):
+            queue.put_nowait(f"edit_{i}", 2)
+
+        queue.put_nowait("join", 1)
+        queue.put_nowait("edit", 2)
+        self.assertEqual(queue.dropped, 0)
+        self.assertEqual(queue.summarized, 2)
+        self.assertEqual(queue.pop_summary(), [0, 0, 2])
+        # The summary is reset after popping
+        self.assertEqual(queue.pop_summary(), [0, 0, 0])
+
+    def test_helpers_leq_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            helpers.LogEventQueue(0)
+
+        with self.assertRaises(ValueError):
+            helpers.LogEventQueue(self.MAX_SIZE, policy="unknown")
+
+class JoinRateTrackerTest(unittest.TestCase):
+    """
+    Test case for JoinRateTracker
+    """
+    GUILD_ID = 626871007185207297
+    WINDOW = 10.0
+    THRESHOLD = 4
+
+    def setUp(self) -> None:
+        self.tracker = helpers.JoinRateTracker(self.WINDOW, self.THRESHOLD)
+
+    def tearDown(self) -> None:
+        del self.tracker
+
+    def test_helpers_jrt_no_raid(self) -> None:
+        # Joins spread out in time never trigger raid mode
+        for i in range(self.THRESHOLD * 3):
+            self.assertFalse(self.tracker.hit(self.GUILD_ID, i * self.WINDOW))
+
+    def test_helpers_jrt_raid(self) -> None:
+        for i in range(self.THRESHOLD - 1):
+            self.assertFalse(self.tracker.hit(self.GUILD_ID, i))
+
+        self.assertTrue(self.tracker.hit(self.GUILD_ID, self.THRESHOLD))
+        # Other guilds are unaffected
+        self.assertFalse(self.tracker.is_raid(self.GUILD_ID + 1, self.THRESHOLD))
+
+        # Still in raid mode while the rate is above half the threshold
+        self.assertTrue(self.tracker.is_raid(self.GUILD_ID, self.WINDOW + 1.5))
+        # And leave it once it drops
+        self.assertFalse(self.tracker.is_raid(self.GUILD_ID, self.WINDOW * 3))
+
+    def test_helpers_jrt_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            helpers.JoinRateTracker(0, self.THRESHOLD)
+
+        with self.assertRaises(ValueError):
+            helpers.JoinRateTracker(self.WINDOW, 1)
+
+class MessageStoreTest(unittest.TestCase):
+    """
+    Test case for MessageStore and CompactMessage
+    """
+    GUILD_ID = 626871007185207297
+    CHANNEL_ID = 647602717296164864
+    AUTHOR_ID = 999999999999999999
+
+    def _get_message(self, id_: int, content: str = "test content", **kwargs) -> helpers.CompactMessage:
+        kwargs.setdefault("channel_id", self.CHANNEL_ID)
+        kwargs.setdefault("author_id", self.AUTHOR_ID)
+        return helpers.CompactMessage(id_, content=content, **kwargs)
+
+    def test_helpers_cm_content(self) -> None:
+        content = "Boop! ✅ 🐈"
+        message = self._get_message(1, content, attachments=("https://example.com/image.png",))
+        self.assertEqual(message.content, content)
+        self.assertIsInstance(message._content, bytes)
+        self.assertGreater(message.nbytes, len(content.encode("utf-8")))
+
+        old_nbytes = message.nbytes
+        message.update(content=content * 10)
+        self.assertEqual(message.content, content * 10)
+        self.assertGreater(message.nbytes, old_nbytes)
+        # Untouched fields stay the same
+        self.assertEqual(message.attachments, ("https://example.com/image.png",))
+
+    def test_helpers_ms_add_get_pop(self) -> None:
+        store = helpers.MessageStore(1024 * 1024)
+        message = self._get_message(1)
+        store.add(self.GUILD_ID, message)
+
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.nbytes, message.nbytes)
+        self.assertIs(store.get(self.GUILD_ID, 1), message)
+        self.assertIsNone(store.get(self.GUILD_ID, 2))
+        self.assertIsNone(store.get(self.GUILD_ID + 1, 1))
+
+        self.assertIs(store.pop(self.GUILD_ID, 1), message)
+        self.assertIsNone(store.pop(self.GUILD_ID, 1))
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.nbytes, 0)
+
+    def test_helpers_ms_budget_eviction(self) -> None:
+        message_size = self._get_message(0).nbytes
+        store = helpers.MessageStore(message_size * 3)
+        for i in range(5):
+            store.add(self.GUILD_ID, self._get_message(i))
+        # Other guilds have their own budget
+        store.add(self.GUILD_ID + 1, self._get_message(100))
+
+        self.assertEqual(
+            [m.id for m in store.find(self.GUILD_ID)],
+            [2, 3, 4]
+        )
+        self.assertIsNotNone(store.get(self.GUILD_ID + 1, 100))
+
+        # Growing a message may evict older ones
+        store.update(self.GUILD_ID, 4, content="test content" * 5)
+        self.assertLessEqual(sum(m.nbytes for m in store.find(self.GUILD_ID)), store.budget)
+        self.assertIsNone(store.get(self.GUILD_ID, 2))
+
+    def test_helpers_ms_total_budget(self) -> None:
+        message_size = self._get_message(0).nbytes
+        store = helpers.MessageStore(message_size * 3, message_size * 4)
+        store.add(self.GUILD_ID, self._get_message(1))
+        store.add(self.GUILD_ID + 1, self._get_message(2))
+        store.add(self.GUILD_ID, self._get_message(3))
+        store.add(self.GUILD_ID + 1, self._get_message(4))
+        self.assertEqual(len(store), 4)
+
+        # Over the total budget the oldest message of any guild goes first
+        store.add(self.GUILD_ID + 2, self._get_message(5))
+        self.assertEqual(len(store), 4)
+        self.assertIsNone(store.get(self.GUILD_ID, 1))
+        self.assertEqual([m.id for m in store.find(self.GUILD_ID)], [3])
+        self.assertLessEqual(store.nbytes, store.total_budget)
+        self.assertEqual(store.nbytes, sum(m.nbytes for guild_id in range(3) for m in store.find(self.GUILD_ID + guild_id)))
+
+        store.remove_guild(self.GUILD_ID + 1)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.nbytes, message_size * 2)
+        # Removed messages don't count towards the total budget
+        store.add(self.GUILD_ID, self._get_message(6))
+        store.add(self.GUILD_ID, self._get_message(7))
+        self.assertEqual(len(store), 4)
+
+        with self.assertRaises(ValueError):
+            helpers.MessageStore(message_size, 0)
+
+    def test_helpers_ms_update(self) -> None:
+        store = helpers.MessageStore(1024 * 1024)
+        store.add(self.GUILD_ID, self._get_message(1, "old content"))
+
+        before = store.update(self.GUILD_ID, 1, content="new content", edited_at=1.0)
+        after = store.get(self.GUILD_ID, 1)
+        self.assertEqual(before.content, "old content")
+        self.assertIsNone(before.edited_at)
+        self.assertEqual(after.content, "new content")
+        self.assertEqual(after.edited_at, 1.0)
+        self.assertEqual(store.nbytes, after.nbytes)
+
+        self.assertIsNone(store.update(self.GUILD_ID, 2, content="new content"))
+
+    def test_helpers_ms_find_remove(self) -> None:
+        store = helpers.MessageStore(1024 * 1024)
+        store.add(self.GUILD_ID, self._get_message(1))
+        store.add(self.GUILD_ID, self._get_message(2, author_id=self.AUTHOR_ID + 1))
+        store.add(self.GUILD_ID, self._get_message(3, channel_id=self.CHANNEL_ID + 1))
+
+        self.assertEqual([m.id for m in store.find(self.GUILD_ID, author_id=self.AUTHOR_ID)], [1, 3])
+        self.assertEqual([m.id for m in store.find(self.GUILD_ID, channel_id=self.CHANNEL_ID)], [1, 2])
+
+        store.remove_channel(self.GUILD_ID, self.CHANNEL_ID)
+        self.assertEqual([m.id for m in store.find(self.GUILD_ID)], [3])
+
+        store.remove_guild(self.GUILD_ID)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.nbytes, 0)
+
+class BoundedTaskRunnerTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for BoundedTaskRunner
+    """
+    CONCURRENCY = 4
+
+    async def test_helpers_btr_concurrency(self) -> None:
+        running = 0
+        max_running = 0
+        running_keys = set()
+
+        async def job(key: int, value: int) -> int:
+            nonlocal running, max_running
+            # Jobs with the same key never overlap
+            self.assertNotIn(key, running_keys)
+            running_keys.add(key)
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.001)
+            running -= 1
+            running_keys.discard(key)
+            return value
+
+        runner = helpers.BoundedTaskRunner(self.CONCURRENCY)
+        done = list()
+        jobs = [(i % 5, partial(job, i % 5, i)) for i in range(30)]
+        results = await runner.run(jobs, on_done=lambda idx, result: done.append(idx))
+
+        self.assertEqual(results, list(range(30)))
+        self.assertEqual(sorted(done), list(range(30)))
+        self.assertEqual(runner.done, 30)
+        self.assertEqual(max_running, self.CONCURRENCY)
+        self.assertFalse(runner.cancelled)
+
+    async def test_helpers_btr_exceptions(self) -> None:
+        async def job(value: int) -> int:
+            if value % 2:
+                raise ValueError(value)
+            return value
+
+        runner = helpers.BoundedTaskRunner(self.CONCURRENCY)
+        results = await runner.run([(i, partial(job, i)) for i in range(6)])
+
+        for i, result in enumerate(results):
+            if i % 2:
+                self.assertIsInstance(result, ValueError)
+            else:
+                self.assertEqual(result, i)
+
+    async def test_helpers_btr_cancel(self) -> None:
+        runner = helpers.BoundedTaskRunner(self.CONCURRENCY)
+
+        async def job() -> bool:
+            if runner.done == self.CONCURRENCY:
+                runner.cancel()
+            await asyncio.sleep(0.001)
+            return True
+
+        results = await runner.run([(i, job) for i in range(100)])
+
+        self.assertTrue(runner.cancelled)
+        self.assertEqual(runner.done, self.CONCURRENCY)
+        self.assertEqual(results.count(True), self.CONCURRENCY)
+        self.assertEqual(results.count(None), 100 - self.CONCURRENCY)
+
+    def test_helpers_btr_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            helpers.BoundedTaskRunner(0)
+
+class DMNotifierTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for DMNotifier
+    """
+    CONCURRENCY = 3
+
+    async def test_helpers_dmn_send(self) -> None:
+        sending = 0
+        max_sending = 0
+
+        async def send(content: str) -> None:
+            nonlocal sending, max_sending
+            sending += 1
+            max_sending = max(max_sending, sending)
+            await asyncio.sleep(0.001)
+            sending -= 1
+            if content == "fail":
+                raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "")
+
+        notifier = helpers.DMNotifier(self.CONCURRENCY)
+        user = SimpleNamespace(send=send)
+        tasks = [notifier.send(user, "fail" if i % 2 else "hi") for i in range(10)]
+        self.assertEqual(len(notifier), 10)
+
+        results = await asyncio.gather(*tasks)
+        await asyncio.sleep(0)
+
+        self.assertEqual(results, [not i % 2 for i in range(10)])
+        self.assertEqual(max_sending, self.CONCURRENCY)
+        self.assertEqual(len(notifier), 0)
+
+    async def test_helpers_dmn_cancel(self) -> None:
+        notifier = helpers.DMNotifier(self.CONCURRENCY)
+        task = notifier.schedule(asyncio.sleep(10))
+        notifier.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(len(notifier), 0)
+
+    def test_helpers_dmn_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            helpers.DMNotifier(0)
+
+class HistogramTest(unittest.TestCase):
+    """
+    Test case for Histogram
+    """
+    def test_helpers_histogram_quantiles(self) -> None:
+        hist = helpers.Histogram()
+        self.assertEqual(hist.quantile(0.5), 0.0)
+
+        # 1..1000 ms
+        for i in range(1, 1001):
+            hist.add(float(i))
+
+        self.assertEqual(hist.count, 1000)
+        self.assertEqual(hist.max, 1000.0)
+        self.assertAlmostEqual(hist.mean, 500.5)
+        # Buckets double in width, so the error is within a bucket
+        for q in (0.1, 0.5, 0.9, 0.99):
+            with self.subTest(q=q):
+                estimate = hist.quantile(q)
+                self.assertLess(abs(estimate - q * 1000), q * 1000)
+        self.assertEqual(hist.quantile(1.0), 1000.0)
+
+        # Over the last bound
+        hist.add(10**9)
+        self.assertEqual(hist.counts[-1], 1)
+        self.assertEqual(hist.quantile(1.0), 10**9)
+
+    def test_helpers_histogram_merge(self) -> None:
+        hist_one = helpers.Histogram()
+        hist_two = helpers.Histogram()
+        for i in range(10):
+            hist_one.add(i)
+            hist_two.add(i * 100)
+
+        hist_one.merge(hist_two)
+        self.assertEqual(hist_one.count, 20)
+        self.assertEqual(hist_one.max, 900)
+        self.assertEqual(sum(hist_one.counts), 20)
+
+        with self.assertRaises(ValueError):
+            hist_one.merge(helpers.Histogram((1.0, 2.0)))
+
+        hist_one.clear()
+        self.assertEqual(hist_one.count, 0)
+        self.assertEqual(sum(hist_one.counts), 0)
+
+    def test_helpers_histogram_bad_args(self) -> None:
+        for bounds in ((), (1.0, 1.0), (2.0, 1.0)):
+            with self.subTest(bounds=bounds):
+                with self.assertRaises(ValueError):
+                    helpers.Histogram(bounds)
+
+class AuthorMessageIndexTest(unittest.TestCase):
+    """
+    Test case for AuthorMessageIndex
+    """
+    GUILD_ID = 626871007185207297
+    AUTHOR_ID = 647602717296164864
+    CHANNEL_ID = 863427405765541918
+    # Some snowflake for "now"
+    NOW = 900000000000000000
+    MAX_PER_AUTHOR = 10
+
+    def setUp(self) -> None:
+        self.index = helpers.AuthorMessageIndex(self.MAX_PER_AUTHOR, self.NOW - helpers.AuthorMessageIndex.WINDOW * 2)
+
+    def tearDown(self) -> None:
+        del self.index
+
+    def test_helpers_ami_add_get(self) -> None:
+        # Out of order and duplicated
+        for message_id in (3, 1, 2, 2):
+            self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID + message_id % 2, self.NOW + message_id)
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID + 1, self.CHANNEL_ID, self.NOW + 4)
+
+        self.assertEqual(len(self.index), 4)
+        messages, since = self.index.get(self.GUILD_ID, self.AUTHOR_ID, self.NOW + 1)
+        self.assertEqual(messages, {self.CHANNEL_ID: [self.NOW + 2], self.CHANNEL_ID + 1: [self.NOW + 3]})
+        self.assertEqual(since, self.index.tracking_since)
+
+        messages, since = self.index.get(self.GUILD_ID + 1, self.AUTHOR_ID, 0)
+        self.assertEqual(messages, dict())
+
+        self.index.remove_author(self.GUILD_ID, self.AUTHOR_ID)
+        self.assertEqual(len(self.index), 1)
+        self.index.remove_guild(self.GUILD_ID)
+        self.assertEqual(len(self.index), 0)
+
+    def test_helpers_ami_window(self) -> None:
+        window = helpers.AuthorMessageIndex.WINDOW
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW)
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID + 1, self.CHANNEL_ID, self.NOW)
+        # This pushes the first message out of the window
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW + window + 1)
+
+        messages, _ = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(messages, {self.CHANNEL_ID: [self.NOW + window + 1]})
+
+        # Full prune drops other authors too
+        self.index.prune(self.NOW + 1)
+        self.assertEqual(len(self.index), 1)
+
+    def test_helpers_ami_cap(self) -> None:
+        for i in range(self.MAX_PER_AUTHOR + 5):
+            self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW + i)
+
+        messages, since = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(len(messages[self.CHANNEL_ID]), self.MAX_PER_AUTHOR)
+        # We've lost the 5 oldest messages, so we only know everything after them
+        self.assertEqual(since, self.NOW + 5)
+
+    def test_helpers_ami_track_guild(self) -> None:
+        self.index.track_guild(self.GUILD_ID, self.NOW)
+        _, since = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(since, self.NOW)
+
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW + 1)
+        _, since = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(since, self.NOW)
+
+    def test_helpers_ami_remove_message(self) -> None:
+        for i in range(3):
+            self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW + i)
+
+        self.index.remove_message(self.GUILD_ID, self.NOW + 1)
+        # Unknown messages and guilds are ignored
+        self.index.remove_message(self.GUILD_ID, self.NOW + 10)
+        self.index.remove_message(self.GUILD_ID + 1, self.NOW)
+
+        messages, _ = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(messages, {self.CHANNEL_ID: [self.NOW, self.NOW + 2]})
+
+        # The message can be added again
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW + 1)
+        self.assertEqual(len(self.index), 3)
+
+    def test_helpers_ami_remove_author_channels(self) -> None:
+        for i in range(4):
+            self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID + i % 2, self.NOW + i)
+
+        self.index.remove_author(self.GUILD_ID, self.AUTHOR_ID, (self.CHANNEL_ID,))
+        messages, _ = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(messages, {self.CHANNEL_ID + 1: [self.NOW + 1, self.NOW + 3]})
+
+        # Removed messages are forgotten for deletes too
+        self.index.remove_message(self.GUILD_ID, self.NOW)
+        self.index.remove_author(self.GUILD_ID, self.AUTHOR_ID)
+        self.assertEqual(len(self.index), 0)
+
+    def test_helpers_ami_reset_coverage(self) -> None:
+        self.index.add(self.GUILD_ID, self.AUTHOR_ID, self.CHANNEL_ID, self.NOW)
+        self.index.reset_coverage(self.NOW + 5)
+
+        # Existing entries and new authors are complete only after the reconnect
+        messages, since = self.index.get(self.GUILD_ID, self.AUTHOR_ID, 0)
+        self.assertEqual(messages, {self.CHANNEL_ID: [self.NOW]})
+        self.assertEqual(since, self.NOW + 5)
+        _, since = self.index.get(self.GUILD_ID, self.AUTHOR_ID + 1, 0)
+        self.assertEqual(since, self.NOW + 5)
+
+        # Coverage never goes back
+        self.index.reset_coverage(self.NOW)
+        self.assertEqual(self.index.tracking_since, self.NOW + 5)
+
+    def test_helpers_ami_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            helpers.AuthorMessageIndex(0, self.NOW)
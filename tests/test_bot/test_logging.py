@@ -0,0 +1,412 @@
+"""
+Module with tests for the logging module
+"""
+
+import unittest
+from unittest.mock import AsyncMock, Mock, patch
+from types import SimpleNamespace
+from typing import (
+    List
+)
+
+
+import aiohttp
+import discord
+
+
+from BoopliBot.bot import Bot
+from BoopliBot.modules import logging as logging_module
+from BoopliBot.helpers import (
+    NestedDictWrapper,
+    MessageStore,
+    CompactMessage
+)
+from BoopliBot.utils import sql_utils
+from BoopliBot import consts
+
+
+patchers: List[unittest.mock._patch] = list()
+
+def setUpModule() -> None:
+    # Setup in-memory sqlite3 db
+    const_to_patch = {
+        "BoopliBot.utils.sql_utils.ENGINE_URL": "sqlite://",
+        "BoopliBot.utils.sql_utils.ENGINE_URL_ASYNC": "sqlite+aiosqlite://",
+    }
+    for const, new_value in const_to_patch.items():
+        p = patch(const, new_value)
+        patchers.append(p)
+        p.start()
+
+def tearDownModule() -> None:
+    # Remove patches
+    for p in patchers:
+        p.stop()
+
+
+class LogEmbedBuilderTest(unittest.TestCase):
+    """
+    Test case for the log embeds
+    """
+    @staticmethod
+    def _get_edit_fields(old_content: str, new_content: str):
+        embed = discord.Embed()
+        is_valid_embed = logging_module._LogEmbedBuilder._add_msg_edit_fields(embed, 0, old_content, new_content, (), ())
+        return is_valid_embed, [(field.name, field.value) for field in embed.fields]
+
+    def test_edit_fields_diff(self) -> None:
+        self.assertEqual(
+            self._get_edit_fields("a b c", "a b d"),
+            (True, [("Changes:", "a b [-c-]{+d+}")])
+        )
+        self.assertEqual(
+            self._get_edit_fields("foo", "foo\n\nbar"),
+            (True, [("Changes:", "foo{+\n\nbar+}")])
+        )
+
+    def test_edit_fields_whitespace(self) -> None:
+        # Nothing to mark in the diff, we show both contents
+        self.assertEqual(
+            self._get_edit_fields("a b", "a  b"),
+            (True, [("Old content:", "a b"), ("New content:", "a  b")])
+        )
+        # The diff is empty
+        self.assertEqual(
+            self._get_edit_fields("hello", "hello "),
+            (True, [("Old content:", "hello"), ("New content:", "hello ")])
+        )
+
+    def test_edit_fields_no_text(self) -> None:
+        self.assertEqual(
+            self._get_edit_fields("", "hello"),
+            (True, [("New content:", "hello")])
+        )
+        self.assertEqual(
+            self._get_edit_fields("hello", ""),
+            (True, [("Old content:", "hello"), ("New content:", consts.ZERO_WIDTH_CHAR)])
+        )
+        self.assertEqual(self._get_edit_fields("same", "same"), (False, []))
+
+class _FakeGuild():
+    """
+    Stand-in for a guild with a few text channels
+    """
+    def __init__(self, guild_id: int, channel_ids) -> None:
+        self.id = guild_id
+        self.channels = {
+            channel_id: SimpleNamespace(id=channel_id, mention=f"<#{channel_id}>")
+            for channel_id in channel_ids
+        }
+
+    def get_channel(self, channel_id: int):
+        return self.channels.get(channel_id, None)
+
+class LoggerTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for the Logger cog
+    """
+    GUILD_ID = 626871007185207297
+    LOG_CHANNEL_ID = 647602717296164864
+    MSG_CHANNEL_ID = 647602717296164865
+    OTHER_CHANNEL_ID = 647602717296164866
+
+    def setUp(self) -> None:
+        self.guild = _FakeGuild(self.GUILD_ID, (self.LOG_CHANNEL_ID, self.MSG_CHANNEL_ID, self.OTHER_CHANNEL_ID))
+        self.bot = SimpleNamespace(
+            config=SimpleNamespace(log_queue_size=None, log_queue_policy=None),
+            guilds_configs=NestedDictWrapper(nesting_depth=1),
+            message_store=MessageStore(1024 * 1024),
+            dispatch=Mock()
+        )
+        self.set_config(log_channel=self.LOG_CHANNEL_ID)
+        self.cog = logging_module.Logger(self.bot)
+
+    def set_config(self, **kwargs) -> None:
+        data = dict(guild_id=self.GUILD_ID, log_channel=None)
+        data.update({column: None for category, column in logging_module.LOG_CATEGORIES.values()})
+        data.update(kwargs)
+        self.bot.guilds_configs[self.GUILD_ID] = NestedDictWrapper(data, nesting_depth=0)
+
+    def _get_message(self, message_id: int, bot: bool = False):
+        return SimpleNamespace(
+            id=message_id,
+            guild=self.guild,
+            channel=SimpleNamespace(id=self.MSG_CHANNEL_ID),
+            author=SimpleNamespace(id=1, bot=bot),
+            content="test content",
+            attachments=[],
+            edited_at=None
+        )
+
+    async def test_message_store_routes(self) -> None:
+        await self.cog.on_message(self._get_message(1))
+        # Bots messages aren't logged
+        await self.cog.on_message(self._get_message(2, bot=True))
+        self.assertEqual([m.id for m in self.bot.message_store.find(self.GUILD_ID)], [1])
+
+        # Disabling message logs drops the stored messages and stops storing new ones
+        self.set_config(log_channel=self.LOG_CHANNEL_ID, log_messages_channel=0)
+        await self.cog.on_guild_config_update(self.GUILD_ID)
+        await self.cog.on_message(self._get_message(3))
+        self.assertEqual(len(self.bot.message_store), 0)
+
+        # Other categories don't need the store
+        self.assertIsNotNone(self.cog._get_log_channel(self.guild, logging_module.LOG_MEMBERS))
+
+    def _get_routes(self):
+        self.cog.invalidate_log_routes(self.GUILD_ID)
+        return {
+            name: getattr(self.cog._get_log_channel(self.guild, category), "id", None)
+            for name, (category, column) in logging_module.LOG_CATEGORIES.items()
+        }
+
+    def test_compile_log_routes(self) -> None:
+        # Everything goes to the default channel
+        self.assertEqual(set(self._get_routes().values()), {self.LOG_CHANNEL_ID})
+
+        # Categories can have their own channel or be disabled
+        self.set_config(
+            log_channel=self.LOG_CHANNEL_ID,
+            log_members_channel=self.OTHER_CHANNEL_ID,
+            log_threads_channel=0
+        )
+        self.assertEqual(
+            self._get_routes(),
+            {
+                "messages": self.LOG_CHANNEL_ID,
+                "members": self.OTHER_CHANNEL_ID,
+                "moderation": self.LOG_CHANNEL_ID,
+                "threads": None
+            }
+        )
+
+        # Without the default channel only the categories with their own channel are logged
+        self.set_config(log_moderation_channel=self.OTHER_CHANNEL_ID)
+        self.assertEqual(
+            self._get_routes(),
+            {"messages": None, "members": None, "moderation": self.OTHER_CHANNEL_ID, "threads": None}
+        )
+
+        # Deleted channels disable their categories
+        self.set_config(log_channel=self.LOG_CHANNEL_ID + 100, log_moderation_channel=self.OTHER_CHANNEL_ID)
+        self.assertEqual(
+            self._get_routes(),
+            {"messages": None, "members": None, "moderation": self.OTHER_CHANNEL_ID, "threads": None}
+        )
+
+        # No config at all
+        del self.bot.guilds_configs[self.GUILD_ID]
+        self.assertEqual(set(self._get_routes().values()), {None})
+        self.assertIs(self.cog._log_routes[self.GUILD_ID], logging_module._NO_LOG_ROUTES)
+
+    async def test_log_channel_invalidation(self) -> None:
+        log_channel = self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES)
+        self.assertEqual(log_channel.id, self.LOG_CHANNEL_ID)
+        # Cached until something changes
+        self.assertIs(self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES), log_channel)
+
+        # Config changes
+        self.set_config(log_channel=self.OTHER_CHANNEL_ID)
+        self.assertIs(self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES), log_channel)
+        await self.cog.on_guild_config_update(self.GUILD_ID)
+        log_channel = self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES)
+        self.assertEqual(log_channel.id, self.OTHER_CHANNEL_ID)
+
+        # Channel updates, the channel object may be replaced
+        new_channel = SimpleNamespace(id=self.OTHER_CHANNEL_ID, mention=f"<#{self.OTHER_CHANNEL_ID}>", guild=self.guild)
+        self.guild.channels[self.OTHER_CHANNEL_ID] = new_channel
+        await self.cog.on_guild_channel_update(log_channel, new_channel)
+        self.assertIs(self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES), new_channel)
+
+        # Channel deletes
+        del self.guild.channels[self.OTHER_CHANNEL_ID]
+        await self.cog.on_guild_channel_delete(new_channel)
+        self.assertIsNone(self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES))
+
+        # Other guilds keep their routes
+        self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES)
+        await self.cog.on_guild_config_update(self.GUILD_ID + 1)
+        self.assertIn(self.GUILD_ID, self.cog._log_routes)
+        # None means every config was reloaded
+        await self.cog.on_guild_config_update(None)
+        self.assertNotIn(self.GUILD_ID, self.cog._log_routes)
+
+    async def test_deliver_logs_network_errors(self) -> None:
+        log_channel = SimpleNamespace(
+            id=self.LOG_CHANNEL_ID,
+            send=AsyncMock(side_effect=(OSError("Connection reset"), aiohttp.ClientConnectionError(), None))
+        )
+        with self.assertLogs(logging_module.logger, "WARNING") as logs:
+            for i in range(3):
+                self.cog.submit_log(self.guild, log_channel, discord.Embed(title=str(i)), logging_module.PRIORITY_MESSAGES)
+            await self.cog._log_workers[self.GUILD_ID]
+
+        # Network errors don't stop the delivery of the rest of the queue
+        self.assertEqual(log_channel.send.await_count, 3)
+        self.assertEqual(len(logs.output), 2)
+        self.assertNotIn(self.GUILD_ID, self.cog._log_workers)
+        self.assertEqual(len(self.cog.log_queues[self.GUILD_ID]), 0)
+
+class CachedMessageLogsTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for logging raw message edits and deletes from the message store
+    """
+    GUILD_ID = 626871007185207297
+    LOG_CHANNEL_ID = 647602717296164864
+    MSG_CHANNEL_ID = 647602717296164865
+    AUTHOR_ID = 999999999999999999
+
+    def setUp(self) -> None:
+        self.guild = _FakeGuild(self.GUILD_ID, (self.LOG_CHANNEL_ID, self.MSG_CHANNEL_ID))
+        self.guild.get_member = lambda member_id: None
+        guilds_configs = NestedDictWrapper(nesting_depth=1)
+        data = dict(guild_id=self.GUILD_ID, log_channel=self.LOG_CHANNEL_ID)
+        data.update({column: None for category, column in logging_module.LOG_CATEGORIES.values()})
+        guilds_configs[self.GUILD_ID] = NestedDictWrapper(data, nesting_depth=0)
+        self.bot = SimpleNamespace(
+            config=SimpleNamespace(log_queue_size=None, log_queue_policy=None),
+            guilds_configs=guilds_configs,
+            message_store=MessageStore(1024 * 1024),
+            author_index=Mock(),
+            get_guild=lambda guild_id: self.guild if guild_id == self.GUILD_ID else None,
+            dispatch=Mock()
+        )
+        self.bot.message_store.add(
+            self.GUILD_ID,
+            CompactMessage(1, self.MSG_CHANNEL_ID, self.AUTHOR_ID, "old content")
+        )
+        self.cog = logging_module.Logger(self.bot)
+        self.cog.submit_log = Mock()
+
+    def _get_edit_payload(self, message_id: int, cached_message=None):
+        return SimpleNamespace(
+            guild_id=self.GUILD_ID,
+            message_id=message_id,
+            data={"content": "new content", "edited_timestamp": "2024-01-01T00:00:00+00:00"},
+            cached_message=cached_message
+        )
+
+    async def test_cached_message_edit(self) -> None:
+        payload = self._get_edit_payload(1)
+        await Bot.on_raw_message_edit(self.bot, payload)
+        event, event_payload, before, after = self.bot.dispatch.call_args.args
+        self.assertEqual((event, event_payload), ("cached_message_edit", payload))
+        self.assertEqual(before.content, "old content")
+        self.assertEqual(after.content, "new content")
+        self.assertIs(self.bot.message_store.get(self.GUILD_ID, 1), after)
+
+        await self.cog.on_cached_message_edit(payload, before, after)
+        guild, log_channel, embed, priority = self.cog.submit_log.call_args.args
+        self.assertEqual(log_channel.id, self.LOG_CHANNEL_ID)
+        self.assertEqual(priority, logging_module.PRIORITY_MESSAGES)
+        self.assertIn(("Changes:", "[-old-]{+new+} content"), [(field.name, field.value) for field in embed.fields])
+
+        # discord.py has the message, on_message_edit logs it
+        self.cog.submit_log.reset_mock()
+        await self.cog.on_cached_message_edit(self._get_edit_payload(1, cached_message=object()), before, after)
+        self.cog.submit_log.assert_not_called()
+
+        # Unknown messages aren't dispatched
+        self.bot.dispatch.reset_mock()
+        await Bot.on_raw_message_edit(self.bot, self._get_edit_payload(2))
+        self.bot.dispatch.assert_not_called()
+
+    async def test_cached_message_delete(self) -> None:
+        payload = SimpleNamespace(guild_id=self.GUILD_ID, message_id=1, cached_message=None)
+        await Bot.on_raw_message_delete(self.bot, payload)
+        event, event_payload, message = self.bot.dispatch.call_args.args
+        self.assertEqual((event, event_payload), ("cached_message_delete", payload))
+        self.assertEqual(message.content, "old content")
+        self.assertEqual(len(self.bot.message_store), 0)
+
+        await self.cog.on_cached_message_delete(payload, message)
+        guild, log_channel, embed, priority = self.cog.submit_log.call_args.args
+        self.assertEqual(log_channel.id, self.LOG_CHANNEL_ID)
+        self.assertIn("old content", [field.value for field in embed.fields])
+
+        # Deleting it again dispatches nothing
+        self.bot.dispatch.reset_mock()
+        await Bot.on_raw_message_delete(self.bot, payload)
+        self.bot.dispatch.assert_not_called()
+
+class LogsCommandsTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for the logs commands
+    """
+    GUILD_ID = 626871007185207297
+    LOG_CHANNEL_ID = 647602717296164864
+    OTHER_CHANNEL_ID = 647602717296164866
+
+    async def asyncSetUp(self) -> None:
+        sql_utils.init(should_log=False)
+        async with sql_utils.async_engine.begin() as conn:
+            await conn.run_sync(sql_utils.metadata.create_all)
+
+        async with sql_utils.NewAsyncSession() as sesh:
+            guild_config = sql_utils.GuildConfig(guild_id=self.GUILD_ID, prefix="!", log_channel=self.LOG_CHANNEL_ID)
+            sesh.add(guild_config)
+            await sesh.commit()
+            config_data = sql_utils.to_dict(guild_config)
+
+        self.guild = _FakeGuild(self.GUILD_ID, (self.LOG_CHANNEL_ID, self.OTHER_CHANNEL_ID))
+        self.bot = SimpleNamespace(
+            config=SimpleNamespace(log_queue_size=None, log_queue_policy=None),
+            guilds_configs=NestedDictWrapper(nesting_depth=1),
+            message_store=MessageStore(1024 * 1024),
+            dispatch=Mock()
+        )
+        self.bot.guilds_configs[self.GUILD_ID] = NestedDictWrapper(config_data, nesting_depth=0)
+        self.cog = logging_module.Logger(self.bot)
+        self.ctx = SimpleNamespace(guild=self.guild, message=None, send=AsyncMock())
+
+    async def asyncTearDown(self) -> None:
+        await sql_utils.async_engine.dispose()
+        sql_utils.deinit(should_log=False)
+
+    async def _get_saved_config(self):
+        async with sql_utils.NewAsyncSession() as sesh:
+            return await sesh.get(sql_utils.GuildConfig, self.GUILD_ID)
+
+    async def _assert_column(self, column: str, value) -> None:
+        self.assertEqual(self.bot.guilds_configs[self.GUILD_ID][column], value)
+        self.assertEqual(getattr(await self._get_saved_config(), column), value)
+        self.bot.dispatch.assert_called_with("guild_config_update", self.GUILD_ID)
+
+    async def test_logs_set(self) -> None:
+        await self.cog.cmd_logs_set.callback(self.cog, self.ctx, "Messages", self.guild.get_channel(self.OTHER_CHANNEL_ID))
+        await self._assert_column("log_messages_channel", self.OTHER_CHANNEL_ID)
+
+        await self.cog.cmd_logs_set.callback(self.cog, self.ctx, "all", self.guild.get_channel(self.OTHER_CHANNEL_ID))
+        await self._assert_column("log_channel", self.OTHER_CHANNEL_ID)
+
+    async def test_logs_off_default(self) -> None:
+        # Categories are disabled by 0
+        await self.cog.cmd_logs_off.callback(self.cog, self.ctx, "members")
+        await self._assert_column("log_members_channel", 0)
+        self.cog.invalidate_log_routes(self.GUILD_ID)
+        self.assertIsNone(self.cog._get_log_channel(self.guild, logging_module.LOG_MEMBERS))
+        self.assertIsNotNone(self.cog._get_log_channel(self.guild, logging_module.LOG_MESSAGES))
+
+        # And go back to the default channel with NULL
+        await self.cog.cmd_logs_default.callback(self.cog, self.ctx, "members")
+        await self._assert_column("log_members_channel", None)
+        self.cog.invalidate_log_routes(self.GUILD_ID)
+        self.assertEqual(self.cog._get_log_channel(self.guild, logging_module.LOG_MEMBERS).id, self.LOG_CHANNEL_ID)
+
+        # The default channel is disabled by NULL
+        await self.cog.cmd_logs_off.callback(self.cog, self.ctx, "all")
+        await self._assert_column("log_channel", None)
+
+    async def test_logs_unknown_category(self) -> None:
+        await self.cog.cmd_logs_set.callback(self.cog, self.ctx, "nope", self.guild.get_channel(self.OTHER_CHANNEL_ID))
+        await self.cog.cmd_logs_off.callback(self.cog, self.ctx, "nope")
+        # 'all' has no default to go back to
+        await self.cog.cmd_logs_default.callback(self.cog, self.ctx, "all")
+
+        self.assertEqual(self.ctx.send.await_count, 3)
+        for call in self.ctx.send.await_args_list:
+            self.assertTrue(call.args[0].startswith("Unknown log category"))
+        self.bot.dispatch.assert_not_called()
+        saved_config = await self._get_saved_config()
+        self.assertEqual(saved_config.log_channel, self.LOG_CHANNEL_ID)
+        self.assertIsNone(saved_config.log_messages_channel)
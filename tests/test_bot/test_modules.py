@@ -0,0 +1,37 @@
+"""
+Module with tests for loading the bot modules together
+"""
+
+import unittest
+from types import SimpleNamespace
+
+
+import discord
+from discord.ext import commands
+
+
+from BoopliBot.modules import (
+    admin,
+    logging as logging_module,
+    other,
+    root
+)
+
+
+class ModulesTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for registering all cogs on one bot
+    """
+    async def test_all_cogs_register(self) -> None:
+        bot = commands.Bot(command_prefix="!", intents=discord.Intents.none())
+        bot.config = SimpleNamespace(log_queue_size=None, log_queue_policy=None)
+
+        cogs = [cog for module in (root, admin, logging_module, other) for cog in module._cogs]
+        # Raises CommandRegistrationError on name or alias clashes
+        for cog in cogs:
+            await bot.add_cog(cog(bot))
+
+        self.assertEqual(len(bot.cogs), len(cogs))
+        self.assertIsNotNone(bot.get_command("perf loglevel verbosity"))
+        self.assertIsNotNone(bot.get_command("logs"))
+        await bot.close()
@@ -21,6 +21,8 @@ class _Mixin():
     FP_CONFIG_DOUBLE_OWNER_FIELD = os.path.join(THIS_FOLDER, "fixtures/config_double_owner_field.json")
     FP_CONFIG_EXTRA_FIELD = os.path.join(THIS_FOLDER, "fixtures/config_extra_field.json")
     FP_CONFIG_MISSING_REQ_FIELD = os.path.join(THIS_FOLDER, "fixtures/config_missing_token.json")
+    FP_CONFIG_BAD_HEALTH_SOURCES = os.path.join(THIS_FOLDER, "fixtures/config_bad_health_sources.json")
+    FP_CONFIG_BAD_LOG_FORMAT = os.path.join(THIS_FOLDER, "fixtures/config_bad_log_format.json")
 
 class ConfigInitTest(unittest.TestCase, _Mixin):
     """
@@ -38,7 +40,9 @@ class ConfigInitTest(unittest.TestCase, _Mixin):
             ("Case: invalid bot prefix", self.FP_CONFIG_BAD_PREFIX),
             ("Case: json has both owner_id and owner_ids", self.FP_CONFIG_DOUBLE_OWNER_FIELD),
             ("Case: json has an extra field", self.FP_CONFIG_EXTRA_FIELD),
-            ("Case: json is missing a requared field", self.FP_CONFIG_MISSING_REQ_FIELD)
+            ("Case: json is missing a requared field", self.FP_CONFIG_MISSING_REQ_FIELD),
+            ("Case: json has an unknown health source", self.FP_CONFIG_BAD_HEALTH_SOURCES),
+            ("Case: json has an unknown log format", self.FP_CONFIG_BAD_LOG_FORMAT)
         )
 
         for msg, json_fp in test_cases:
@@ -0,0 +1,61 @@
+"""
+Modules with tests for the word diff
+"""
+
+import unittest
+
+
+from BoopliBot.utils import word_diff
+
+
+class WordDiffTest(unittest.TestCase):
+    """
+    Test case for utils.word_diff
+    """
+    def test_diff_equal(self) -> None:
+        self.assertEqual(word_diff("same text", "same text"), "")
+
+    def test_diff_replace(self) -> None:
+        self.assertEqual(
+            word_diff("the quick brown fox jumps over the lazy dog", "the quick brown fox jumped over the lazy dog"),
+            "the quick brown fox [-jumps-]{+jumped+} over the lazy dog"
+        )
+
+    def test_diff_insert_delete(self) -> None:
+        self.assertEqual(word_diff("hello world", "hello there world"), "hello {+there+} world")
+        self.assertEqual(word_diff("hello there world", "hello world"), "hello [-there-] world")
+        self.assertEqual(word_diff("hello", "hello world"), "hello {+world+}")
+
+    def test_diff_context(self) -> None:
+        old = " ".join(f"w{i}" for i in range(100))
+        new = old.replace("w50", "changed")
+        self.assertEqual(word_diff(old, new, context=2), "… w48 w49 [-w50-]{+changed+} w51 w52 …")
+
+        old = "one two three four five six seven eight nine ten"
+        new = "1 two three four five six seven eight nine 10"
+        self.assertEqual(word_diff(old, new, context=2), "[-one-]{+1+} two three … eight nine [-ten-]{+10+}")
+
+    def test_diff_multiline(self) -> None:
+        self.assertEqual(word_diff("first line\nsecond line", "first line\nsecond row"), "first line\nsecond [-line-]{+row+}")
+
+    def test_diff_cutoff(self) -> None:
+        old = " ".join(f"a{i}" for i in range(50))
+        new = " ".join(f"a{i}" if i % 2 else f"b{i}" for i in range(50))
+        # Over the limit the whole changed region is one replacement
+        rv = word_diff(old, new, context=1, max_cost=10)
+        self.assertEqual(rv.count("[-"), 1)
+        self.assertEqual(rv.count("{+"), 1)
+        # Under the limit we get every change separately
+        rv = word_diff(old, new, context=1)
+        self.assertEqual(rv.count("[-"), 25)
+        self.assertEqual(rv.count("{+"), 25)
+
+    def test_diff_whitespace(self) -> None:
+        # Trailing whitespace is ignored
+        self.assertEqual(word_diff("hello", "hello "), "")
+        # Other whitespace changes have no words to mark
+        self.assertNotIn("[-", word_diff("a b", "a  b"))
+        self.assertNotIn("{+", word_diff("a b", "a  b"))
+        # Text added after a different whitespace is still an insertion
+        self.assertEqual(word_diff("foo", "foo\n\nbar"), "foo{+\n\nbar+}")
+        self.assertEqual(word_diff("foo\n\nbar", "foo"), "foo[-\n\nbar-]")
@@ -0,0 +1,184 @@
+"""
+Modules with tests for the health sampler
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+
+from BoopliBot.utils import health_utils
+
+
+STUB_SUMMARY = {
+    "page": {"updated_at": "2021-09-01T12:00:00.000+00:00"},
+    "status": {"indicator": "minor", "description": "Minor Service Outage"},
+    "components": [
+        {"name": "API", "status": "operational"},
+        {"name": "Voice", "status": "major_outage"},
+        {"name": "Not Reported", "status": "operational"}
+    ]
+}
+
+
+class HealthSamplerTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for health_utils.HealthSampler
+    """
+    def setUp(self) -> None:
+        self.status_calls = 0
+
+    async def _stub_status_fetcher(self) -> dict:
+        self.status_calls += 1
+        return STUB_SUMMARY
+
+    async def test_health_sample(self) -> None:
+        sampler = health_utils.HealthSampler(
+            sources=(health_utils.SOURCE_DISCORD_STATUS, health_utils.SOURCE_PROCESS),
+            status_fetcher=self._stub_status_fetcher
+        )
+        self.assertIsNone(sampler.snapshot)
+
+        snapshot = await sampler.sample()
+
+        self.assertIs(sampler.snapshot, snapshot)
+        # Disabled source
+        self.assertIsNone(snapshot.sql_db_latency)
+
+        status = snapshot.discord_status
+        self.assertEqual(status.description, "Minor Service Outage")
+        self.assertEqual(status.indicator, "minor")
+        self.assertEqual(status.updated_at.year, 2021)
+        self.assertEqual(status.components, [("API", True), ("Voice", False)])
+
+        self.assertGreater(snapshot.process.mem_used, 0)
+        self.assertLessEqual(snapshot.process.create_time, time.time())
+
+    async def test_health_source_errors(self) -> None:
+        async def failing_fetcher() -> dict:
+            raise ConnectionError()
+
+        sampler = health_utils.HealthSampler(
+            sources=(health_utils.SOURCE_DISCORD_STATUS,),
+            status_fetcher=failing_fetcher
+        )
+        with self.assertLogs(health_utils.logger, "ERROR"):
+            snapshot = await sampler.sample()
+        self.assertIsNone(snapshot.discord_status)
+
+        # Malformed data
+        for data in (None, {}, {"status": {}}):
+            with self.subTest(data=data):
+                self.assertIsNone(health_utils.parse_discord_status(data))
+
+    async def test_health_background(self) -> None:
+        sampler = health_utils.HealthSampler(
+            interval=0.01,
+            sources=(health_utils.SOURCE_DISCORD_STATUS,),
+            status_fetcher=self._stub_status_fetcher
+        )
+        sampler.start()
+        sampler.start()
+        self.assertTrue(sampler.is_running())
+        await asyncio.sleep(0.055)
+        sampler.stop()
+        self.assertFalse(sampler.is_running())
+
+        calls = self.status_calls
+        self.assertGreaterEqual(calls, 3)
+        await asyncio.sleep(0.03)
+        self.assertEqual(self.status_calls, calls)
+
+        # Reading the snapshot doesn't touch the sources
+        for _ in range(1000):
+            sampler.snapshot
+        self.assertEqual(self.status_calls, calls)
+
+    async def test_health_sql_unavailable(self) -> None:
+        sampler = health_utils.HealthSampler(sources=(health_utils.SOURCE_SQL,))
+        with patch.object(health_utils.sql_utils, "inited", False):
+            snapshot = await sampler.sample()
+        self.assertIsNone(snapshot.sql_db_latency)
+
+    def test_health_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            health_utils.HealthSampler(interval=0)
+
+        with self.assertRaises(ValueError):
+            health_utils.HealthSampler(sources=("weather",))
+
+class LoopLagMonitorTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for health_utils.LoopLagMonitor
+    """
+    INTERVAL = 0.02
+    THRESHOLD = 50.0
+
+    @staticmethod
+    def _block_the_loop(duration: float) -> None:
+        time.sleep(duration)
+
+    async def test_lag_blocked(self) -> None:
+        monitor = health_utils.LoopLagMonitor(self.INTERVAL, self.THRESHOLD)
+        monitor.start()
+        monitor.start()
+        await asyncio.sleep(self.INTERVAL * 3)
+        self.assertFalse(monitor.offenders)
+
+        with self.assertLogs(health_utils.logger, "WARNING") as logs:
+            self._block_the_loop(0.2)
+            await asyncio.sleep(self.INTERVAL * 3)
+        monitor.stop()
+        self.assertFalse(monitor.is_running())
+
+        self.assertEqual(len(monitor.offenders), 1)
+        offender = monitor.offenders[0]
+        self.assertGreaterEqual(offender.lag, 150)
+        # The watchdog caught the culprit
+        self.assertIn("_block_the_loop", offender.source)
+        self.assertIn("_block_the_loop", logs.output[0])
+
+        histogram = monitor.histogram
+        self.assertGreaterEqual(histogram.count, 4)
+        self.assertLess(histogram.quantile(0.5), self.THRESHOLD)
+        self.assertGreaterEqual(histogram.max, 150)
+
+    async def test_lag_slow_callbacks(self) -> None:
+        monitor = health_utils.LoopLagMonitor(self.INTERVAL, self.THRESHOLD)
+        monitor.start(debug=True)
+        loop = asyncio.get_running_loop()
+        self.assertTrue(loop.get_debug())
+
+        with self.assertLogs(health_utils.logger, "WARNING"):
+            loop.call_soon(self._block_the_loop, 0.1)
+            await asyncio.sleep(self.INTERVAL * 3)
+        monitor.stop()
+        self.assertFalse(loop.get_debug())
+
+        sources = [offender.source for offender in monitor.offenders if offender.source]
+        self.assertTrue(any("_block_the_loop" in source for source in sources))
+
+    async def test_lag_restart(self) -> None:
+        monitor = health_utils.LoopLagMonitor(self.INTERVAL, self.THRESHOLD)
+        for i in range(3):
+            monitor.start()
+            monitor.stop()
+        monitor.start()
+        try:
+            # A quick restart doesn't leave the old watchdog running
+            watchdogs = [thread for thread in threading.enumerate() if thread.name == "LoopLagWatchdog"]
+            self.assertEqual(len(watchdogs), 1)
+
+        finally:
+            monitor.stop()
+
+        self.assertFalse(any(thread.name == "LoopLagWatchdog" for thread in threading.enumerate()))
+
+    def test_lag_bad_args(self) -> None:
+        with self.assertRaises(ValueError):
+            health_utils.LoopLagMonitor(0, self.THRESHOLD)
+
+        with self.assertRaises(ValueError):
+            health_utils.LoopLagMonitor(self.INTERVAL, 0)
@@ -2,6 +2,11 @@
 Modules with tests for the logging system
 """
 
+import os
+import sys
+import json
+import time
+import tempfile
 import unittest
 from unittest.mock import patch
 import logging
@@ -113,3 +118,159 @@ class LogsTest(unittest.TestCase):
             # Always remove patches in the end
             for p in patches:
                 p.stop()
+
+
+class LogFormatTest(unittest.TestCase):
+    """
+    Test case for the JSON formatter, the buffered handler and reconfiguring the main log
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "test.log")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _read(self, path=None) -> str:
+        with open(path or self.path, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def test_json_formatter(self) -> None:
+        formatter = log_utils.JsonFormatter()
+        record = logging.LogRecord("BoopliBot.test", logging.ERROR, __file__, 1, "Hello %s \"%s\"", ("world", "ü"), None)
+        try:
+            raise ValueError("test")
+        except ValueError:
+            record.exc_info = sys.exc_info()
+
+        data = json.loads(formatter.format(record))
+        self.assertEqual(data["level"], "ERROR")
+        self.assertEqual(data["logger"], "BoopliBot.test")
+        self.assertEqual(data["message"], "Hello world \"ü\"")
+        self.assertEqual(data["time"], record.created)
+        self.assertIn("ValueError: test", data["exc_info"])
+        self.assertNotIn("\n", formatter.format(record))
+
+    def test_buffered_handler(self) -> None:
+        handler = log_utils.BufferedFileHandler(self.path, delay=True, buffer_size=100, flush_interval=0.05)
+        handler.setFormatter(logging.Formatter("{message}", style="{"))
+        logger = logging.getLogger("BoopliBot.test_buffered")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            logger.warning("a" * 10)
+            # Buffered, the file isn't even created
+            self.assertFalse(os.path.exists(self.path))
+
+            # The size limit
+            logger.warning("b" * 100)
+            self.assertEqual(self._read(), "a" * 10 + "\n" + "b" * 100 + "\n")
+
+            # The time limit
+            logger.warning("c")
+            deadline = time.monotonic() + 2.0
+            while not self._read().endswith("c\n") and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(self._read().endswith("c\n"))
+
+            # Errors are written right away
+            handler.flush_interval = 60.0
+            logger.error("d")
+            self.assertTrue(self._read().endswith("d\n"))
+
+            logger.warning("e")
+            self.assertFalse(self._read().endswith("e\n"))
+
+        finally:
+            logger.removeHandler(handler)
+            logger.propagate = True
+            handler.close()
+
+        self.assertTrue(self._read().endswith("e\n"))
+
+    def test_configure(self) -> None:
+        with patch("os.getcwd", return_value=self.temp_dir.name):
+            log_utils.init(should_log=False)
+        try:
+            logs_path = os.path.join(self.temp_dir.name, log_utils.LOG_FOLDER)
+            booplibot_logger = logging.getLogger("BoopliBot")
+            booplibot_logger.info("text line")
+
+            # Same settings, nothing to do
+            handler = log_utils._main_log_handler
+            log_utils.configure()
+            self.assertIs(log_utils._main_log_handler, handler)
+
+            # Unbuffered text, the old lines are kept
+            log_utils.configure(buffer_size=0)
+            self.assertNotIsInstance(log_utils._main_log_handler, log_utils.BufferedFileHandler)
+            self.assertIn(log_utils._main_log_handler, log_utils.log_listener.handlers)
+            self.assertNotIn(handler, log_utils.log_listener.handlers)
+            booplibot_logger.info("unbuffered line")
+            log_utils.log_listener.stop()
+            log_utils.log_listener.start()
+            text = self._read(os.path.join(logs_path, log_utils.MAIN_LOG_FILE))
+            self.assertIn("text line", text)
+            self.assertIn("unbuffered line", text)
+
+            log_utils.configure(log_format=log_utils.FORMAT_JSON)
+            self.assertIsInstance(log_utils._main_log_handler.formatter, log_utils.JsonFormatter)
+            booplibot_logger.info("json line")
+
+        finally:
+            log_utils.deinit(should_log=False)
+
+        lines = self._read(os.path.join(logs_path, log_utils.MAIN_JSON_LOG_FILE)).splitlines()
+        self.assertEqual(json.loads(lines[-1])["message"], "json line")
+
+
+class LogLevelsTest(unittest.TestCase):
+    """
+    Test case for the loggers levels
+    """
+    def setUp(self) -> None:
+        log_utils.init(should_log=False)
+
+    def tearDown(self) -> None:
+        log_utils.deinit(should_log=False)
+
+    def test_levels_follow_handlers(self) -> None:
+        discord_logger = logging.getLogger("discord")
+        gateway_logger = logging.getLogger("discord.gateway")
+        self.assertEqual(log_utils.get_handlers_level(), logging.INFO)
+        # Debug records aren't even created
+        self.assertFalse(gateway_logger.isEnabledFor(logging.DEBUG))
+        self.assertTrue(gateway_logger.isEnabledFor(logging.INFO))
+
+        with patch.object(log_utils.log_listener.queue, "put_nowait") as mock_put:
+            gateway_logger.debug("For Shard ID %s: WebSocket Event: %s", 0, {})
+            self.assertEqual(mock_put.call_count, 0)
+
+        log_utils.set_verbosity(logging.DEBUG)
+        self.assertEqual(log_utils.get_verbosity(), logging.DEBUG)
+        self.assertTrue(gateway_logger.isEnabledFor(logging.DEBUG))
+        self.assertEqual(log_utils.get_levels()["BoopliBot"], logging.DEBUG)
+
+        # Silence a single logger
+        log_utils.set_logger_level("discord.gateway", logging.WARNING)
+        self.assertFalse(gateway_logger.isEnabledFor(logging.INFO))
+        self.assertTrue(discord_logger.isEnabledFor(logging.DEBUG))
+        self.assertEqual(log_utils.get_levels()["discord.gateway"], logging.WARNING)
+
+        # Can't go below what the handlers write
+        log_utils.set_verbosity(logging.WARNING)
+        log_utils.set_logger_level("discord.gateway", logging.DEBUG)
+        self.assertEqual(log_utils.get_handlers_level(), log_utils.EXEC_INFO)
+        self.assertEqual(log_utils.get_levels()["discord.gateway"], log_utils.EXEC_INFO)
+        self.assertFalse(discord_logger.isEnabledFor(logging.INFO))
+
+        log_utils.set_logger_level("discord.gateway", None)
+        self.assertNotIn("discord.gateway", log_utils.get_levels())
+        self.assertEqual(gateway_logger.level, logging.NOTSET)
+
+    def test_parse_level(self) -> None:
+        self.assertEqual(log_utils.parse_level("debug"), logging.DEBUG)
+        self.assertEqual(log_utils.parse_level("EXECUTION"), log_utils.EXEC_INFO)
+        self.assertEqual(log_utils.parse_level("15"), 15)
+        with self.assertRaises(ValueError):
+            log_utils.parse_level("verbose")
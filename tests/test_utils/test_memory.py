@@ -0,0 +1,145 @@
+"""
+Modules with tests for the memory estimation
+"""
+
+import asyncio
+import sys
+import tracemalloc
+import unittest
+from collections import deque
+from types import SimpleNamespace
+
+
+from BoopliBot.helpers import (
+    NestedDictWrapper,
+    MessageStore,
+    CompactMessage
+)
+from BoopliBot.utils import memory_utils
+
+
+class FakeModel():
+    """
+    Quacks like a discord model
+    """
+    __module__ = "discord.fake"
+
+    def __init__(self, id: int, guild: "FakeModel" = None) -> None:
+        self.id = id
+        self.name = f"model {id}" * 10
+        self.guild = guild
+
+
+def _get_fake_bot() -> SimpleNamespace:
+    """
+    Returns an object that quacks like Bot for measure_bot
+    """
+    guild = FakeModel(0)
+    users = {i: FakeModel(i) for i in range(1, 50)}
+    guild._members = {i: FakeModel(i, guild) for i in range(1, 50)}
+    guild._channels = {100: FakeModel(100, guild)}
+
+    message_store = MessageStore(64 * 1024)
+    for i in range(20):
+        message_store.add(0, CompactMessage(i, 100, 1, "message " * 10))
+
+    return SimpleNamespace(
+        _connection=SimpleNamespace(_users=users, _messages=deque(maxlen=10)),
+        guilds=[guild],
+        guilds_configs=NestedDictWrapper({0: {"prefix": "!"}}, nesting_depth=1),
+        custom_commands=NestedDictWrapper(nesting_depth=1),
+        message_store=message_store,
+        author_index=[],
+        get_cog=lambda name: None
+    )
+
+
+class EstimateSizeTest(unittest.TestCase):
+    """
+    Test case for memory_utils.estimate_size
+    """
+    def test_exact_and_sampled(self) -> None:
+        data = {i: f"value {i}" * 5 for i in range(2000)}
+        exact = sys.getsizeof(data) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in data.items())
+        self.assertEqual(memory_utils.estimate_size(data, sample_size=10000), exact)
+
+        estimated = memory_utils.estimate_size(data, sample_size=200)
+        self.assertAlmostEqual(estimated / exact, 1.0, delta=0.1)
+
+    def test_slots_and_shared(self) -> None:
+        wrapper = NestedDictWrapper({"key": "x" * 1000})
+        # The mangled slots are followed
+        self.assertGreater(memory_utils.estimate_size(wrapper), 1000)
+
+        # Functions and types are shared
+        self.assertEqual(memory_utils.estimate_size([len, int]), sys.getsizeof([len, int]))
+
+        # Models are counted as entries but not through references
+        guild = FakeModel(0)
+        guild.name = "x" * 10000
+        members = {1: FakeModel(1, guild)}
+        with_guild = memory_utils.estimate_size([members], entry_depth=2)
+        self.assertLess(with_guild, 10000)
+        self.assertEqual(memory_utils.estimate_size([members], entry_depth=1), memory_utils.estimate_size([{1: len}]))
+
+
+class MemoryTrackerTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for memory_utils.MemoryTracker
+    """
+    async def test_measure(self) -> None:
+        tracker = memory_utils.MemoryTracker()
+        bot = _get_fake_bot()
+
+        results = await tracker.measure(bot)
+        sizes = {size.name: size for size, previous in results}
+        self.assertTrue(all(previous is None for size, previous in results))
+        self.assertEqual(sizes["discord_users"].count, 49)
+        self.assertEqual(sizes["discord_members"].count, 49)
+        self.assertEqual(sizes["message_store"].count, 20)
+        self.assertGreater(sizes["discord_members"].nbytes, 49 * sys.getsizeof("model 1" * 10))
+        self.assertGreater(sizes["message_store"].nbytes, 20 * 80)
+
+        bot.message_store.clear()
+        results = await tracker.measure(bot)
+        size, previous = next(item for item in results if item[0].name == "message_store")
+        self.assertLess(size.nbytes, previous.nbytes)
+
+        table = memory_utils.format_structure_sizes(results)
+        lines = table.splitlines()
+        self.assertTrue(lines[0].startswith("Structure"))
+        self.assertTrue(lines[-1].startswith("Total"))
+        self.assertIn("-", next(line for line in lines if line.startswith("message_store")).split()[-2])
+
+    async def test_snapshot(self) -> None:
+        tracker = memory_utils.MemoryTracker()
+        was_tracing = tracemalloc.is_tracing()
+        tracker.start_tracing()
+        try:
+            top, diff = await tracker.take_snapshot(5)
+            self.assertIsNone(diff)
+            self.assertLessEqual(len(top), 5)
+
+            leak = [bytearray(1024) for i in range(1000)]
+            # The loop keeps running while the snapshot is processed
+            ticker = asyncio.create_task(asyncio.sleep(0))
+            top, diff = await tracker.take_snapshot(5)
+            self.assertTrue(ticker.done())
+            self.assertTrue(any(stat.traceback[0].filename == __file__ and stat.size_diff >= 1024 * 1000 for stat in diff))
+
+            text = memory_utils.format_snapshot(top, diff)
+            self.assertIn("Growth since the previous snapshot:", text)
+            self.assertIn("test_utils/test_memory.py:", text)
+            del leak
+
+        finally:
+            tracker.stop_tracing()
+
+        self.assertEqual(tracemalloc.is_tracing(), was_tracing)
+        self.assertIsNone(tracker.snapshot)
+
+    def test_fmt_size(self) -> None:
+        self.assertEqual(memory_utils.fmt_size(512), "512 B")
+        self.assertEqual(memory_utils.fmt_size(1536), "1.5 KiB")
+        self.assertEqual(memory_utils.fmt_size(-3 * 1024 ** 2), "-3.0 MiB")
+        self.assertEqual(memory_utils.fmt_size(2 * 1024 ** 3), "2.0 GiB")
@@ -0,0 +1,131 @@
+"""
+Modules with tests for the metrics endpoint
+"""
+
+import socket
+import logging
+import unittest
+from types import SimpleNamespace
+
+
+import aiohttp
+
+
+from BoopliBot.helpers import Histogram
+from BoopliBot.utils import (
+    metrics_utils,
+    stats_utils
+)
+
+
+def _get_fake_bot() -> SimpleNamespace:
+    """
+    Returns an object that quacks like Bot for render_metrics
+    """
+    event_stats = stats_utils.EventStats()
+    for i in range(3):
+        event_stats.add("message")
+    event_stats.add("member_join")
+
+    command_stats = stats_utils.CommandStats()
+    with command_stats.measure("ping"):
+        pass
+    command_stats.add_error("ping", ValueError())
+
+    loop_monitor = SimpleNamespace(histogram=Histogram())
+    loop_monitor.histogram.add(0.5)
+
+    return SimpleNamespace(
+        event_stats=event_stats,
+        command_stats=command_stats,
+        rate_limit_counter=stats_utils.RateLimitCounter(),
+        loop_monitor=loop_monitor,
+        latencies=[(0, 0.05), (1, float("inf"))],
+        guilds_configs={1: None, 2: None},
+        custom_commands={},
+        message_store=[],
+        author_index=[],
+        cached_messages=[],
+        guilds=[],
+        get_cog=lambda name: SimpleNamespace(get_queue_stats=lambda: (5, 1, 2))
+    )
+
+
+class MetricsTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for metrics_utils
+    """
+    def test_metrics_render(self) -> None:
+        text = metrics_utils.render_metrics(_get_fake_bot())
+        lines = text.splitlines()
+
+        self.assertIn('booplibot_events_total{event="message"} 3', lines)
+        self.assertIn('booplibot_events_total{event="member_join"} 1', lines)
+        self.assertIn('booplibot_shard_latency_seconds{shard="0"} 0.05', lines)
+        # Shards without latency are skipped
+        self.assertNotIn('shard="1"', text)
+        self.assertIn('booplibot_command_latency_seconds_count{command="ping"} 1', lines)
+        self.assertIn('booplibot_command_latency_seconds_bucket{command="ping",le="+Inf"} 1', lines)
+        self.assertIn('booplibot_command_errors_total{command="ping",error="ValueError"} 1', lines)
+        self.assertIn('booplibot_loop_lag_seconds_count 1', lines)
+        self.assertIn('booplibot_cache_entries{cache="guilds_configs"} 2', lines)
+        self.assertIn('booplibot_log_events_pending 5', lines)
+        self.assertIn('booplibot_ratelimit_hits_total 0', lines)
+
+        # Every sample belongs to a declared metric
+        declared = {line.split()[2] for line in lines if line.startswith("# TYPE")}
+        for line in lines:
+            if not line.startswith("#"):
+                name = line.split("{")[0].split()[0]
+                self.assertTrue(
+                    name in declared or name.rpartition("_")[0] in declared,
+                    msg=line
+                )
+
+    def test_metrics_labels(self) -> None:
+        self.assertEqual(metrics_utils._fmt_labels((("a", 'x"y\\z\n'),)), '{a="x\\"y\\\\z\\n"}')
+        self.assertEqual(metrics_utils._fmt_labels(()), "")
+
+    def test_metrics_rate_limits(self) -> None:
+        counter = stats_utils.RateLimitCounter()
+        http_logger = logging.getLogger("discord.http.test")
+        http_logger.addFilter(counter)
+        try:
+            with self.assertLogs(http_logger, "DEBUG"):
+                http_logger.warning(
+                    "We are being rate limited. %s %s responded with 429. Retrying in %.2f seconds.",
+                    "PUT",
+                    "/bans",
+                    1.5
+                )
+                http_logger.warning("Global rate limit has been hit. Retrying in %.2f seconds.", 2.0)
+                http_logger.debug("Some other record")
+
+        finally:
+            http_logger.removeFilter(counter)
+
+        self.assertEqual(counter.hits, 1)
+        self.assertEqual(counter.global_hits, 1)
+        self.assertEqual(counter.wait_time, 1.5)
+
+    async def test_metrics_server(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        server = metrics_utils.MetricsServer(_get_fake_bot(), port)
+        await server.start()
+        await server.start()
+        self.assertTrue(server.is_running())
+        try:
+            async with aiohttp.ClientSession() as sesh:
+                async with sesh.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    self.assertEqual(response.status, 200)
+                    self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                    text = await response.text()
+
+        finally:
+            await server.stop()
+
+        self.assertIn("booplibot_events_total", text)
+        self.assertFalse(server.is_running())
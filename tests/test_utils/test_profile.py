@@ -0,0 +1,66 @@
+"""
+Modules with tests for the stack sampler
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+
+from BoopliBot.utils import profile_utils
+
+
+def _busy_loop(duration: float) -> None:
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        pass
+
+
+class StackSamplerTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for profile_utils.StackSampler
+    """
+    async def test_sample_loop_thread(self) -> None:
+        sampler = profile_utils.StackSampler(interval=0.002)
+        sampler.start()
+        self.assertTrue(sampler.is_running())
+        _busy_loop(0.2)
+        await asyncio.sleep(0.05)
+        sampler.stop()
+        self.assertFalse(sampler.is_running())
+
+        self.assertGreater(sampler.sample_count, 10)
+        self.assertEqual(sum(sampler.stacks.values()), sampler.sample_count)
+        self.assertGreaterEqual(sampler.elapsed, 0.25)
+
+        busy = sum(count for stack, count in sampler.stacks.items() if "_busy_loop (" in stack)
+        self.assertGreater(busy, sampler.sample_count // 2)
+
+        lines = sampler.to_collapsed().splitlines()
+        self.assertEqual(len(lines), len(sampler.stacks))
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            if "_busy_loop (" in stack:
+                self.assertIn("(tests/test_utils/test_profile.py:", stack)
+                # Root frame first
+                self.assertLess(stack.find("test_sample_loop_thread"), stack.find("_busy_loop"))
+
+        sampler.clear()
+        self.assertEqual(sampler.to_collapsed(), "")
+
+    async def test_sample_all_threads(self) -> None:
+        stop_event = threading.Event()
+        thread = threading.Thread(target=stop_event.wait, name="Idle Worker", daemon=True)
+        thread.start()
+        try:
+            sampler = await profile_utils.sample_stacks(0.05, interval=0.005, all_threads=True)
+
+        finally:
+            stop_event.set()
+            thread.join()
+
+        self.assertTrue(any(stack.startswith("Idle_Worker;") for stack in sampler.stacks))
+        self.assertFalse(any(stack.startswith("StackSampler;") for stack in sampler.stacks))
+        self.assertFalse(sampler.is_running())
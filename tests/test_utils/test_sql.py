@@ -2,6 +2,7 @@
 Modules with tests for the sql system
 """
 
+import os
 import unittest
 from unittest.mock import patch
 from typing import (
@@ -13,6 +14,7 @@ from BoopliBot.utils import sql_utils
 
 
 patchers: List[unittest.mock._patch] = list()
+TESTS_FOLDER = os.path.dirname(os.path.dirname(os.path.realpath(os.path.abspath(__file__)))) + os.sep
 
 def setUpModule() -> None:
     # Setup in-memory sqlite3 db
@@ -222,3 +224,215 @@ class SQLTest(unittest.TestCase):
             test_user = sesh.get(sql_utils.User, (self.TEST_GUILD_ID, self.TEST_USER_ID))
 
             self.assertIsNone(test_user)
+
+    def test_sql_add_missing_columns(self) -> None:
+        # Recreate the table in its old shape
+        with sql_utils.engine.begin() as conn:
+            conn.execute(sql_utils.sqlalchemy.text("DROP TABLE guild_config"))
+            conn.execute(
+                sql_utils.sqlalchemy.text(
+                    "CREATE TABLE guild_config (guild_id INTEGER NOT NULL PRIMARY KEY, prefix VARCHAR NOT NULL)"
+                )
+            )
+            conn.execute(
+                sql_utils.sqlalchemy.text(f"INSERT INTO guild_config VALUES ({self.TEST_GUILD_ID}, '{self.TEST_PREFIX}')")
+            )
+
+        sql_utils._add_missing_columns(sql_utils.engine)
+
+        columns = {col["name"]: col for col in sql_utils.sqlalchemy.inspect(sql_utils.engine).get_columns("guild_config")}
+        self.assertEqual(set(columns), {col.name for col in sql_utils.guild_configs_table.columns})
+        # Added columns keep the nullability of the model
+        for column in sql_utils.guild_configs_table.columns:
+            if column.name not in ("guild_id", "prefix"):
+                self.assertEqual(columns[column.name]["nullable"], column.nullable, column.name)
+
+        with sql_utils.NewSession() as sesh:
+            test_guild = sesh.get(sql_utils.GuildConfig, self.TEST_GUILD_ID)
+            self.assertEqual(test_guild.prefix, self.TEST_PREFIX)
+            self.assertFalse(test_guild.enable_cc)
+            self.assertIsNone(test_guild.log_messages_channel)
+
+    def test_sql_add_missing_columns_nullable(self) -> None:
+        sqlalchemy = sql_utils.sqlalchemy
+        metadata = sqlalchemy.MetaData()
+        sqlalchemy.Table(
+            "test_table",
+            metadata,
+            sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+            sqlalchemy.Column("nullable_default", sqlalchemy.Integer, server_default="1"),
+            sqlalchemy.Column("not_nullable_default", sqlalchemy.Integer, nullable=False, server_default="2")
+        )
+        with sql_utils.engine.begin() as conn:
+            conn.execute(sqlalchemy.text("CREATE TABLE test_table (id INTEGER NOT NULL PRIMARY KEY)"))
+            conn.execute(sqlalchemy.text("INSERT INTO test_table VALUES (1)"))
+
+        try:
+            with patch("BoopliBot.utils.sql_utils.metadata", metadata):
+                sql_utils._add_missing_columns(sql_utils.engine)
+
+            columns = {col["name"]: col for col in sqlalchemy.inspect(sql_utils.engine).get_columns("test_table")}
+            self.assertTrue(columns["nullable_default"]["nullable"])
+            self.assertFalse(columns["not_nullable_default"]["nullable"])
+
+            with sql_utils.engine.begin() as conn:
+                self.assertEqual(conn.execute(sqlalchemy.text("SELECT * FROM test_table")).one(), (1, 1, 2))
+                # NULLs are still allowed in nullable columns
+                conn.execute(sqlalchemy.text("INSERT INTO test_table VALUES (2, NULL, 2)"))
+
+        finally:
+            with sql_utils.engine.begin() as conn:
+                conn.execute(sqlalchemy.text("DROP TABLE test_table"))
+
+    def test_sql_increment_user_counter(self) -> None:
+        # One existing user and more new ones than fit into one statement
+        user_ids = [self.TEST_USER_ID] + [self.TEST_USER_ID + i for i in range(1, sql_utils.MAX_ROWS_PER_INSERT + 5)]
+        stmts = sql_utils.get_increment_user_counter_stmts(self.TEST_GUILD_ID, user_ids, "total_bans")
+        self.assertEqual(len(stmts), 2)
+
+        with sql_utils.NewSession() as sesh:
+            for _ in range(2):
+                for stmt in sql_utils.get_increment_user_counter_stmts(self.TEST_GUILD_ID, user_ids, "total_bans"):
+                    sesh.execute(stmt)
+            sesh.commit()
+
+            stmt = (
+                sql_utils.select(sql_utils.User)
+                .where(sql_utils.User.guild_id == self.TEST_GUILD_ID)
+            )
+            users = sesh.execute(stmt).scalars().all()
+            self.assertEqual(len(users), len(user_ids))
+            for user in users:
+                self.assertEqual(user.total_bans, 2)
+                self.assertEqual(user.total_kicks, 0)
+
+    def test_sql_warn_unwarn_stmts(self) -> None:
+        new_user_id = self.TEST_USER_ID + 1
+        with sql_utils.NewSession() as sesh:
+            # Existing and new user
+            for user_id in (self.TEST_USER_ID, new_user_id):
+                for i in range(1, 3):
+                    warnings = sesh.execute(sql_utils.get_warn_user_stmt(self.TEST_GUILD_ID, user_id)).scalar_one()
+                    self.assertEqual(warnings, i)
+
+            warnings = sesh.execute(sql_utils.get_unwarn_user_stmt(self.TEST_GUILD_ID, new_user_id)).scalar_one_or_none()
+            self.assertEqual(warnings, 1)
+            warnings = sesh.execute(sql_utils.get_unwarn_user_stmt(self.TEST_GUILD_ID, new_user_id)).scalar_one_or_none()
+            self.assertEqual(warnings, 0)
+            # Can't go below 0 or touch missing users
+            warnings = sesh.execute(sql_utils.get_unwarn_user_stmt(self.TEST_GUILD_ID, new_user_id)).scalar_one_or_none()
+            self.assertIsNone(warnings)
+            warnings = sesh.execute(sql_utils.get_unwarn_user_stmt(self.TEST_GUILD_ID, new_user_id + 1)).scalar_one_or_none()
+            self.assertIsNone(warnings)
+            sesh.commit()
+
+            user = sesh.get(sql_utils.User, (self.TEST_GUILD_ID, new_user_id))
+            self.assertEqual(user.current_warns, 0)
+            self.assertEqual(user.total_warns, 2)
+            self.assertIsNone(sesh.get(sql_utils.User, (self.TEST_GUILD_ID, new_user_id + 1)))
+
+    def test_sql_query_profiler_normalize(self) -> None:
+        profiler = sql_utils.QueryProfiler()
+        self.assertEqual(
+            profiler.normalize("SELECT *\n  FROM user WHERE user_id IN (?, ?, ?)"),
+            "SELECT * FROM user WHERE user_id IN (?, ...)"
+        )
+        self.assertEqual(
+            profiler.normalize("INSERT INTO user (a, b, c) VALUES (?, ?, ?), (?, ?, ?), (?, ?, ?)"),
+            "INSERT INTO user (a, b, c) VALUES (?, ...), ..."
+        )
+        # Differently sized batches group together
+        self.assertEqual(
+            profiler.normalize("INSERT INTO user (a, b) VALUES (?, ?), (?, ?)"),
+            profiler.normalize("INSERT INTO user (a, b) VALUES (?, ?), (?, ?), (?, ?), (?, ?)")
+        )
+
+    def test_sql_query_profiling(self) -> None:
+        events = sql_utils.sqlalchemy.event
+        self.assertIsNone(sql_utils.query_profiler)
+        # Nothing is attached when it's off
+        self.assertFalse(events.contains(sql_utils.engine, "after_cursor_execute", sql_utils._profile_after_cursor_execute))
+
+        profiler = sql_utils.enable_query_profiling(slowest_amount=3)
+        self.assertIs(sql_utils.enable_query_profiling(), profiler)
+        try:
+            with patch.object(sql_utils, "_PACKAGE_DIR", TESTS_FOLDER):
+                with sql_utils.NewSession() as sesh:
+                    for i in range(1, 6):
+                        user_ids = range(i * 10)
+                        for stmt in sql_utils.get_increment_user_counter_stmts(self.TEST_GUILD_ID, user_ids, "total_bans"):
+                            sesh.execute(stmt)
+                        sesh.get(sql_utils.User, (self.TEST_GUILD_ID + i, self.TEST_USER_ID))
+                    sesh.commit()
+
+            top = profiler.get_top(10)
+            statements = {statement for statement, site, stats in top}
+            inserts = [stats for statement, site, stats in top if statement.startswith("INSERT")]
+            # All batch sizes went into one entry
+            self.assertEqual(len(inserts), 1)
+            self.assertEqual(inserts[0].count, 5)
+            self.assertEqual(len(statements), 2)
+            for statement, site, stats in top:
+                self.assertTrue(site.startswith("test_utils/test_sql.py:"), msg=site)
+                self.assertIn("test_sql_query_profiling", site)
+
+            slowest = profiler.get_slowest()
+            self.assertEqual(len(slowest), 3)
+            self.assertEqual(slowest, sorted(slowest, key=lambda query: query.elapsed, reverse=True))
+
+        finally:
+            sql_utils.disable_query_profiling()
+
+        self.assertIsNone(sql_utils.query_profiler)
+        self.assertFalse(events.contains(sql_utils.engine, "after_cursor_execute", sql_utils._profile_after_cursor_execute))
+
+class AsyncSQLTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for the async helpers of config_utils.sql_utils
+    """
+    TEST_GUILD_ID = 626871007185207297
+    TEST_USER_ID = 647602717296164864
+
+    async def asyncSetUp(self) -> None:
+        sql_utils.init(should_log=False)
+        async with sql_utils.async_engine.begin() as conn:
+            await conn.run_sync(sql_utils.metadata.create_all)
+
+        self.statements: List[str] = list()
+        sql_utils.sqlalchemy.event.listen(sql_utils.async_engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    async def asyncTearDown(self) -> None:
+        sql_utils.sqlalchemy.event.remove(sql_utils.async_engine.sync_engine, "before_cursor_execute", self._on_execute)
+        await sql_utils.async_engine.dispose()
+        sql_utils.deinit(should_log=False)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+    async def test_sql_warn_round_trips(self) -> None:
+        for i in range(1, 4):
+            self.statements.clear()
+            warnings = await sql_utils.warn_user(self.TEST_GUILD_ID, self.TEST_USER_ID)
+            self.assertEqual(warnings, i)
+            # One round trip per warn
+            self.assertEqual(len(self.statements), 1)
+
+        self.statements.clear()
+        warnings = await sql_utils.unwarn_user(self.TEST_GUILD_ID, self.TEST_USER_ID)
+        self.assertEqual(warnings, 2)
+        self.assertEqual(len(self.statements), 1)
+
+        self.statements.clear()
+        warnings = await sql_utils.unwarn_user(self.TEST_GUILD_ID, self.TEST_USER_ID + 1)
+        self.assertIsNone(warnings)
+        self.assertEqual(len(self.statements), 1)
+
+    async def test_sql_query_profiling_async(self) -> None:
+        profiler = sql_utils.enable_query_profiling()
+        with patch.object(sql_utils, "_PACKAGE_DIR", TESTS_FOLDER):
+            await sql_utils.warn_user(self.TEST_GUILD_ID, self.TEST_USER_ID)
+
+        sites = [site for statement, site, stats in profiler.get_top(10)]
+        # Found through the greenlet that awaits the query
+        self.assertEqual(len(sites), 1)
+        self.assertIn("test_sql_query_profiling_async", sites[0])
@@ -0,0 +1,175 @@
+"""
+Modules with tests for the stats system
+"""
+
+import asyncio
+import time
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+from BoopliBot.utils import stats_utils
+
+
+class CommandStatsTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for stats_utils.CommandStats
+    """
+    REST_LATENCY = 0.03
+
+    async def asyncSetUp(self) -> None:
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        stats_utils.attach_sql_hooks(self.engine.sync_engine)
+        self.stats = stats_utils.CommandStats()
+
+        async def request(route: str) -> str:
+            await asyncio.sleep(self.REST_LATENCY)
+            return route
+
+        self.request = stats_utils.wrap_http_request(request)
+
+    async def asyncTearDown(self) -> None:
+        stats_utils.detach_sql_hooks(self.engine.sync_engine)
+        await self.engine.dispose()
+
+    async def _query(self, amount: int) -> None:
+        async with self.engine.connect() as conn:
+            for i in range(amount):
+                await conn.exec_driver_sql("SELECT 1")
+
+    async def test_stats_split(self) -> None:
+        with self.stats.measure("ping"):
+            self.assertEqual(await self.request("typing"), "typing")
+            await self._query(5)
+            # Local work
+            time.sleep(0.01)
+
+        entry = self.stats.get("ping")
+        self.assertEqual(entry.total.count, 1)
+        self.assertGreaterEqual(entry.rest.sum, self.REST_LATENCY * 1000)
+        self.assertGreater(entry.db.sum, 0)
+        self.assertGreaterEqual(entry.local.sum, 10)
+        self.assertAlmostEqual(entry.total.sum, entry.db.sum + entry.rest.sum + entry.local.sum, places=3)
+
+    async def test_stats_outside_commands(self) -> None:
+        # Nothing is attributed outside of commands and concurrent tasks don't leak into each other
+        await self.request("typing")
+        await self._query(1)
+        self.assertEqual(len(self.stats), 0)
+
+        async def command(name: str, rest: bool) -> None:
+            with self.stats.measure(name):
+                if rest:
+                    await self.request("messages")
+
+                else:
+                    await asyncio.sleep(self.REST_LATENCY)
+
+        await asyncio.gather(command("kick", True), command("ban", False))
+        self.assertGreaterEqual(self.stats.get("kick").rest.sum, self.REST_LATENCY * 1000)
+        self.assertEqual(self.stats.get("ban").rest.sum, 0)
+
+    async def test_stats_errors_and_slowest(self) -> None:
+        for i in range(3):
+            with self.stats.measure("fast"):
+                pass
+        with self.stats.measure("slow"):
+            await asyncio.sleep(0.02)
+
+        error = ValueError()
+        wrapped = type("CommandInvokeError", (Exception,), {"original": error})()
+        self.stats.add_error("fast", wrapped)
+        self.stats.add_error("fast", KeyError())
+        self.stats.add_error("fast", KeyError())
+
+        self.assertEqual(self.stats.get("fast").errors, {"ValueError": 1, "KeyError": 2})
+        slowest = self.stats.get_slowest(5)
+        self.assertEqual([name for name, entry in slowest], ["slow", "fast"])
+        self.assertEqual(len(self.stats.get_slowest(1)), 1)
+
+        table = stats_utils.format_command_entries(slowest)
+        lines = table.splitlines()
+        self.assertTrue(lines[0].startswith("Command"))
+        self.assertTrue(lines[1].startswith("slow"))
+        self.assertIn("fast: ValueError x1, KeyError x2", table)
+
+        self.stats.clear()
+        self.assertEqual(len(self.stats), 0)
+
+class EventStatsTest(unittest.IsolatedAsyncioTestCase):
+    """
+    Test case for stats_utils.EventStats
+    """
+    async def test_handler_busy_time(self) -> None:
+        stats = stats_utils.EventStats()
+
+        async def on_message(busy: float, wait: float) -> str:
+            time.sleep(busy)
+            await asyncio.sleep(wait)
+            return "done"
+
+        self.assertEqual(await stats.run_handler(on_message, "on_message", 0.02, 0.05), "done")
+        await stats.run_handler(on_message, "on_message", 0.0, 0.0)
+
+        handler = stats.handlers[("on_message", on_message.__qualname__)]
+        self.assertEqual(handler.calls, 2)
+        # Waiting isn't counted as busy time
+        self.assertGreaterEqual(handler.busy, 0.02)
+        self.assertLess(handler.busy, 0.05)
+        self.assertGreaterEqual(handler.wall, 0.07)
+        self.assertGreaterEqual(handler.max_busy, 0.02)
+
+    async def test_handler_errors_and_cancel(self) -> None:
+        stats = stats_utils.EventStats()
+
+        async def on_error() -> None:
+            await asyncio.sleep(0)
+            raise ValueError()
+
+        async def on_ready() -> None:
+            await asyncio.sleep(10)
+
+        with self.assertRaises(ValueError):
+            await stats.run_handler(on_error, "on_error")
+
+        task = asyncio.create_task(stats.run_handler(on_ready, "on_ready"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        totals = stats.get_event_totals()
+        self.assertEqual(totals["on_error"].calls, 1)
+        self.assertEqual(totals["on_ready"].calls, 1)
+
+    async def test_summary(self) -> None:
+        stats = stats_utils.EventStats()
+
+        async def on_message() -> None:
+            time.sleep(0.02)
+
+        async def on_typing() -> None:
+            time.sleep(0.005)
+
+        stats.add("message")
+        await stats.run_handler(on_message, "on_message")
+        await stats.run_handler(on_typing, "on_typing")
+
+        lines = stats.get_summary().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith("on_message:"))
+        self.assertIn("1 dispatched total", lines[1])
+        self.assertTrue(lines[2].startswith("on_typing:"))
+
+        # Only the time since the previous summary is reported
+        await stats.run_handler(on_typing, "on_typing")
+        lines = stats.get_summary().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith("on_typing:"))
+        self.assertIn("(100.0%)", lines[1])
+
+        self.assertEqual(stats.get_busiest(1)[0][0], ("on_message", on_message.__qualname__))
+        stats.clear()
+        self.assertEqual(stats.get_busiest(5), [])
+        self.assertEqual(stats.counts, {"message": 1})